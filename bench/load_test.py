@@ -0,0 +1,193 @@
+"""
+Load-test scripts/serve_api.py and report latency percentiles.
+
+Opens --concurrency keep-alive connections to a running service and sends
+--requests GETs in total, drawn at random from a workload built from the
+service itself: /summary, /customers/<id> for customer ids taken from the
+first /segments pages, /segments with random filter / page combinations
+and /transitions between random month pairs. --distinct bounds the number
+of different URLs, so the share of cache hits can be steered (a small
+--distinct is mostly cache hits, a large one mostly SQLite).
+
+Prints throughput and p50 / p90 / p99 / max latency per endpoint and
+overall; --out also writes them as JSON. Exits with status 1 when any
+request failed.
+
+Usage:
+    python scripts/serve_api.py &
+    python bench/load_test.py
+    python bench/load_test.py --concurrency 32 --requests 20000 --distinct 5000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+DEFAULT_CONCURRENCY = 16
+DEFAULT_REQUESTS = 5000
+DEFAULT_DISTINCT = 500
+SEED = 42
+
+SEGMENT_CHOICES = {
+    "activity": ["Active", "Not Active"],
+    "tier":     ["Diamond", "Platinum", "Gold", "Silver", "Bronze", "Passive"],
+    "event":    ["New", "Reactivated", "Lost"],
+}
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\n\r\n".encode("latin-1"))
+        await self.writer.drain()
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ")[1])
+        headers = {k.strip().lower(): v.strip() for k, _, v in (ln.partition(":") for ln in lines[1:] if ln)}
+        body = await self.reader.readexactly(int(headers["content-length"]))
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, body
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+def latency_stats(latencies):
+    xs = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3)
+    return {"n": len(xs), "p50_ms": ms(percentile(xs, 50)), "p90_ms": ms(percentile(xs, 90)),
+            "p99_ms": ms(percentile(xs, 99)), "max_ms": ms(xs[-1])}
+
+
+async def build_workload(client, distinct, rng):
+    """Up to `distinct` (endpoint, path) pairs drawn from what the service holds."""
+    status, body = await client.get("/months")
+    if status != 200:
+        sys.exit(f"ERROR: /months returned {status}: {body.decode()}")
+    months = json.loads(body)["months"]
+    ids = []
+    for page in range(4):
+        _, body = await client.get(f"/segments?{urlencode({'page': page, 'page_size': 250})}")
+        ids += [c["customer_id"] for c in json.loads(body)["customers"]]
+
+    def segments():
+        params = {"month": rng.choice(months), "page": rng.randrange(20)}
+        for name, values in SEGMENT_CHOICES.items():
+            if rng.random() < 0.5:
+                params[name] = ",".join(rng.sample(values, rng.randint(1, 2)))
+        return f"/segments?{urlencode(params)}"
+
+    makers = [
+        ("summary",     lambda: f"/summary?{urlencode({'month': rng.choice(months)})}"),
+        ("customers",   lambda: f"/customers/{rng.choice(ids)}?{urlencode({'month': rng.choice(months)})}"),
+        ("segments",    segments),
+        ("transitions", lambda: f"/transitions?{urlencode(dict(zip(('from', 'to'), sorted(rng.choices(months, k=2)))))}"),
+    ]
+    workload = {}
+    for _ in range(distinct * 20):
+        if len(workload) >= distinct:
+            break
+        name, make = rng.choice(makers)
+        workload.setdefault(make(), name)
+    return [(name, path) for path, name in workload.items()]
+
+
+async def run(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    rng = random.Random(args.seed)
+
+    probe = Client(host, port)
+    workload = await build_workload(probe, args.distinct, rng)
+    await probe.close()
+    plan = [rng.choice(workload) for _ in range(args.requests)]
+
+    latencies, errors = {}, []
+    next_ix = 0
+
+    async def worker():
+        nonlocal next_ix
+        client = Client(host, port)
+        try:
+            while next_ix < len(plan):
+                name, path = plan[next_ix]
+                next_ix += 1
+                t0 = time.perf_counter()
+                status, body = await client.get(path)
+                latencies.setdefault(name, []).append(time.perf_counter() - t0)
+                if status != 200:
+                    errors.append((path, status, body[:200].decode("utf-8", "replace")))
+        finally:
+            await client.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - t0
+
+    result = {
+        "url": args.url, "concurrency": args.concurrency, "requests": args.requests,
+        "distinct_urls": len(workload), "seconds": round(elapsed, 3),
+        "requests_per_s": round(args.requests / elapsed, 1), "errors": len(errors),
+        "overall": latency_stats([v for vs in latencies.values() for v in vs]),
+        "endpoints": {name: latency_stats(vs) for name, vs in sorted(latencies.items())},
+    }
+    return result, errors
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default=DEFAULT_URL, help=f"service base URL (default: {DEFAULT_URL})")
+    ap.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                    help=f"concurrent keep-alive connections (default: {DEFAULT_CONCURRENCY})")
+    ap.add_argument("--requests", type=int, default=DEFAULT_REQUESTS,
+                    help=f"total requests (default: {DEFAULT_REQUESTS})")
+    ap.add_argument("--distinct", type=int, default=DEFAULT_DISTINCT,
+                    help=f"distinct URLs in the workload (default: {DEFAULT_DISTINCT})")
+    ap.add_argument("--seed", type=int, default=SEED, help=f"workload seed (default: {SEED})")
+    ap.add_argument("--out", help="also write the results as JSON here")
+    args = ap.parse_args()
+
+    result, errors = asyncio.run(run(args))
+
+    print(f"{result['requests']:,} requests over {result['distinct_urls']:,} distinct URLs, "
+          f"{result['concurrency']} connections: {result['seconds']:.2f}s, "
+          f"{result['requests_per_s']:,.0f} req/s")
+    print(f"  {'endpoint':<13}{'n':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, s in list(result["endpoints"].items()) + [("overall", result["overall"])]:
+        print(f"  {name:<13}{s['n']:>7,}{s['p50_ms']:>10.2f}{s['p90_ms']:>10.2f}"
+              f"{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, indent=2) + "\n")
+    if errors:
+        print(f"\n{len(errors)} failed request(s), e.g.:")
+        for path, status, body in errors[:5]:
+            print(f"  {status} {path}  {body}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Benchmark the build pipeline on synthetic datasets of increasing size.
+
+For every case in --customers x --history-years x --months x --engine:
+  1. generate the CSVs with scripts/generate_data/generate.py into
+     bench/work/c<customers>-y<years>/ (reused while generate.py is
+     unchanged);
+  2. run db/build.py on them in a fresh child process, timing each phase
+     separately (build.PHASES: CSV load, index build, cube refresh,
+     snapshot calc -- or per-month calc, accumulator insert and index
+     rebuild with --engine per-month -- ANALYZE, Parquet export), then the
+     report export (scripts/build_report.write_data: data.json and the
+     per-month customer shards);
+  3. record the child's peak RSS.
+
+Results are written as JSON to --out. When the baseline file exists, every
+case is compared with the baseline case of the same key and the run exits
+with status 1 if any phase, the total or the peak RSS got more than
+--tolerance worse. Differences under MIN_DELTA_S seconds / MIN_DELTA_MIB
+MiB are treated as noise; --repeat N keeps the best of N runs per case to
+damp it further. Baselines are machine-specific: record one with
+--save-baseline on the machine that runs the comparison.
+
+Usage:
+    python bench/run_bench.py --customers 5000
+    python bench/run_bench.py --customers 5000,50000 --months 12,36 --save-baseline
+    python bench/run_bench.py --customers 5000,50000 --months 12,36 --repeat 3
+    python bench/run_bench.py --engine sql,per-month,numpy --history-years 3,5
+"""
+
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[1]
+GENERATOR = REPO / "scripts" / "generate_data" / "generate.py"
+WORK_DIR = REPO / "bench" / "work"
+DEFAULT_OUT = REPO / "bench" / "results.json"
+DEFAULT_BASELINE = REPO / "bench" / "baseline.json"
+
+DEFAULT_CUSTOMERS = "5000,50000,500000"
+DEFAULT_HISTORY_YEARS = "3"
+DEFAULT_MONTHS = "12"
+DEFAULT_ENGINES = "sql"
+DEFAULT_TOLERANCE = 0.25
+
+MIN_DELTA_S = 0.05
+MIN_DELTA_MIB = 16
+
+# db/build.py options selecting each engine.
+ENGINE_ARGS = {
+    "sql":       [],
+    "numpy":     ["--engine", "numpy"],
+    "per-month": ["--per-month"],
+}
+
+
+def int_list(text):
+    return [int(v) for v in text.split(",")]
+
+
+def case_key(customers, years, months, engine, index_strategy):
+    key = f"c{customers}-y{years}-m{months}-{engine}"
+    return key if index_strategy == "single" else f"{key}-{index_strategy}"
+
+
+def peak_rss_mib():
+    """Peak resident set size of this process and its reaped children
+    (the --jobs parse pool), in MiB, or None where the resource module does
+    not exist (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def generate(customers, years):
+    """Generate (or reuse) the CSVs for one dataset; returns (dir, seconds
+    spent generating, 0.0 when reused)."""
+    out_dir = WORK_DIR / f"c{customers}-y{years}"
+    stamp = out_dir / ".generator.sha256"
+    digest = hashlib.sha256(GENERATOR.read_bytes()).hexdigest()
+    if stamp.exists() and stamp.read_text() == digest:
+        return out_dir, 0.0
+
+    print(f"Generating {customers:,} customers x {years} years -> {out_dir}")
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, str(GENERATOR), "--customers", str(customers),
+                    "--history-years", str(years), "--out-dir", str(out_dir)],
+                   check=True, stdout=subprocess.DEVNULL)
+    stamp.write_text(digest)
+    return out_dir, time.perf_counter() - t0
+
+
+def run_case(spec):
+    """Child-process side of one case: build, export the report and measure."""
+    sys.path.insert(0, str(REPO / "db"))
+    sys.path.insert(0, str(REPO / "scripts"))
+    import build
+    import build_report
+
+    case_dir = Path(spec["case_dir"])
+    db_path = case_dir / "crm.db"
+    argv = ["--db", str(db_path), "--input-dir", spec["input_dir"],
+            "--months", str(spec["months"]), "--jobs", str(spec["jobs"]),
+            "--index-strategy", spec["index_strategy"]]
+    argv += ENGINE_ARGS[spec["engine"]]
+    if spec["parquet"]:
+        argv += ["--parquet", str(case_dir / "parquet")]
+
+    with redirect_stdout(io.StringIO()):
+        phases = build.main(argv)
+
+    con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    with build.timed(phases, "report_export"):
+        payload = build_report.write_data(con, case_dir)
+    shard_bytes = sum(f.stat().st_size for f in (case_dir / build_report.SHARD_DIR).iterdir())
+    rows = {
+        "transactions": con.execute("SELECT COUNT(*) FROM raw_sales_transactions").fetchone()[0],
+        "snapshot": con.execute("SELECT COUNT(*) FROM crm_customer_snapshot").fetchone()[0],
+    }
+    con.close()
+
+    peak = peak_rss_mib()
+    return {
+        "phases": {k: round(v, 4) for k, v in phases.items()},
+        "total_s": round(sum(phases.values()), 4),
+        "peak_rss_mib": None if peak is None else round(peak, 1),
+        "rows": rows,
+        "data_json_bytes": len(payload),
+        "shard_bytes": shard_bytes,
+    }
+
+
+def measure(input_dir, key, months, engine, args):
+    """Run one case in a fresh interpreter so peak RSS is per case."""
+    case_dir = WORK_DIR / "runs" / key
+    case_dir.mkdir(parents=True, exist_ok=True)
+    spec = {"case_dir": str(case_dir), "input_dir": str(input_dir), "months": months,
+            "engine": engine, "jobs": args.jobs, "parquet": args.parquet,
+            "index_strategy": args.index_strategy}
+    result_path = case_dir / "result.json"
+    subprocess.run([sys.executable, __file__, "--child", json.dumps(spec), str(result_path)],
+                   check=True)
+    return json.loads(result_path.read_text())
+
+
+def best_of(runs):
+    """Merge repeated runs of a case, keeping the minimum of every metric."""
+    best = dict(runs[0])
+    best["phases"] = {k: min(r["phases"][k] for r in runs) for k in runs[0]["phases"]}
+    best["total_s"] = min(r["total_s"] for r in runs)
+    best["peak_rss_mib"] = min((r["peak_rss_mib"] for r in runs if r["peak_rss_mib"] is not None),
+                               default=None)
+    return best
+
+
+def regressions(base, current, tolerance):
+    """Yield (metric, baseline, current) for every metric of one case that got
+    more than `tolerance` worse, ignoring differences below the noise floor."""
+    metrics = [(f"phases.{k}", v, current["phases"].get(k), MIN_DELTA_S)
+               for k, v in base["phases"].items()]
+    metrics.append(("total_s", base["total_s"], current["total_s"], MIN_DELTA_S))
+    metrics.append(("peak_rss_mib", base["peak_rss_mib"], current["peak_rss_mib"], MIN_DELTA_MIB))
+    for name, old, new, floor in metrics:
+        if old is None or new is None:
+            continue
+        if new > old * (1 + tolerance) and new - old > floor:
+            yield name, old, new
+
+
+def compare(baseline, results, tolerance):
+    """Print the comparison; returns the number of regressions."""
+    n_bad = 0
+    for key, current in results["cases"].items():
+        base = baseline["cases"].get(key)
+        if base is None:
+            print(f"  {key}: not in baseline")
+            continue
+        bad = list(regressions(base, current, tolerance))
+        if not bad:
+            print(f"  {key}: ok (total {base['total_s']:.2f}s -> {current['total_s']:.2f}s)")
+        for name, old, new in bad:
+            print(f"  {key}: REGRESSION {name} {old:.2f} -> {new:.2f} (x{new / old:.2f})")
+        n_bad += len(bad)
+    return n_bad
+
+
+def print_case(key, result):
+    print(f"\n{key}  ({result['rows']['transactions']:,} transactions, "
+          f"{result['rows']['snapshot']:,} snapshot rows)")
+    for name, secs in result["phases"].items():
+        print(f"  {name:<20}{secs:>9.2f}s")
+    print(f"  {'total':<20}{result['total_s']:>9.2f}s")
+    if result["peak_rss_mib"] is not None:
+        print(f"  {'peak RSS':<20}{result['peak_rss_mib']:>8.0f} MiB")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--customers", type=int_list, default=DEFAULT_CUSTOMERS,
+                    help=f"comma-separated customer counts (default: {DEFAULT_CUSTOMERS})")
+    ap.add_argument("--history-years", type=int_list, default=DEFAULT_HISTORY_YEARS,
+                    help=f"comma-separated years of generated history (default: {DEFAULT_HISTORY_YEARS})")
+    ap.add_argument("--months", type=int_list, default=DEFAULT_MONTHS,
+                    help=f"comma-separated report-month back-windows (default: {DEFAULT_MONTHS})")
+    ap.add_argument("--engine", type=lambda s: s.split(","), default=DEFAULT_ENGINES,
+                    help=f"comma-separated engines out of {', '.join(ENGINE_ARGS)} (default: {DEFAULT_ENGINES})")
+    ap.add_argument("--jobs", type=int, default=1, help="passed to db/build.py --jobs (default: 1)")
+    ap.add_argument("--index-strategy", default="single",
+                    help="passed to db/build.py --index-strategy; non-default values suffix the case key")
+    ap.add_argument("--parquet", action="store_true", help="also time the Parquet export (needs pyarrow)")
+    ap.add_argument("--repeat", type=int, default=1,
+                    help="runs per case; the best time of each phase is kept (default: 1)")
+    ap.add_argument("--out", default=str(DEFAULT_OUT), help=f"results JSON (default: {DEFAULT_OUT})")
+    ap.add_argument("--baseline", default=str(DEFAULT_BASELINE),
+                    help=f"baseline JSON compared against when it exists (default: {DEFAULT_BASELINE})")
+    ap.add_argument("--save-baseline", action="store_true",
+                    help="write the results to --baseline instead of comparing")
+    ap.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                    help=f"allowed relative slowdown before failing (default: {DEFAULT_TOLERANCE})")
+    ap.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.repeat < 1:
+        ap.error("--repeat must be at least 1")
+
+    if args.child:
+        spec, result_path = args.child
+        Path(result_path).write_text(json.dumps(run_case(json.loads(spec))))
+        return
+
+    unknown = set(args.engine) - set(ENGINE_ARGS)
+    if unknown:
+        ap.error(f"unknown engine(s): {', '.join(sorted(unknown))}")
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "cases": {},
+    }
+    for customers, years in itertools.product(args.customers, args.history_years):
+        input_dir, gen_s = generate(customers, years)
+        for months, engine in itertools.product(args.months, args.engine):
+            key = case_key(customers, years, months, engine, args.index_strategy)
+            result = best_of([measure(input_dir, key, months, engine, args)
+                              for _ in range(args.repeat)])
+            result.update(customers=customers, history_years=years, months=months, engine=engine,
+                          index_strategy=args.index_strategy)
+            if gen_s:
+                result["generate_s"] = round(gen_s, 2)
+            results["cases"][key] = result
+            print_case(key, result)
+
+    out = Path(args.baseline if args.save_baseline else args.out)
+    out.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"\nResults: {out}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline or not baseline_path.exists():
+        return
+    print(f"\nComparing against {baseline_path} (tolerance {args.tolerance:.0%}):")
+    n_bad = compare(json.loads(baseline_path.read_text()), results, args.tolerance)
+    if n_bad:
+        print(f"\n{n_bad} regression(s).")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
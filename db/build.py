@@ -3,24 +3,84 @@ Build the CRM SQLite database from scratch.
 
 Pipeline:
   1. Wipe and recreate the SQLite file from db/schema.sql.
-  2. Load CSVs from data/input/ into the raw_* tables.
-  3. Run db/run_crm_calculation.sql once per report month over the
-     requested back-window, accumulating the per-month snapshots into a
-     single permanent crm_customer_snapshot table.
+  2. Stream the CSVs from data/input/ into the raw_* tables in chunks, with
+     durability pragmas off and the ix_raw_sales_* indexes built after the
+     load; record each file in load_manifest, and bring the fact_customer_month consumption cube
+     up to date with db/refresh_fact_customer_month.sql.
+  3. Run db/run_crm_calculation.sql once with every report month of the
+     requested back-window in tt_params, producing the per-customer ×
+     per-month crm_customer_snapshot table in a single set-based pass.
+  4. Roll the new snapshot months up into crm_monthly_summary with
+     db/refresh_crm_monthly_summary.sql (per month under --per-month).
+
+With --per-month the calculation is instead run once per report month and
+the per-month snapshots are accumulated into crm_customer_snapshot. This is
+the original loop: every month rescans the sales table, so it is kept for
+parity checks only.
+
+With --engine numpy, stages 4-5 of the calculation (base aggregates and the
+final snapshot) are computed by the vectorized engine in db/crm_numpy.py;
+`python db/crm_numpy.py` checks it against the SQL engine.
+
+With --incremental an existing database is kept and brought up to date:
+  * sales CSVs are loaded only from the byte offset load_manifest says was
+    already loaded (a file whose loaded prefix changed aborts the build);
+    master CSVs are re-upserted only when their content changed;
+  * fact_customer_month is recomputed only for customers with new lines;
+  * the M-windows count purchases made after the report month too, so in
+    every month already in crm_customer_snapshot the rows of customers with
+    new sales lines (of everyone, when a master CSV changed) are deleted
+    and recomputed;
+  * report months missing from crm_customer_snapshot are computed for all
+    customers; both are written in place, keeping the ix_crm_snapshot_*
+    indexes, and the affected crm_monthly_summary months are rebuilt.
+Months appended to or rescored in a snapshot re-tiered by db/retier.py are
+scored with the thresholds it recorded in crm_tier_thresholds.
+
+With --skip-load the raw_* tables already in --db are kept and no CSV is
+read: `generate.py --engine numpy --format sqlite` writes them directly.
+Everything derived from them is rebuilt as in a full build.
 
 Usage:
     python db/build.py
     python db/build.py --db custom/path/crm.db --months 12 --latest 2024-12-31
+    python db/build.py --per-month
+    python db/build.py --incremental --latest 2025-01-31
+    python db/build.py --jobs 4
+    python db/build.py --engine numpy
+    python db/build.py --parquet data/parquet
+    python db/build.py --profile --index-strategy covering
+    python db/build.py --input-dir /tmp/crm-50k --db /tmp/crm-50k/crm.db
+    python db/build.py --skip-load --db /tmp/crm-500k/crm.db
+
+With --index-strategy covering the single-column ix_raw_sales_* indexes
+are replaced by the partial covering indexes of
+db/index_strategy_covering.sql; pass the same strategy to later
+--incremental builds.
+
+The SQL engine runs the calc script one numbered stage at a time and
+records each stage's time, output rows and EXPLAIN QUERY PLAN in the
+build_metrics table; --profile prints them after the build.
+
+main() returns the wall-clock seconds spent in each phase of the build
+(see PHASES); bench/run_bench.py records them.
 """
 
 import argparse
 import csv
 import glob
+import hashlib
+import io
 import re
 import sqlite3
 import time
 from calendar import monthrange
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import date
+from itertools import islice
+from operator import itemgetter
 from pathlib import Path
 
 REPO = Path(__file__).resolve().parent.parent
@@ -29,9 +89,101 @@ DEFAULT_DB = INPUT_DIR / "crm.db"
 DEFAULT_LATEST = "2024-12-31"
 DEFAULT_MONTHS = 12
 
-# Pattern that matches the parameterized report month in run_crm_calculation.sql:
-#   '2024-12-31'  AS report_mth_eom,
-REPORT_MONTH_PATTERN = re.compile(r"'(\d{4}-\d{2}-\d{2})'(\s+AS\s+report_mth_eom)")
+LOAD_CHUNK_ROWS = 50_000
+LOADER_CACHE_KIB = 512 * 1024
+PARSE_RANGE_BYTES = 8 << 20   # --jobs: bytes of CSV text per pool task
+
+# Phases timed by main(), in pipeline order. Which of them run depends on
+# the options: per_month_calc, accumulator_insert and index_rebuild replace
+# snapshot_calc under --per-month, index_build is skipped by --incremental,
+# csv_load by --skip-load and parquet_export needs --parquet.
+PHASES = (
+    "csv_load",
+    "index_build",
+    "cube_refresh",
+    "snapshot_calc",
+    "per_month_calc",
+    "accumulator_insert",
+    "index_rebuild",
+    "monthly_summary",
+    "analyze",
+    "parquet_export",
+)
+
+# Pattern that matches the parameterized report month(s) in run_crm_calculation.sql:
+#   VALUES ('2024-12-31')
+REPORT_MONTHS_PATTERN = re.compile(r"VALUES\s*\('\d{4}-\d{2}-\d{2}'\)")
+
+# Pattern that matches the txn_id watermark in refresh_fact_customer_month.sql:
+#   VALUES (0)
+AFTER_TXN_ID_PATTERN = re.compile(r"VALUES\s*\(\d+\)")
+
+# Pattern that matches the statement creating the final snapshot; --incremental
+# swaps it for an INSERT so new months are appended to the existing table.
+SNAPSHOT_CREATE_PATTERN = re.compile(
+    r"DROP TABLE IF EXISTS crm_customer_snapshot;\s*CREATE TABLE crm_customer_snapshot AS"
+)
+
+# Pattern that matches the customer-keyed sources of the calc script's stage 4
+# (base aggregates) and stage 5 (final snapshot); --incremental narrows them
+# to tt_rescore_customers when it recomputes months already in the snapshot:
+#   FROM fact_customer_month cm / CROSS JOIN raw_customers c
+RESCORE_SOURCE_PATTERN = re.compile(r"\b(fact_customer_month|raw_customers)(\s+)(cm|c)\b")
+
+# Pattern that matches the BEGIN / COMMIT wrapper of a maintenance script, for
+# running its body inside a caller's transaction.
+TXN_PATTERN = re.compile(r"^\s*(?:BEGIN|COMMIT)\s*;\s*$", re.M)
+
+# Pattern that matches a tier threshold literal in tt_params of
+# run_crm_calculation.sql:
+#    1000.0         AS t_high,        -- Diamond / Platinum AMC floor
+THRESHOLD_PATTERN = re.compile(r"^\s*(\d+(?:\.\d*)?)(\s+AS\s+)(\w+)", re.M)
+THRESHOLDS = ("t_high", "t_mid_high", "t_mid", "a_high", "f_high", "f_mid")
+
+# Patterns that match an index definition in schema.sql and an index dropped
+# by an index-strategy script:
+#   CREATE INDEX IF NOT EXISTS ix_raw_sales_invoice_id
+#       ON raw_sales_transactions(invoice_id);
+#   DROP INDEX IF EXISTS ix_raw_sales_invoice_id;
+CREATE_INDEX_PATTERN = re.compile(r"^CREATE INDEX IF NOT EXISTS (\w+)\s[^;]*;\n?", re.M)
+DROP_INDEX_PATTERN = re.compile(r"^DROP INDEX IF EXISTS (\w+);", re.M)
+
+# --index-strategy: script applied after schema.sql (None: schema.sql as is).
+INDEX_STRATEGIES = {
+    "single":   None,
+    "covering": "index_strategy_covering.sql",
+}
+
+# Pattern that matches the banner opening each numbered stage of the calc script:
+#   -- =============================================================
+#   -- 3. FIRST DEVICE PURCHASE DATE (per customer)
+STAGE_PATTERN = re.compile(r"^-- =+\n-- (\d+)\. ([^\n]*)\n", re.M)
+
+# Pattern that matches the table a calc statement writes:
+#   CREATE TEMP TABLE tt_dates AS / INSERT INTO crm_customer_snapshot
+TARGET_TABLE_PATTERN = re.compile(r"^(CREATE\s+(?:TEMP\s+)?TABLE|INSERT\s+INTO)\s+(\w+)", re.M)
+
+MASTER_FILES = [
+    ("raw_products", "products_master.csv",
+     ["product_id", "product_name", "brand", "category", "unit_size"]),
+    ("raw_customers", "customers_master.csv",
+     ["customer_id", "customer_name", "customer_group", "city", "created_date",
+      "email", "mobile_number", "opt_email", "opt_sms", "opt_phone"]),
+]
+SALES_GLOB = "sales_transactions_*.csv"
+SALES_COLUMNS = ["invoice_id", "customer_id", "invoice_date", "product_id",
+                 "quantity", "revenue", "store_id"]
+
+
+@contextmanager
+def timed(phases, name):
+    """Add the wall-clock time of the block to phases[name] (phases may be None)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - t0
 
 
 def last_day_of_month(year, month):
@@ -51,25 +203,517 @@ def report_month_eoms(latest, n):
     return list(reversed(months))
 
 
-def load_csv(con, table, csv_path, columns):
+def patch_report_months(calc_sql, months):
+    """Return the calc script with tt_params holding one row per month in `months`."""
+    values = "VALUES " + ", ".join(f"('{m.isoformat()}')" for m in months)
+    return REPORT_MONTHS_PATTERN.sub(lambda _: values, calc_sql, count=1)
+
+
+def sql_thresholds(calc_sql):
+    """The tier thresholds written in tt_params of the calc script, by name."""
+    return {name: float(v) for v, _, name in THRESHOLD_PATTERN.findall(calc_sql) if name in THRESHOLDS}
+
+
+def patch_thresholds(calc_sql, thresholds):
+    """Return the calc script with the tt_params tier thresholds replaced by
+    `thresholds` (name -> value)."""
+    def sub(m):
+        _, as_, name = m.groups()
+        if name not in thresholds:
+            return m.group(0)
+        return m.group(0)[:m.start(1) - m.start()] + f"{thresholds[name]!r}{as_}{name}"
+    return THRESHOLD_PATTERN.sub(sub, calc_sql)
+
+
+def applied_thresholds(con):
+    """The thresholds db/retier.py last applied to this database, or None
+    while the snapshot is scored with the calc script's own."""
+    row = con.execute(f"SELECT {', '.join(THRESHOLDS)} FROM crm_tier_thresholds").fetchone()
+    return dict(zip(THRESHOLDS, row)) if row else None
+
+
+def split_stages(calc_sql):
+    """Return [(number, title, sql), ...] for the numbered stages of the calc
+    script. Each stage runs on its own; the script's BEGIN / COMMIT wrapper
+    is dropped."""
+    marks = list(STAGE_PATTERN.finditer(calc_sql))
+    stages = []
+    for mark, nxt in zip(marks, marks[1:] + [None]):
+        sql = calc_sql[mark.start():nxt.start() if nxt else len(calc_sql)]
+        if nxt is None:
+            sql = re.sub(r"\bCOMMIT;\s*$", "", sql)
+        stages.append((int(mark.group(1)), mark.group(2).strip(), sql))
+    return stages
+
+
+def iter_statements(sql):
+    """Yield the complete statements of a SQL script in order, each with the
+    comments that precede it."""
+    buf = ""
+    for line in sql.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            yield buf
+            buf = ""
+
+
+def explain(con, stmt):
+    """EXPLAIN QUERY PLAN of one statement as indented text ("" for none)."""
+    depth, lines = {0: -1}, []
+    for node, parent, _, detail in con.execute("EXPLAIN QUERY PLAN " + stmt):
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + detail)
+    return "\n".join(lines)
+
+
+def next_run_id(con):
+    return con.execute("SELECT COALESCE(MAX(run_id), 0) + 1 FROM build_metrics").fetchone()[0]
+
+
+def run_calc(con, calc_sql, run_id, report_month=None):
+    """Run the (patched) calc script one stage at a time, recording in
+    build_metrics the wall-clock time of each stage, the rows of the table it
+    writes and the query plans of its statements. report_month labels a
+    single-month run; set-based runs leave it NULL."""
+    for no, title, sql in split_stages(calc_sql):
+        seconds, rows, plans = 0.0, None, []
+        for stmt in iter_statements(sql):
+            plan = explain(con, stmt)
+            if plan:
+                plans.append(plan)
+            t0 = time.perf_counter()
+            cur = con.execute(stmt)
+            seconds += time.perf_counter() - t0
+            target = TARGET_TABLE_PATTERN.search(stmt)
+            if target and target.group(1).startswith("INSERT"):
+                rows = cur.rowcount
+            elif target:
+                rows = con.execute(f"SELECT COUNT(*) FROM {target.group(2)}").fetchone()[0]
+        con.execute("INSERT INTO build_metrics VALUES (?, datetime('now'), ?, ?, ?, ?, ?, ?)",
+                    (run_id, report_month, no, title, seconds, rows, "\n\n".join(plans) or None))
+    con.commit()
+
+
+def print_profile(con, run_id):
+    """--profile: time, share and output rows per calc stage of one build,
+    then the query plan each stage last ran with."""
+    stages = con.execute("""
+        SELECT stage_no, stage_title, COUNT(*), SUM(seconds), SUM(rows_out)
+        FROM build_metrics WHERE run_id = ?
+        GROUP BY stage_no, stage_title ORDER BY stage_no
+    """, (run_id,)).fetchall()
+    total = sum(r[3] for r in stages)
+    print(f"\nCalculation profile (build_metrics.run_id = {run_id}):")
+    print(f"  {'stage':<50}{'runs':>5}{'seconds':>10}{'share':>8}{'rows':>12}")
+    for no, title, runs, secs, rows in stages:
+        share = secs / total if total else 0.0
+        print(f"  {f'{no}. {title}'[:49]:<50}{runs:>5}{secs:>10.3f}{share:>8.1%}{rows or 0:>12,}")
+    print(f"  {'total':<50}{'':>5}{total:>10.3f}")
+
+    for no, title, plan in con.execute("""
+        SELECT stage_no, stage_title, query_plan FROM build_metrics
+        WHERE rowid IN (SELECT MAX(rowid) FROM build_metrics WHERE run_id = ? GROUP BY stage_no)
+          AND query_plan IS NOT NULL
+        ORDER BY stage_no
+    """, (run_id,)):
+        print(f"\n  {no}. {title}")
+        for line in plan.splitlines():
+            print(f"     {line}")
+
+
+def patch_snapshot_append(calc_sql):
+    """Return the calc script inserting into the existing crm_customer_snapshot."""
+    return SNAPSHOT_CREATE_PATTERN.sub("INSERT INTO crm_customer_snapshot", calc_sql, count=1)
+
+
+def patch_customer_subset(calc_sql):
+    """Return the calc script scoring only the customers in tt_rescore_customers."""
+    return RESCORE_SOURCE_PATTERN.sub(
+        lambda m: (f"(SELECT * FROM {m.group(1)} WHERE customer_id IN "
+                   f"(SELECT customer_id FROM tt_rescore_customers)){m.group(2)}{m.group(3)}"),
+        calc_sql)
+
+
+def patch_index_strategy(schema_sql, strategy_sql):
+    """Return schema.sql followed by an index-strategy script, leaving out the
+    CREATE INDEX statements for the indexes the strategy drops, so re-running
+    the schema after a bulk load builds only the strategy's index set."""
+    dropped = set(DROP_INDEX_PATTERN.findall(strategy_sql))
+    schema_sql = CREATE_INDEX_PATTERN.sub(
+        lambda m: "" if m.group(1) in dropped else m.group(0), schema_sql)
+    return schema_sql + "\n" + strategy_sql
+
+
+def refresh_fact_customer_month(con, refresh_sql_template, after_txn_id):
+    """Recompute the cube for every customer with sales lines above after_txn_id."""
+    con.executescript(AFTER_TXN_ID_PATTERN.sub(f"VALUES ({after_txn_id})", refresh_sql_template, count=1))
+
+
+def file_digests(path, prefix_len):
+    """Return (sha256 of the first prefix_len bytes, sha256 of the whole file)."""
+    h = hashlib.sha256()
+    prefix = None
+    with open(path, "rb") as fh:
+        remaining = prefix_len
+        while remaining > 0:
+            chunk = fh.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            h.update(chunk)
+            remaining -= len(chunk)
+        prefix = h.hexdigest()
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return prefix, h.hexdigest()
+
+
+def set_loader_pragmas(con, wal=False):
+    """Trade durability for load speed. A full build can always be re-run, so
+    it writes with no rollback journal at all; an incremental build keeps the
+    existing database recoverable with WAL (reset by reset_journal_mode)."""
+    con.execute(f"PRAGMA journal_mode = {'WAL' if wal else 'OFF'}")
+    con.execute("PRAGMA synchronous = OFF")
+    con.execute(f"PRAGMA cache_size = -{LOADER_CACHE_KIB}")
+
+
+def reset_journal_mode(con):
+    # WAL is sticky in the file; build_report.py opens the db read-only,
+    # which needs the default rollback journal.
+    con.execute("PRAGMA journal_mode = DELETE")
+
+
+def drop_sales_indexes(con):
+    """Drop the ix_raw_sales_* indexes ahead of a bulk load. Re-running
+    schema.sql recreates them in one sorted pass per index."""
+    names = [r[0] for r in con.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' "
+        "AND tbl_name = 'raw_sales_transactions' AND name LIKE 'ix_raw_sales_%'")]
+    for name in names:
+        con.execute(f"DROP INDEX {name}")
+
+
+def insert_plan(table, columns, header, verb="INSERT"):
+    """Return (INSERT statement, positions in the CSV row to bind). Columns
+    missing from the header load as NULL, as do empty fields."""
+    present = [header[c] for c in columns if c in header]
+    values = ",".join("NULLIF(?, '')" if c in header else "NULL" for c in columns)
+    return f"{verb} INTO {table} ({','.join(columns)}) VALUES ({values})", present
+
+
+def row_picker(present):
+    return itemgetter(*present) if len(present) > 1 else (lambda r: (r[present[0]],))
+
+
+def report_rate(name, n, elapsed):
+    print(f"  {name:<30} {n:>11,} rows  {n / max(elapsed, 1e-9):>11,.0f} rows/s")
+
+
+def load_csv(con, table, csv_path, columns, start=0, verb="INSERT"):
+    """Stream the rows of csv_path into table, LOAD_CHUNK_ROWS at a time, in
+    the caller's transaction. With start > 0 (a row boundary past the
+    header), rows before that byte offset are skipped."""
+    t0 = time.time()
     with open(csv_path, newline="") as fh:
-        rdr = csv.DictReader(fh)
-        rows = []
-        for r in rdr:
-            row = []
-            for col in columns:
-                v = r.get(col, "")
-                row.append(None if v == "" else v)
-            rows.append(tuple(row))
-    placeholders = ",".join("?" * len(columns))
-    con.executemany(
-        f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})",
-        rows,
-    )
-    return len(rows)
-
-
-def main():
+        rdr = csv.reader(fh)
+        header = {name: i for i, name in enumerate(next(rdr))}
+        if start:
+            fh.seek(start)
+        sql, present = insert_plan(table, columns, header, verb)
+        rows = map(row_picker(present), rdr)
+        n = 0
+        while chunk := list(islice(rows, LOAD_CHUNK_ROWS)):
+            con.executemany(sql, chunk)
+            n += len(chunk)
+    report_rate(Path(csv_path).name, n, time.time() - t0)
+    return n
+
+
+def split_ranges(path, start, end, target=PARSE_RANGE_BYTES):
+    """Cut bytes [start, end) of path into line-aligned ranges of ~target bytes."""
+    cuts = [start]
+    with open(path, "rb") as fh:
+        pos = start + target
+        while pos < end:
+            fh.seek(pos)
+            fh.readline()
+            pos = fh.tell()
+            if pos >= end:
+                break
+            cuts.append(pos)
+            pos += target
+    cuts.append(end)
+    return list(zip(cuts, cuts[1:]))
+
+
+def parse_range(path, start, end, present):
+    """Pool worker: the CSV rows in bytes [start, end) of path, as bind tuples.
+    Ranges are cut at newlines, which assumes no quoted field spans a line --
+    true of every sales column (ids, ISO dates and numbers)."""
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        text = fh.read(end - start).decode("utf-8")
+    return list(map(row_picker(present), csv.reader(io.StringIO(text, newline=""))))
+
+
+def load_csvs_parallel(con, table, files, columns, jobs):
+    """Load [(path, start), ...] into table with CSV parsing spread over a
+    process pool. This connection is the single writer: parsed ranges are
+    inserted in file order while at most 2 * jobs further ranges are being
+    parsed or wait in the queue. Returns the row count per file."""
+    tasks = []
+    plans = []
+    for i, (path, start) in enumerate(files):
+        with open(path, "rb") as fh:
+            header_line = fh.readline()
+        header = {name: j for j, name in enumerate(next(csv.reader([header_line.decode("utf-8")])))}
+        sql, present = insert_plan(table, columns, header)
+        plans.append(sql)
+        ranges = split_ranges(path, max(start, len(header_line)), path.stat().st_size)
+        tasks.extend((i, a, b, present, k == len(ranges) - 1) for k, (a, b) in enumerate(ranges))
+
+    counts = [0] * len(files)
+    started = [None] * len(files)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        queue = deque()
+        todo = iter(tasks)
+
+        def submit_next():
+            task = next(todo, None)
+            if task is not None:
+                i, a, b, present, last = task
+                if started[i] is None:
+                    started[i] = time.time()
+                queue.append((i, last, pool.submit(parse_range, files[i][0], a, b, present)))
+
+        for _ in range(2 * jobs):
+            submit_next()
+        while queue:
+            i, last, fut = queue.popleft()
+            rows = fut.result()
+            submit_next()
+            con.executemany(plans[i], rows)
+            counts[i] += len(rows)
+            if last:
+                report_rate(files[i][0].name, counts[i], time.time() - started[i])
+    return counts
+
+
+def record_load(con, path, n_bytes, n_rows, digest):
+    con.execute("""
+        INSERT INTO load_manifest (file_name, bytes_loaded, rows_loaded, sha256, loaded_at)
+        VALUES (?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(file_name) DO UPDATE SET
+            bytes_loaded = excluded.bytes_loaded,
+            rows_loaded  = load_manifest.rows_loaded + excluded.rows_loaded,
+            sha256       = excluded.sha256,
+            loaded_at    = excluded.loaded_at
+    """, (path.name, n_bytes, n_rows, digest))
+
+
+def reset_derived(con):
+    """Empty what a build derives from the raw_* tables, so --skip-load
+    rebuilds it over whatever rows they hold; returns their row counts as
+    load_inputs() does."""
+    con.execute("DELETE FROM fact_customer_month")
+    con.execute("DELETE FROM crm_monthly_summary")
+    con.execute("DROP TABLE IF EXISTS crm_customer_snapshot")
+    con.execute("DELETE FROM crm_tier_thresholds")
+    return tuple(con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                 for table in ("raw_products", "raw_customers", "raw_sales_transactions"))
+
+
+def load_inputs(con, incremental, jobs=1, input_dir=INPUT_DIR):
+    """Load the master and sales CSVs from input_dir; returns (products,
+    customers, transactions) row counts. In incremental mode only content not
+    yet in load_manifest is loaded. With jobs > 1 the sales CSVs are parsed
+    in a process pool."""
+    input_dir = Path(input_dir)
+    manifest = {}
+    if incremental:
+        manifest = {r[0]: (r[1], r[2]) for r in con.execute(
+            "SELECT file_name, bytes_loaded, sha256 FROM load_manifest")}
+
+    counts = []
+    for table, name, columns in MASTER_FILES:
+        path = input_dir / name
+        size = path.stat().st_size
+        _, digest = file_digests(path, 0)
+        if manifest.get(name, (None, None))[1] == digest:
+            counts.append(0)
+            continue
+        # Masters are point-in-time snapshots: upsert the whole file.
+        n = load_csv(con, table, path, columns, verb="INSERT OR REPLACE")
+        con.execute("DELETE FROM load_manifest WHERE file_name = ?", (name,))
+        record_load(con, path, size, n, digest)
+        counts.append(n)
+
+    pending = []
+    for f in sorted(glob.glob(str(input_dir / SALES_GLOB))):
+        path = Path(f)
+        size = path.stat().st_size
+        loaded, loaded_digest = manifest.get(path.name, (0, None))
+        prefix, digest = file_digests(path, loaded)
+        if loaded and (size < loaded or prefix != loaded_digest):
+            raise SystemExit(f"ERROR: {path.name} changed below the {loaded:,} bytes already "
+                             f"loaded; run a full build instead of --incremental.")
+        if size > loaded:
+            pending.append((path, loaded, size, digest))
+
+    if jobs > 1 and pending:
+        sales_counts = load_csvs_parallel(con, "raw_sales_transactions",
+                                          [(path, loaded) for path, loaded, _, _ in pending],
+                                          SALES_COLUMNS, jobs)
+    else:
+        sales_counts = [load_csv(con, "raw_sales_transactions", path, SALES_COLUMNS, start=loaded)
+                        for path, loaded, _, _ in pending]
+    for (path, _, size, digest), n in zip(pending, sales_counts):
+        record_load(con, path, size, n, digest)
+    return counts[0], counts[1], sum(sales_counts)
+
+
+def build_snapshot_per_month(con, calc_sql_template, summary_sql, months, run_id, phases=None):
+    """Run the calc once per report month, accumulating into crm_customer_snapshot
+    and summarizing each month into crm_monthly_summary as it is computed. The
+    calc, accumulator insert, summary and index rebuild are timed into `phases`."""
+    # The calc script DROPs and recreates crm_customer_snapshot each time,
+    # so we capture rows into an accumulator and rename it at the end.
+    con.execute("DROP TABLE IF EXISTS crm_customer_snapshot_all")
+    accumulator_created = False
+
+    for m in months:
+        with timed(phases, "per_month_calc"):
+            run_calc(con, patch_report_months(calc_sql_template, [m]), run_id, m.isoformat())
+        with timed(phases, "monthly_summary"):
+            refresh_monthly_summary(con, summary_sql, rescored)
+        with timed(phases, "accumulator_insert"):
+            if not accumulator_created:
+                con.execute("CREATE TABLE crm_customer_snapshot_all "
+                            "AS SELECT * FROM crm_customer_snapshot WHERE 0")
+                accumulator_created = True
+            con.execute("INSERT INTO crm_customer_snapshot_all "
+                        "SELECT * FROM crm_customer_snapshot")
+        n = con.execute("SELECT COUNT(*) FROM crm_customer_snapshot").fetchone()[0]
+        print(f"  {m.isoformat()}  -> {n:,} rows")
+
+    con.execute("DROP INDEX IF EXISTS ix_crm_snapshot_month")
+    con.execute("DROP INDEX IF EXISTS ix_crm_snapshot_customer")
+    con.execute("DROP INDEX IF EXISTS ix_crm_snapshot_tier")
+    con.execute("DROP INDEX IF EXISTS ix_crm_snapshot_event")
+    con.execute("DROP TABLE crm_customer_snapshot")
+    con.execute("ALTER TABLE crm_customer_snapshot_all RENAME TO crm_customer_snapshot")
+
+    with timed(phases, "index_rebuild"):
+        con.execute("CREATE INDEX ix_crm_snapshot_month    ON crm_customer_snapshot(report_mth_eom)")
+        con.execute("CREATE INDEX ix_crm_snapshot_customer ON crm_customer_snapshot(customer_id)")
+        con.execute("CREATE INDEX ix_crm_snapshot_tier     ON crm_customer_snapshot(value_tier)")
+        con.execute("CREATE INDEX ix_crm_snapshot_event    ON crm_customer_snapshot(lifecycle_event)")
+
+
+def build_snapshot_numpy(con, calc_sql_template, months, append=False):
+    """Score the report months with the NumPy engine (db/crm_numpy.py); with
+    append=True only months missing from crm_customer_snapshot are scored and
+    appended. Returns the months written."""
+    # numpy is only needed for this engine.
+    import crm_numpy
+
+    if append:
+        built = {r[0] for r in con.execute("SELECT DISTINCT report_mth_eom FROM crm_customer_snapshot")}
+        months = [m for m in months if m.isoformat() not in built]
+        if not months:
+            print("  snapshot already has every requested month")
+            return months
+    crm_numpy.run_sql_stages(con, split_stages(patch_report_months(calc_sql_template, months)))
+    snapshot = crm_numpy.compute_snapshot(con)
+    crm_numpy.write_snapshot(con, snapshot, append=append)
+    placeholders = ",".join("?" * len(months))
+    for m, n in con.execute(f"SELECT report_mth_eom, COUNT(*) FROM crm_customer_snapshot "
+                            f"WHERE report_mth_eom IN ({placeholders}) GROUP BY 1 ORDER BY 1",
+                            [m.isoformat() for m in months]):
+        print(f"  {m}  -> {n:,} rows{' (appended)' if append else ''}")
+    return months
+
+
+def snapshot_exists(con):
+    return con.execute("SELECT 1 FROM sqlite_master "
+                       "WHERE type = 'table' AND name = 'crm_customer_snapshot'").fetchone() is not None
+
+
+def stale_customers(con, after_txn_id, everyone=False):
+    """Fill tt_rescore_customers with the customers whose rows in the built
+    snapshot months new data has made stale: those with sales lines above
+    after_txn_id, or everyone when a master file changed. Returns how many."""
+    con.execute("DROP TABLE IF EXISTS tt_rescore_customers")
+    con.execute("CREATE TEMP TABLE tt_rescore_customers (customer_id INTEGER PRIMARY KEY)")
+    if everyone:
+        con.execute("INSERT INTO tt_rescore_customers SELECT customer_id FROM raw_customers")
+    else:
+        con.execute("INSERT INTO tt_rescore_customers SELECT DISTINCT customer_id "
+                    "FROM raw_sales_transactions WHERE txn_id > ? AND customer_id IS NOT NULL",
+                    (after_txn_id,))
+    con.commit()
+    return con.execute("SELECT COUNT(*) FROM tt_rescore_customers").fetchone()[0]
+
+
+def rescore_snapshot_months(con, calc_sql_template, run_id, engine="sql"):
+    """Recompute the rows of the customers in tt_rescore_customers in every
+    month already in crm_customer_snapshot; returns the months rescored.
+
+    The M-windows of the calc script count every purchase from the window
+    start on, including ones after the report month, so new sales change
+    the M-fields, tier and event of months built before they arrived."""
+    n = con.execute("SELECT COUNT(*) FROM tt_rescore_customers").fetchone()[0]
+    months = [date.fromisoformat(r[0]) for r in con.execute(
+        "SELECT DISTINCT report_mth_eom FROM crm_customer_snapshot ORDER BY 1")]
+    if not n or not months:
+        return []
+    calc_sql = patch_report_months(calc_sql_template, months)
+    delete = ("DELETE FROM crm_customer_snapshot "
+              "WHERE customer_id IN (SELECT customer_id FROM tt_rescore_customers)")
+    # The DELETE opens the transaction the new rows commit in.
+    if engine == "numpy":
+        # numpy is only needed for this engine.
+        import crm_numpy
+
+        crm_numpy.run_sql_stages(con, split_stages(calc_sql))
+        ids = [r[0] for r in con.execute("SELECT customer_id FROM tt_rescore_customers")]
+        snapshot = crm_numpy.select_customers(crm_numpy.compute_snapshot(con), ids)
+        con.execute(delete)
+        crm_numpy.write_snapshot(con, snapshot, append=True)
+    else:
+        con.execute(delete)
+        run_calc(con, patch_snapshot_append(patch_customer_subset(calc_sql)), run_id)
+    print(f"  {months[0]} .. {months[-1]}  -> {n:,} customers with new data rescored")
+    return months
+
+
+def refresh_monthly_summary(con, summary_sql, redo_months=()):
+    """Add the snapshot months missing from crm_monthly_summary, summarizing
+    redo_months again; one transaction, so readers never see them missing."""
+    with con:
+        con.executemany("DELETE FROM crm_monthly_summary WHERE report_mth_eom = ?",
+                        [(m.isoformat(),) for m in redo_months])
+        for stmt in iter_statements(TXN_PATTERN.sub("", summary_sql)):
+            con.execute(stmt)
+
+
+def append_snapshot_months(con, calc_sql_template, months, run_id):
+    """Compute the months missing from crm_customer_snapshot and append them;
+    returns the months appended."""
+    built = {r[0] for r in con.execute("SELECT DISTINCT report_mth_eom FROM crm_customer_snapshot")}
+    todo = [m for m in months if m.isoformat() not in built]
+    if not todo:
+        print("  snapshot already has every requested month")
+        return todo
+    run_calc(con, patch_snapshot_append(patch_report_months(calc_sql_template, todo)), run_id)
+    placeholders = ",".join("?" * len(todo))
+    for m, n in con.execute(f"SELECT report_mth_eom, COUNT(*) FROM crm_customer_snapshot "
+                            f"WHERE report_mth_eom IN ({placeholders}) GROUP BY 1 ORDER BY 1",
+                            [m.isoformat() for m in todo]):
+        print(f"  {m}  -> {n:,} rows (appended)")
+    return todo
+
+
+def main(argv=None):
     ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
     ap.add_argument("--db", default=str(DEFAULT_DB),
                     help=f"output SQLite path (default: {DEFAULT_DB})")
@@ -77,79 +721,151 @@ def main():
                     help=f"number of report months back from --latest (default: {DEFAULT_MONTHS})")
     ap.add_argument("--latest", default=DEFAULT_LATEST,
                     help=f"latest report month-end date YYYY-MM-DD (default: {DEFAULT_LATEST})")
-    args = ap.parse_args()
+    ap.add_argument("--engine", choices=["sql", "numpy"], default="sql",
+                    help="compute the snapshot in SQLite or with db/crm_numpy.py (default: sql)")
+    ap.add_argument("--per-month", action="store_true",
+                    help="run the calculation once per report month (slow; for parity checks)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="keep an existing --db: load only new CSV rows, rescore the customers they "
+                         "touch and append missing months")
+    ap.add_argument("--parquet", metavar="DIR",
+                    help="also export the snapshot and raw tables as Parquet under DIR (needs pyarrow)")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="processes parsing the sales CSVs; the load itself stays single-writer (default: 1)")
+    ap.add_argument("--index-strategy", choices=list(INDEX_STRATEGIES), default="single",
+                    help="single: schema.sql's single-column sales indexes; covering: partial covering "
+                         "indexes from db/index_strategy_covering.sql instead (default: single)")
+    ap.add_argument("--profile", action="store_true",
+                    help="print time, rows and query plan per calc stage (always recorded in build_metrics)")
+    ap.add_argument("--input-dir", default=str(INPUT_DIR),
+                    help=f"directory holding the input CSVs (default: {INPUT_DIR})")
+    ap.add_argument("--skip-load", action="store_true",
+                    help="keep the raw_* tables already in --db (generate.py --format sqlite) "
+                         "and read no CSV")
+    args = ap.parse_args(argv)
+
+    if args.incremental and args.per_month:
+        ap.error("--per-month rebuilds the whole snapshot; it cannot be combined with --incremental")
+    if args.engine == "numpy" and args.per_month:
+        ap.error("--per-month is a mode of the SQL engine")
+    if args.engine == "numpy" and args.profile:
+        ap.error("--profile instruments the SQL engine's calc stages")
+    if args.skip_load and args.incremental:
+        ap.error("--skip-load rebuilds everything but the raw tables; it cannot be combined with --incremental")
 
     db_path = Path(args.db)
-    if db_path.exists():
+    incremental = args.incremental and db_path.exists()
+    if args.incremental and not incremental:
+        print(f"{db_path} does not exist yet; running a full build.")
+    if args.skip_load and not db_path.exists():
+        ap.error(f"--skip-load needs an existing --db; {db_path} does not exist")
+    if not incremental and not args.skip_load and db_path.exists():
         db_path.unlink()
     db_path.parent.mkdir(parents=True, exist_ok=True)
 
     schema_sql = (REPO / "db" / "schema.sql").read_text()
+    if INDEX_STRATEGIES[args.index_strategy]:
+        strategy_sql = (REPO / "db" / INDEX_STRATEGIES[args.index_strategy]).read_text()
+        schema_sql = patch_index_strategy(schema_sql, strategy_sql)
+    refresh_sql_template = (REPO / "db" / "refresh_fact_customer_month.sql").read_text()
     calc_sql_template = (REPO / "db" / "run_crm_calculation.sql").read_text()
+    summary_sql = (REPO / "db" / "refresh_crm_monthly_summary.sql").read_text()
 
+    phases = {}
     con = sqlite3.connect(db_path)
+    set_loader_pragmas(con, wal=incremental)
     t0 = time.time()
+    # Every statement in schema.sql is IF NOT EXISTS, so re-running it on an
+    # existing database is a no-op apart from adding tables new to the schema.
     con.executescript(schema_sql)
+    if not incremental:
+        drop_sales_indexes(con)
 
-    n_p = load_csv(con, "raw_products", INPUT_DIR / "products_master.csv",
-                   ["product_id", "product_name", "brand", "category", "unit_size"])
-    n_c = load_csv(con, "raw_customers", INPUT_DIR / "customers_master.csv",
-                   ["customer_id", "customer_name", "customer_group", "city", "created_date",
-                    "email", "mobile_number", "opt_email", "opt_sms", "opt_phone"])
-    n_s = 0
-    for f in sorted(glob.glob(str(INPUT_DIR / "sales_transactions_*.csv"))):
-        n_s += load_csv(con, "raw_sales_transactions", f,
-                        ["invoice_id", "customer_id", "invoice_date", "product_id",
-                         "quantity", "revenue", "store_id"])
-    con.commit()
+    if args.skip_load:
+        # Every kept row is new to the derived tables.
+        watermark = 0
+        print(f"Keeping the raw tables of {db_path}.")
+        n_p, n_c, n_s = reset_derived(con)
+    else:
+        watermark = con.execute("SELECT COALESCE(MAX(txn_id), 0) FROM raw_sales_transactions").fetchone()[0]
+        print("Loading CSVs:")
+        with timed(phases, "csv_load"):
+            n_p, n_c, n_s = load_inputs(con, incremental, jobs=args.jobs, input_dir=args.input_dir)
+    if not incremental:
+        with timed(phases, "index_build"):
+            con.executescript(schema_sql)
+        print(f"  indexed raw_sales_transactions in {phases['index_build']:.1f}s")
+    with timed(phases, "cube_refresh"):
+        if n_p or n_s:
+            # On the incremental path nothing has committed yet: executescript
+            # commits the new rows together with the refreshed cube. Product
+            # categories and unit sizes feed every cube row, so a changed
+            # products master refreshes all of it.
+            refresh_fact_customer_month(con, refresh_sql_template, 0 if n_p else watermark)
+        con.commit()
     print(f"Loaded {n_p:,} products, {n_c:,} customers, {n_s:,} transactions "
           f"in {time.time() - t0:.1f}s")
 
+    # Months appended to a re-tiered snapshot are scored like the rest of it.
+    thresholds = applied_thresholds(con)
+    if thresholds:
+        calc_sql_template = patch_thresholds(calc_sql_template, thresholds)
+        print("Scoring with the thresholds applied by db/retier.py: "
+              + ", ".join(f"{k}={v:g}" for k, v in thresholds.items()))
+
     latest = date.fromisoformat(args.latest)
     months = report_month_eoms(latest, args.months)
     print(f"\nBuilding snapshot for {len(months)} months "
           f"({months[0].isoformat()} .. {months[-1].isoformat()}):")
 
-    # Run calc once per month; the calc script DROPs and recreates
-    # crm_customer_snapshot each time, so we capture rows into an
-    # accumulator and rename it at the end.
-    con.execute("DROP TABLE IF EXISTS crm_customer_snapshot_all")
-    accumulator_created = False
-
     t1 = time.time()
-    for m in months:
-        patched_sql = REPORT_MONTH_PATTERN.sub(
-            lambda mt: f"'{m.isoformat()}'{mt.group(2)}",
-            calc_sql_template,
-            count=1,
-        )
-        con.executescript(patched_sql)
-        if not accumulator_created:
-            con.execute("CREATE TABLE crm_customer_snapshot_all "
-                        "AS SELECT * FROM crm_customer_snapshot WHERE 0")
-            accumulator_created = True
-        con.execute("INSERT INTO crm_customer_snapshot_all "
-                    "SELECT * FROM crm_customer_snapshot")
-        n = con.execute("SELECT COUNT(*) FROM crm_customer_snapshot").fetchone()[0]
-        print(f"  {m.isoformat()}  -> {n:,} rows")
-
-    con.execute("DROP INDEX IF EXISTS ix_crm_snapshot_month")
-    con.execute("DROP INDEX IF EXISTS ix_crm_snapshot_customer")
-    con.execute("DROP INDEX IF EXISTS ix_crm_snapshot_tier")
-    con.execute("DROP INDEX IF EXISTS ix_crm_snapshot_event")
-    con.execute("DROP TABLE crm_customer_snapshot")
-    con.execute("ALTER TABLE crm_customer_snapshot_all RENAME TO crm_customer_snapshot")
-
-    con.execute("CREATE INDEX ix_crm_snapshot_month    ON crm_customer_snapshot(report_mth_eom)")
-    con.execute("CREATE INDEX ix_crm_snapshot_customer ON crm_customer_snapshot(customer_id)")
-    con.execute("CREATE INDEX ix_crm_snapshot_tier     ON crm_customer_snapshot(value_tier)")
-    con.execute("CREATE INDEX ix_crm_snapshot_event    ON crm_customer_snapshot(lifecycle_event)")
-    con.execute("ANALYZE")
-    con.commit()
+    run_id = next_run_id(con)
+    built, rescored = months, []
+    if args.per_month:
+        build_snapshot_per_month(con, calc_sql_template, summary_sql, months, run_id, phases)
+    else:
+        with timed(phases, "snapshot_calc"):
+            append = incremental and snapshot_exists(con)
+            if append and stale_customers(con, watermark, everyone=bool(n_p or n_c)):
+                rescored = rescore_snapshot_months(con, calc_sql_template, run_id, args.engine)
+            if args.engine == "numpy":
+                built = build_snapshot_numpy(con, calc_sql_template, months, append=append)
+            elif append:
+                built = append_snapshot_months(con, calc_sql_template, months, run_id)
+            else:
+                run_calc(con, patch_report_months(calc_sql_template, months), run_id)
+                for m, n in con.execute("SELECT report_mth_eom, COUNT(*) FROM crm_customer_snapshot "
+                                        "GROUP BY 1 ORDER BY 1"):
+                    print(f"  {m}  -> {n:,} rows")
+        with timed(phases, "monthly_summary"):
+            refresh_monthly_summary(con, summary_sql, rescored)
+    # A full ANALYZE rescans every index; after an append, let SQLite refresh
+    # only the statistics that have drifted.
+    with timed(phases, "analyze"):
+        con.execute("PRAGMA optimize" if incremental else "ANALYZE")
+        con.commit()
+    if incremental:
+        reset_journal_mode(con)
 
     total = con.execute("SELECT COUNT(*) FROM crm_customer_snapshot").fetchone()[0]
     print(f"\nSnapshot built in {time.time() - t1:.1f}s — total rows: {total:,}")
     print(f"Database: {db_path}")
+    if args.profile:
+        print_profile(con, run_id)
+
+    if args.parquet:
+        # pyarrow is only needed for this step.
+        from export_parquet import export_parquet
+
+        print(f"\nExporting Parquet to {args.parquet}:")
+        with timed(phases, "parquet_export"):
+            export_parquet(con, args.parquet,
+                           snapshot_months=sorted({m.isoformat() for m in built + rescored}),
+                           sales_after_txn_id=watermark)
+        print(f"Parquet export in {phases['parquet_export']:.1f}s")
+
+    con.close()
+    return phases
 
 
 if __name__ == "__main__":
@@ -0,0 +1,376 @@
+"""
+Vectorized NumPy engine for the CRM snapshot: the same rules as stages 4-5
+of db/run_crm_calculation.sql, computed as array arithmetic.
+
+The consumable activity in fact_customer_month is loaded once into typed
+arrays and scattered into a customer × month units matrix (and a matching
+invoice-count matrix). A reversed cumulative sum along the month axis gives,
+for every customer and month j, the units bought in month j or later --
+exactly what each `purchase_mth_bom >= mNN_bom` window in the SQL sums. Every
+M-field of every report month is then one column lookup into that matrix,
+and the Value Tier / Lifecycle Event ladders are applied as boolean masks
+over all customers, one report month at a time. Rows are written to SQLite
+in chunks of WRITE_CHUNK_ROWS, so only one chunk is ever held as Python
+objects.
+
+Stages 1-3 of the SQL script (parameters, date windows, first device date)
+still run in SQLite first, so the thresholds have a single source of truth.
+
+Selected with `python db/build.py --engine numpy`. Check it against the SQL
+engine on an existing database (the database is copied into memory, the
+file is not modified):
+
+    python db/crm_numpy.py --db data/input/crm.db --months 12 --latest 2024-12-31
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+REPO = Path(__file__).resolve().parent.parent
+DEFAULT_DB = REPO / "data" / "input" / "crm.db"
+
+# Stages of run_crm_calculation.sql the NumPy engine still runs in SQL:
+# parameters, date windows, first device date.
+SQL_STAGES = (1, 2, 3)
+
+TIERS = np.array([None, "Diamond", "Platinum", "Gold", "Silver", "Bronze", "Passive"], dtype=object)
+EVENTS = np.array([None, "New", "Lost", "Reactivated"], dtype=object)
+ACTIVITY = np.array(["Not Active", "Active"], dtype=object)
+
+WRITE_CHUNK_ROWS = 50_000     # snapshot rows turned into Python objects at a time
+
+SNAPSHOT_COLUMNS = [
+    "report_mth_eom", "customer_id", "first_device_purchase_date",
+    "first_consumable_purchase_date", "last_consumable_purchase_date", "tenure_months",
+    "m_total", "m1", "m6", "m12", "m13", "m24", "m25", "o6",
+    "avg_monthly_consumption", "avg_order_size", "activity_status", "value_tier", "lifecycle_event",
+]
+
+SNAPSHOT_DDL = """
+CREATE TABLE crm_customer_snapshot (
+    report_mth_eom                 TEXT,
+    customer_id                    INT,
+    first_device_purchase_date     TEXT,
+    first_consumable_purchase_date TEXT,
+    last_consumable_purchase_date  TEXT,
+    tenure_months                  INTEGER,
+    m_total                        REAL,
+    m1                             REAL,
+    m6                             REAL,
+    m12                            REAL,
+    m13                            REAL,
+    m24                            REAL,
+    m25                            REAL,
+    o6                             INTEGER,
+    avg_monthly_consumption        REAL,
+    avg_order_size                 REAL,
+    activity_status                TEXT,
+    value_tier                     TEXT,
+    lifecycle_event                TEXT
+)
+"""
+
+SNAPSHOT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_crm_snapshot_month    ON crm_customer_snapshot(report_mth_eom)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_snapshot_customer ON crm_customer_snapshot(customer_id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_snapshot_tier     ON crm_customer_snapshot(value_tier)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_snapshot_event    ON crm_customer_snapshot(lifecycle_event)",
+]
+
+# compute_snapshot() entries with one element (row) per eligible customer.
+PER_CUSTOMER = ("customer_ids", "first_device", "first_cons", "last_cons",
+                "first_no", "has_first", "units_from", "invoices_from")
+
+# Month number of an ISO date column: year * 12 + month - 1.
+MONTH_NO = "(CAST(substr({0}, 1, 4) AS INTEGER) * 12 + CAST(substr({0}, 6, 2) AS INTEGER) - 1)"
+
+
+def column(rows, i, dtype):
+    return np.fromiter((r[i] for r in rows), dtype=dtype, count=len(rows))
+
+
+def compute_snapshot(con):
+    """Prepare the scoring of every eligible customer for every report month
+    in tt_params.
+
+    Expects tt_params, tt_dates and tt_first_device_date from the SQL
+    stages. Returns the per-customer inputs and the from-month cumulative
+    units / invoice matrices; score_month() derives one report month from
+    them and snapshot_rows() streams the rows, so nothing the size of
+    customers x report months is ever held.
+    """
+    params = con.execute("""
+        SELECT report_mth_eom, anonymous_group, t_high, t_mid_high, t_mid, a_high, f_high, f_mid
+        FROM tt_params ORDER BY report_mth_eom
+    """).fetchall()
+    months = [p[0] for p in params]
+    anonymous = {p[1] for p in params}
+    if len(anonymous) != 1:
+        raise ValueError("the NumPy engine needs one anonymous_group across all report months")
+    # Thresholds as (months, 1) columns, broadcast across customers.
+    t_high, t_mid_high, t_mid, a_high, f_high, f_mid = (
+        np.array([p[k] for p in params], dtype=np.float64)[:, None] for k in range(2, 8))
+    report_no = np.array([int(m[:4]) * 12 + int(m[5:7]) - 1 for m in months], dtype=np.int64)
+
+    # Eligible customers, in raw_customers (customer_id) order.
+    cust = con.execute(f"""
+        SELECT c.customer_id, fd.first_device_purchase_date
+        FROM raw_customers c
+        LEFT JOIN tt_first_device_date fd ON fd.customer_id = c.customer_id
+        WHERE LOWER(COALESCE(c.customer_group, '')) <> ?
+        ORDER BY c.customer_id
+    """, (anonymous.pop(),)).fetchall()
+    customer_ids = column(cust, 0, np.int64)
+    first_device = np.array([r[1] for r in cust], dtype=object)
+    n_cust = len(customer_ids)
+
+    # Consumable activity, one row per customer × month of purchase.
+    cube = con.execute(f"""
+        SELECT customer_id, {MONTH_NO.format('purchase_mth_bom')}, units, n_invoices
+        FROM fact_customer_month
+    """).fetchall()
+    cube_cust = column(cube, 0, np.int64)
+    cube_month = column(cube, 1, np.int64)
+    cube_units = column(cube, 2, np.float64)
+    cube_inv = column(cube, 3, np.int64)
+
+    # Month axis: far enough back for the M25 window of the first report
+    # month, far enough forward for the last purchase or report month.
+    lo = min(report_no.min() - 24, cube_month.min(initial=report_no.min()))
+    hi = max(report_no.max(), cube_month.max(initial=report_no.max()))
+    width = int(hi - lo + 1)
+
+    # Map cube rows onto eligible-customer positions; anonymous customers drop out.
+    pos = np.searchsorted(customer_ids, cube_cust)
+    pos_ok = pos < n_cust
+    pos_ok[pos_ok] = customer_ids[pos[pos_ok]] == cube_cust[pos_ok]
+    pos, month_ix = pos[pos_ok], (cube_month - lo)[pos_ok]
+
+    units = np.zeros((n_cust, width), dtype=np.float64)
+    invoices = np.zeros((n_cust, width), dtype=np.int64)
+    units[pos, month_ix] = cube_units[pos_ok]
+    invoices[pos, month_ix] = cube_inv[pos_ok]
+
+    # from_month[c, j] = total over months >= j.
+    units_from = np.cumsum(units[:, ::-1], axis=1)[:, ::-1]
+    invoices_from = np.cumsum(invoices[:, ::-1], axis=1)[:, ::-1]
+    del units, invoices
+
+    # First / last consumable dates per eligible customer.
+    dates = con.execute(f"""
+        SELECT customer_id, MIN(first_consumable_date), MAX(last_consumable_date),
+               {MONTH_NO.format('MIN(first_consumable_date)')}
+        FROM fact_customer_month GROUP BY customer_id
+    """).fetchall()
+    first_cons = np.full(n_cust, None, dtype=object)
+    last_cons = np.full(n_cust, None, dtype=object)
+    first_no = np.zeros(n_cust, dtype=np.int64)
+    has_first = np.zeros(n_cust, dtype=bool)
+    if dates:
+        d_cust = column(dates, 0, np.int64)
+        d_pos = np.searchsorted(customer_ids, d_cust)
+        d_ok = d_pos < n_cust
+        d_ok[d_ok] = customer_ids[d_pos[d_ok]] == d_cust[d_ok]
+        idx = np.flatnonzero(d_ok)
+        first_cons[d_pos[idx]] = [dates[i][1] for i in idx]
+        last_cons[d_pos[idx]] = [dates[i][2] for i in idx]
+        first_no[d_pos[idx]] = column(dates, 3, np.int64)[idx]
+        has_first[d_pos[idx]] = True
+
+    return {
+        "months":         months,
+        "report_col":     report_no - lo,        # column of each report month in the matrices
+        "report_no":      report_no,
+        "thresholds":     (t_high, t_mid_high, t_mid, a_high, f_high, f_mid),
+        "customer_ids":   customer_ids,
+        "first_device":   first_device,
+        "first_cons":     first_cons,
+        "last_cons":      last_cons,
+        "first_no":       first_no,
+        "has_first":      has_first,
+        "units_from":     units_from,
+        "invoices_from":  invoices_from,
+    }
+
+
+def select_customers(snapshot, customer_ids):
+    """compute_snapshot() output narrowed to the eligible customers among
+    `customer_ids`."""
+    keep = np.isin(snapshot["customer_ids"], np.asarray(customer_ids, dtype=np.int64))
+    return {k: v[keep] if k in PER_CUSTOMER else v for k, v in snapshot.items()}
+
+
+def score_month(snapshot, i):
+    """Score every eligible customer for report month i of compute_snapshot()
+    output. Returns (customers,) arrays: the M-fields, O6, tenure and the
+    ratios as numbers, the value tier and lifecycle event as codes into
+    TIERS / EVENTS."""
+    r = snapshot["report_col"][i]
+    units_from, invoices_from = snapshot["units_from"], snapshot["invoices_from"]
+    t_high, t_mid_high, t_mid, a_high, f_high, f_mid = (t[i] for t in snapshot["thresholds"])
+
+    m_total = units_from[:, 0]
+    m1, m6, m12 = units_from[:, r], units_from[:, r - 5], units_from[:, r - 11]
+    m13, m24, m25 = units_from[:, r - 12], units_from[:, r - 23], units_from[:, r - 24]
+    o6 = invoices_from[:, r - 5]
+
+    # Tenure: months from first consumable purchase to report month, inclusive.
+    tenure = snapshot["report_no"][i] - snapshot["first_no"] + 1
+
+    # Derived ratios.
+    amc = m6 / 6.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        aos = np.where(o6 > 0, m6 / np.maximum(o6, 1), np.nan)
+
+    # Value tier: top-down precedence, Passive override, NULL when not Active.
+    tier = np.select(
+        [m12 == 0,
+         m6 == 0,
+         (amc >= t_high) & (o6 > 0) & (aos >= a_high) & (o6 >= f_high),
+         (amc >= t_high) & (o6 >= f_mid),
+         amc >= t_mid_high,
+         amc >= t_mid,
+         amc > 0],
+        [0, 6, 1, 2, 3, 4, 5],
+        default=0,
+    ).astype(np.int8)
+
+    # Lifecycle event: mutually exclusive, first match wins.
+    event = np.select(
+        [(m1 > 0) & (m1 == m_total),
+         (m12 == 0) & (m13 > 0),
+         (m1 > 0) & (m1 == m13) & (m_total > m13)],
+        [1, 2, 3],
+        default=0,
+    ).astype(np.int8)
+
+    return {"m_total": m_total, "m1": m1, "m6": m6, "m12": m12, "m13": m13, "m24": m24, "m25": m25,
+            "o6": o6, "tenure": tenure, "amc": amc, "aos": aos, "tier": tier, "event": event}
+
+
+def nullable(values, mask):
+    out = values.astype(object)
+    out[~mask] = None
+    return out.tolist()
+
+
+def snapshot_rows(snapshot, chunk_rows=WRITE_CHUNK_ROWS):
+    """Yield the snapshot rows in SNAPSHOT_COLUMNS order, month-major then
+    customer_id, as lists of at most chunk_rows tuples. One report month is
+    scored at a time and only the current chunk is turned into Python values."""
+    n_cust = len(snapshot["customer_ids"])
+    for i, month in enumerate(snapshot["months"]):
+        m = score_month(snapshot, i)
+        for a in range(0, n_cust, chunk_rows):
+            at = slice(a, a + chunk_rows)
+            cols = [
+                [month] * len(snapshot["customer_ids"][at]),
+                snapshot["customer_ids"][at].tolist(),
+                snapshot["first_device"][at].tolist(),
+                snapshot["first_cons"][at].tolist(),
+                snapshot["last_cons"][at].tolist(),
+                nullable(m["tenure"][at], snapshot["has_first"][at]),
+            ]
+            cols += [m[k][at].tolist() for k in ("m_total", "m1", "m6", "m12", "m13", "m24", "m25", "o6", "amc")]
+            cols += [
+                nullable(m["aos"][at], m["o6"][at] > 0),
+                ACTIVITY[(m["m12"][at] > 0).astype(np.int8)].tolist(),
+                TIERS[m["tier"][at]].tolist(),
+                EVENTS[m["event"][at]].tolist(),
+            ]
+            yield list(zip(*cols))
+
+
+def write_snapshot(con, snapshot, append=False):
+    """Write compute_snapshot() output into crm_customer_snapshot; returns rows written.
+    With append=False the table is recreated, as the SQL engine does."""
+    if not append:
+        con.execute("DROP TABLE IF EXISTS crm_customer_snapshot")
+        con.execute(SNAPSHOT_DDL)
+    sql = (f"INSERT INTO crm_customer_snapshot ({', '.join(SNAPSHOT_COLUMNS)}) "
+           f"VALUES ({', '.join('?' * len(SNAPSHOT_COLUMNS))})")
+    n = 0
+    for rows in snapshot_rows(snapshot):
+        con.executemany(sql, rows)
+        n += len(rows)
+    for ddl in SNAPSHOT_INDEXES:
+        con.execute(ddl)
+    con.commit()
+    return n
+
+
+def run_sql_stages(con, stages, numbers=SQL_STAGES):
+    for num, _, sql in stages:
+        if num in numbers:
+            con.executescript(sql)
+
+
+def check_parity(con, calc_sql, split_stages, months):
+    """Score `months` with both engines on `con`; returns a list of mismatches."""
+    t0 = time.time()
+    con.executescript(calc_sql)
+    names = SNAPSHOT_COLUMNS
+    expected = con.execute(f"SELECT {', '.join(names)} FROM crm_customer_snapshot "
+                           f"ORDER BY report_mth_eom, customer_id").fetchall()
+    t_sql = time.time() - t0
+
+    t0 = time.time()
+    run_sql_stages(con, split_stages(calc_sql))
+    snapshot = compute_snapshot(con)
+    n_got = sum(len(rows) for rows in snapshot_rows(snapshot))
+    t_np = time.time() - t0
+    print(f"SQL engine {t_sql:.2f}s, NumPy engine {t_np:.2f}s (compute and row generation), "
+          f"{len(expected):,} / {n_got:,} rows over {len(months)} months")
+
+    problems = []
+    if len(expected) != n_got:
+        problems.append(f"row count {len(expected)} != {n_got}")
+    got = (row for rows in snapshot_rows(snapshot) for row in rows)
+    for want, have in zip(expected, got):
+        for name, a, b in zip(names, want, have):
+            same = (a == b) or (isinstance(a, float) and isinstance(b, float)
+                                and abs(a - b) <= 1e-9 * max(abs(a), abs(b), 1.0))
+            if not same:
+                problems.append(f"{want[0]} customer {want[1]}: {name} sql={a!r} numpy={b!r}")
+                break
+    return problems
+
+
+def main():
+    sys.path.insert(0, str(REPO / "db"))
+    from build import (DEFAULT_LATEST, DEFAULT_MONTHS, patch_report_months,
+                       report_month_eoms, split_stages)
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=str(DEFAULT_DB),
+                    help=f"database built by db/build.py (default: {DEFAULT_DB})")
+    ap.add_argument("--months", type=int, default=DEFAULT_MONTHS,
+                    help=f"number of report months back from --latest (default: {DEFAULT_MONTHS})")
+    ap.add_argument("--latest", default=DEFAULT_LATEST,
+                    help=f"latest report month-end date YYYY-MM-DD (default: {DEFAULT_LATEST})")
+    args = ap.parse_args()
+
+    src = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    con = sqlite3.connect(":memory:")
+    src.backup(con)
+    src.close()
+
+    months = report_month_eoms(date.fromisoformat(args.latest), args.months)
+    calc_sql = patch_report_months((REPO / "db" / "run_crm_calculation.sql").read_text(), months)
+    problems = check_parity(con, calc_sql, split_stages, months)
+    for p in problems[:20]:
+        print(f"  MISMATCH {p}")
+    if problems:
+        print(f"Parity FAILED: {len(problems):,} mismatching rows")
+        sys.exit(1)
+    print("Parity OK: NumPy engine matches the SQL engine.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Export the CRM database as Parquet, for consumers that should not go
+through sqlite3 row by row.
+
+Layout under the output directory (Hive-style partitions; the partition
+column lives in the directory name, not in the files):
+
+  crm_customer_snapshot/report_mth_eom=YYYY-MM-DD/part-0.parquet
+  raw_sales_transactions/invoice_mth=YYYY-MM/part-0.parquet
+  raw_customers/part-0.parquet
+  raw_products/part-0.parquet
+
+Each partition is streamed from its own index-driven query in batches of
+EXPORT_BATCH_ROWS, so memory stays bounded by one batch whatever the
+table size. Files are written to a temporary name and renamed into place.
+
+db/build.py calls export_parquet() when given --parquet DIR; this script
+exports an existing database. Needs pyarrow.
+
+Usage:
+    python db/export_parquet.py --out data/parquet
+    python db/export_parquet.py --db custom/path/crm.db --out /srv/bi/crm
+"""
+
+import argparse
+import os
+import sqlite3
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+REPO = Path(__file__).resolve().parent.parent
+DEFAULT_DB = REPO / "data" / "input" / "crm.db"
+
+EXPORT_BATCH_ROWS = 100_000
+
+DATE = pa.date32()
+
+# Column types per exported table. crm_customer_snapshot is created with
+# CREATE TABLE ... AS and has no declared types to derive these from.
+SNAPSHOT_SCHEMA = pa.schema([
+    ("customer_id",                    pa.int64()),
+    ("first_device_purchase_date",     DATE),
+    ("first_consumable_purchase_date", DATE),
+    ("last_consumable_purchase_date",  DATE),
+    ("tenure_months",                  pa.int32()),
+    ("m_total",                        pa.float64()),
+    ("m1",                             pa.float64()),
+    ("m6",                             pa.float64()),
+    ("m12",                            pa.float64()),
+    ("m13",                            pa.float64()),
+    ("m24",                            pa.float64()),
+    ("m25",                            pa.float64()),
+    ("o6",                             pa.int32()),
+    ("avg_monthly_consumption",        pa.float64()),
+    ("avg_order_size",                 pa.float64()),
+    ("activity_status",                pa.dictionary(pa.int8(), pa.string())),
+    ("value_tier",                     pa.dictionary(pa.int8(), pa.string())),
+    ("lifecycle_event",                pa.dictionary(pa.int8(), pa.string())),
+])
+
+SALES_SCHEMA = pa.schema([
+    ("txn_id",       pa.int64()),
+    ("invoice_id",   pa.string()),
+    ("customer_id",  pa.int64()),
+    ("invoice_date", DATE),
+    ("product_id",   pa.int64()),
+    ("quantity",     pa.float64()),
+    ("revenue",      pa.float64()),
+    ("store_id",     pa.int64()),
+])
+
+CUSTOMERS_SCHEMA = pa.schema([
+    ("customer_id",    pa.int64()),
+    ("customer_name",  pa.string()),
+    ("customer_group", pa.string()),
+    ("city",           pa.string()),
+    ("created_date",   DATE),
+    ("email",          pa.string()),
+    ("mobile_number",  pa.string()),
+    ("opt_email",      pa.int8()),
+    ("opt_sms",        pa.int8()),
+    ("opt_phone",      pa.int8()),
+])
+
+PRODUCTS_SCHEMA = pa.schema([
+    ("product_id",   pa.int64()),
+    ("product_name", pa.string()),
+    ("brand",        pa.string()),
+    ("category",     pa.string()),
+    ("unit_size",    pa.float64()),
+])
+
+
+def to_batch(rows, schema):
+    """Turn a list of sqlite rows into a RecordBatch of `schema`. ISO date
+    strings are parsed into date32 and low-cardinality labels dictionary-
+    encoded by Arrow's casts, not in Python."""
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        if field.type == DATE:
+            arr = pa.array(values, pa.string()).cast(DATE)
+        elif pa.types.is_dictionary(field.type):
+            arr = pa.array(values, pa.string()).dictionary_encode().cast(field.type)
+        else:
+            arr = pa.array(values, field.type)
+        arrays.append(arr)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_query(con, sql, params, schema, path):
+    """Stream the rows of `sql` into one Parquet file; returns the row count."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    cur = con.execute(sql, params)
+    n = 0
+    with pq.ParquetWriter(tmp, schema) as writer:
+        while rows := cur.fetchmany(EXPORT_BATCH_ROWS):
+            writer.write_batch(to_batch(rows, schema))
+            n += len(rows)
+    os.replace(tmp, path)
+    return n
+
+
+def export_parquet(con, out_dir, snapshot_months=None, sales_after_txn_id=0):
+    """Write the snapshot and raw tables under out_dir.
+
+    snapshot_months limits the snapshot partitions written (default: every
+    month in crm_customer_snapshot). Only invoice months that have sales
+    lines above sales_after_txn_id are rewritten (default 0: all of them);
+    db/build.py --incremental passes its pre-load watermark.
+    """
+    out_dir = Path(out_dir)
+    cols = ", ".join(SNAPSHOT_SCHEMA.names)
+
+    if snapshot_months is None:
+        snapshot_months = [r[0] for r in con.execute(
+            "SELECT DISTINCT report_mth_eom FROM crm_customer_snapshot ORDER BY 1")]
+    for m in snapshot_months:
+        n = write_query(
+            con,
+            f"SELECT {cols} FROM crm_customer_snapshot WHERE report_mth_eom = ? ORDER BY customer_id",
+            (m,), SNAPSHOT_SCHEMA,
+            out_dir / "crm_customer_snapshot" / f"report_mth_eom={m}" / "part-0.parquet",
+        )
+        print(f"  crm_customer_snapshot   {m}  {n:>11,} rows")
+
+    sales_months = [r[0] for r in con.execute(
+        "SELECT DISTINCT substr(invoice_date, 1, 7) FROM raw_sales_transactions "
+        "WHERE txn_id > ? ORDER BY 1", (sales_after_txn_id,))]
+    for ym in sales_months:
+        n = write_query(
+            con,
+            f"SELECT {', '.join(SALES_SCHEMA.names)} FROM raw_sales_transactions "
+            f"WHERE invoice_date >= ? AND invoice_date < date(?, '+1 month')",
+            (f"{ym}-01", f"{ym}-01"), SALES_SCHEMA,
+            out_dir / "raw_sales_transactions" / f"invoice_mth={ym}" / "part-0.parquet",
+        )
+        print(f"  raw_sales_transactions  {ym}     {n:>11,} rows")
+
+    for table, schema in (("raw_customers", CUSTOMERS_SCHEMA), ("raw_products", PRODUCTS_SCHEMA)):
+        n = write_query(con, f"SELECT {', '.join(schema.names)} FROM {table}", (), schema,
+                        out_dir / table / "part-0.parquet")
+        print(f"  {table:<23} {n:>23,} rows")
+
+
+def read_snapshot_month(out_dir, month, columns=None):
+    """Load one report month of the exported snapshot as an Arrow Table.
+
+    The partition file is memory-mapped and only `columns` (default: all)
+    are read, so pages are decoded straight from the mapping into Arrow
+    buffers without a Python-object pass or a read() copy.
+    """
+    path = Path(out_dir) / "crm_customer_snapshot" / f"report_mth_eom={month}" / "part-0.parquet"
+    return pq.read_table(path, columns=columns, memory_map=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=str(DEFAULT_DB),
+                    help=f"SQLite database to export (default: {DEFAULT_DB})")
+    ap.add_argument("--out", required=True, help="output directory")
+    args = ap.parse_args()
+
+    con = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    print(f"Exporting {args.db} -> {args.out}")
+    export_parquet(con, args.out)
+
+
+if __name__ == "__main__":
+    main()
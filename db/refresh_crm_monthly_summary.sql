@@ -0,0 +1,35 @@
+-- refresh_crm_monthly_summary.sql
+-- Maintains crm_monthly_summary (see db/schema.sql): one row per report
+-- month × value tier × lifecycle event × activity status of
+-- crm_customer_snapshot, with the head count and the sum / count of each
+-- dashboard KPI.
+--
+-- Only report months not yet in the summary are added. A caller that
+-- recomputes snapshot months in place (db/build.py --incremental rescoring
+-- customers with new sales, db/retier.py) first deletes their summary rows
+-- in the same transaction. build.py runs this after every calculation pass;
+-- with --per-month that is once per report month, while
+-- crm_customer_snapshot holds just that month.
+
+BEGIN;
+
+INSERT INTO crm_monthly_summary (
+    report_mth_eom, value_tier, lifecycle_event, activity_status,
+    n_customers,
+    amc_sum, amc_n,
+    aos_sum, aos_n,
+    o6_sum, o6_n,
+    tenure_sum, tenure_n
+)
+SELECT
+    s.report_mth_eom, s.value_tier, s.lifecycle_event, s.activity_status,
+    COUNT(*),
+    TOTAL(s.avg_monthly_consumption), COUNT(s.avg_monthly_consumption),
+    TOTAL(s.avg_order_size),          COUNT(s.avg_order_size),
+    COALESCE(SUM(s.o6), 0),            COUNT(s.o6),
+    COALESCE(SUM(s.tenure_months), 0), COUNT(s.tenure_months)
+FROM crm_customer_snapshot s
+WHERE s.report_mth_eom NOT IN (SELECT report_mth_eom FROM crm_monthly_summary)
+GROUP BY s.report_mth_eom, s.value_tier, s.lifecycle_event, s.activity_status;
+
+COMMIT;
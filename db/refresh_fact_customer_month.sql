@@ -0,0 +1,82 @@
+-- refresh_fact_customer_month.sql
+-- Maintains fact_customer_month (see db/schema.sql): one row per customer ×
+-- month of purchase over consumable, positive-quantity lines, per
+-- docs/specs/crm_calculation_logic.md §6.3. db/run_crm_calculation.sql reads
+-- its M-windows and O6 from this cube instead of the sales lines.
+--
+-- Only customers with sales lines above the txn_id watermark are recomputed,
+-- and for them every month is rebuilt from their lines: a new line can move
+-- an invoice's attribution month (below), so patching single cells is not
+-- enough. The default watermark of 0 rebuilds the whole cube.
+--
+-- Invoice attribution: each (customer, invoice) is counted once, in the
+-- latest month it has a consumable line. Summing n_invoices over any
+-- "month >= X" window then equals COUNT(DISTINCT invoice_id) over the same
+-- lines, even when an invoice_id recurs across months.
+
+BEGIN;
+
+-- =============================================================
+-- 1. CUSTOMERS TO REFRESH
+-- =============================================================
+DROP TABLE IF EXISTS tt_refresh_customers;
+CREATE TEMP TABLE tt_refresh_customers AS
+WITH refresh_params(after_txn_id) AS (
+    -- Sales lines above this txn_id are new since the last refresh; db/build.py
+    -- substitutes MAX(txn_id) as it was before the load.
+    VALUES (0)
+)
+SELECT DISTINCT s.customer_id
+FROM raw_sales_transactions s, refresh_params r
+WHERE s.txn_id > r.after_txn_id;
+
+
+-- =============================================================
+-- 2. RECOMPUTE THEIR CUBE ROWS
+--    "units" = quantity * unit_size (volume measure on the consumable).
+-- =============================================================
+DELETE FROM fact_customer_month
+WHERE customer_id IN (SELECT customer_id FROM tt_refresh_customers);
+
+INSERT INTO fact_customer_month (
+    customer_id, purchase_mth_bom, units, n_invoices,
+    first_consumable_date, last_consumable_date
+)
+WITH lines AS MATERIALIZED (
+    SELECT
+        s.customer_id,
+        s.invoice_id,
+        date(s.invoice_date, 'start of month') AS purchase_mth_bom,
+        s.invoice_date,
+        s.quantity * p.unit_size               AS units
+    FROM raw_sales_transactions s
+    JOIN raw_products          p ON p.product_id = s.product_id
+    WHERE p.category  = 'consumable'
+      AND s.quantity  > 0
+      AND s.customer_id IN (SELECT customer_id FROM tt_refresh_customers)
+),
+invoices AS (
+    SELECT customer_id, invoice_id, MAX(purchase_mth_bom) AS purchase_mth_bom
+    FROM lines
+    GROUP BY customer_id, invoice_id
+),
+invoice_counts AS (
+    SELECT customer_id, purchase_mth_bom, COUNT(*) AS n_invoices
+    FROM invoices
+    GROUP BY customer_id, purchase_mth_bom
+)
+SELECT
+    l.customer_id,
+    l.purchase_mth_bom,
+    TOTAL(l.units),
+    COALESCE(ic.n_invoices, 0),
+    MIN(l.invoice_date),
+    MAX(l.invoice_date)
+FROM lines l
+LEFT JOIN invoice_counts ic ON ic.customer_id      = l.customer_id
+                           AND ic.purchase_mth_bom = l.purchase_mth_bom
+GROUP BY l.customer_id, l.purchase_mth_bom;
+
+DROP TABLE tt_refresh_customers;
+
+COMMIT;
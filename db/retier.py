@@ -0,0 +1,193 @@
+"""
+Re-score the value tier of an existing CRM database with new thresholds.
+
+The tier thresholds are the t_high / t_mid_high / t_mid / a_high / f_high /
+f_mid literals of tt_params in db/run_crm_calculation.sql. The snapshot
+already keeps every aggregate the tier is derived from (m1 .. m25, o6 and
+the purchase dates, per customer and report month), so changing a threshold
+does not need db/build.py: db/retier_crm_snapshot.sql rewrites value_tier
+for all report months in one UPDATE, then crm_monthly_summary is rebuilt
+with db/refresh_crm_monthly_summary.sql.
+
+Thresholds not given keep the values the snapshot is currently scored with:
+the last ones applied here (crm_tier_thresholds), or else the calc
+script's literals; --reset goes back to the literals. The applied
+thresholds are recorded in crm_tier_thresholds, and later
+`db/build.py --incremental` runs score appended months with them. A full
+build starts over from the literals, so a change meant to last belongs in
+run_crm_calculation.sql. Re-run scripts/build_report.py afterwards to
+refresh the site data.
+
+--check re-tiers an in-memory copy of the database and compares every
+value_tier, and the monthly summary counts, against run_crm_calculation.sql
+run from scratch with the same thresholds (exit status 1 on a mismatch).
+
+Usage:
+    python db/retier.py --t-high 900 --f-high 5
+    python db/retier.py --db custom/path/crm.db --t-mid 40 --t-mid-high 180
+    python db/retier.py --reset
+    python db/retier.py --check --t-high 900
+"""
+
+import argparse
+import re
+import sqlite3
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+from build import (DEFAULT_DB, REPO, THRESHOLDS, TXN_PATTERN, applied_thresholds, iter_statements,
+                   patch_report_months, patch_thresholds, reset_journal_mode, sql_thresholds)
+
+RETIER_SQL = REPO / "db" / "retier_crm_snapshot.sql"
+
+TIERS = ("Diamond", "Platinum", "Gold", "Silver", "Bronze", "Passive")
+
+# The value-tier CASE ... END of retier_crm_snapshot.sql.
+TIER_CASE_PATTERN = re.compile(r"^\s*CASE\b.*?^\s*END\b", re.M | re.S)
+
+
+def tier_case():
+    """The value-tier ladder of retier_crm_snapshot.sql as a SQL expression
+    over m12, m6 and o6, with the thresholds as :name parameters."""
+    return TIER_CASE_PATTERN.search(RETIER_SQL.read_text()).group(0).strip()
+
+
+def retier(con, thresholds):
+    """Re-score value_tier of every snapshot row with `thresholds` (name ->
+    value, all of THRESHOLDS), record them in crm_tier_thresholds and
+    rebuild the monthly summary; returns the number of rows whose tier
+    changed."""
+    retier_sql = RETIER_SQL.read_text()
+    summary_sql = (REPO / "db" / "refresh_crm_monthly_summary.sql").read_text()
+
+    with con:
+        changed = con.execute(retier_sql, thresholds).rowcount
+        con.execute("DELETE FROM crm_tier_thresholds")
+        con.execute(f"INSERT INTO crm_tier_thresholds ({', '.join(THRESHOLDS)}, applied_at) "
+                    f"VALUES ({', '.join(f':{name}' for name in THRESHOLDS)}, datetime('now'))",
+                    thresholds)
+        # refresh_crm_monthly_summary.sql adds the months missing from the
+        # summary; emptied and refilled in one transaction, readers never see
+        # it empty.
+        con.execute("DELETE FROM crm_monthly_summary")
+        for stmt in iter_statements(TXN_PATTERN.sub("", summary_sql)):
+            con.execute(stmt)
+    return changed
+
+
+def tier_counts(con, month):
+    return dict(con.execute(
+        "SELECT value_tier, COUNT(*) FROM crm_customer_snapshot "
+        "WHERE report_mth_eom = ? AND value_tier IS NOT NULL GROUP BY 1", (month,)))
+
+
+def check_parity(con, thresholds):
+    """Re-tier `con` with `thresholds`, then score the same report months from
+    scratch with run_crm_calculation.sql patched to them; returns a list of
+    mismatches in value_tier or in the monthly summary counts."""
+    months = [date.fromisoformat(m) for (m,) in con.execute(
+        "SELECT DISTINCT report_mth_eom FROM crm_customer_snapshot ORDER BY 1")]
+    t0 = time.time()
+    retier(con, thresholds)
+    t_retier = time.time() - t0
+    counts = "report_mth_eom, value_tier, lifecycle_event, activity_status, n_customers"
+    con.executescript(f"""
+        DROP TABLE IF EXISTS tt_check_tier;
+        CREATE TEMP TABLE tt_check_tier AS
+        SELECT report_mth_eom, customer_id, value_tier FROM crm_customer_snapshot;
+        DROP TABLE IF EXISTS tt_check_summary;
+        CREATE TEMP TABLE tt_check_summary AS SELECT {counts} FROM crm_monthly_summary;
+    """)
+
+    t0 = time.time()
+    calc_sql = (REPO / "db" / "run_crm_calculation.sql").read_text()
+    con.executescript(patch_report_months(patch_thresholds(calc_sql, thresholds), months))
+    con.execute("DELETE FROM crm_monthly_summary")
+    con.executescript((REPO / "db" / "refresh_crm_monthly_summary.sql").read_text())
+    t_build = time.time() - t0
+    n_rows = con.execute("SELECT COUNT(*) FROM crm_customer_snapshot").fetchone()[0]
+    print(f"retier {t_retier:.2f}s, calculation SQL {t_build:.2f}s, {n_rows:,} rows over {len(months)} months")
+
+    problems = []
+    n_retier = con.execute("SELECT COUNT(*) FROM tt_check_tier").fetchone()[0]
+    if n_retier != n_rows:
+        problems.append(f"row count {n_retier} != {n_rows}")
+    for month, customer, have, want in con.execute("""
+        SELECT s.report_mth_eom, s.customer_id, c.value_tier, s.value_tier
+        FROM crm_customer_snapshot s
+        JOIN tt_check_tier c USING (report_mth_eom, customer_id)
+        WHERE c.value_tier IS NOT s.value_tier
+        ORDER BY 1, 2
+    """):
+        problems.append(f"{month} customer {customer}: value_tier retier={have!r} build={want!r}")
+    for side, a, b in (("retier only", "tt_check_summary", "crm_monthly_summary"),
+                       ("build only", "crm_monthly_summary", "tt_check_summary")):
+        for row in con.execute(f"SELECT {counts} FROM {a} EXCEPT SELECT {counts} FROM {b} ORDER BY 1"):
+            problems.append(f"summary row {side}: {row}")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=str(DEFAULT_DB), help=f"SQLite database to re-tier (default: {DEFAULT_DB})")
+    for name in THRESHOLDS:
+        ap.add_argument(f"--{name.replace('_', '-')}", dest=name, type=float,
+                        help=f"new {name} (default: the value in effect)")
+    ap.add_argument("--reset", action="store_true",
+                    help="start from run_crm_calculation.sql's thresholds instead of the ones in effect")
+    ap.add_argument("--check", action="store_true",
+                    help="compare against a fresh scoring with the same thresholds; the file is not modified")
+    args = ap.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        ap.error(f"{db_path} does not exist; run db/build.py first")
+    if args.check:
+        src = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        con = sqlite3.connect(":memory:")
+        src.backup(con)
+        src.close()
+    else:
+        con = sqlite3.connect(db_path)
+    # A database built before crm_tier_thresholds existed gets the table here;
+    # only that statement of schema.sql runs, so the database keeps the index
+    # set its --index-strategy built.
+    con.execute(next(stmt for stmt in iter_statements((REPO / "db" / "schema.sql").read_text())
+                     if "CREATE TABLE IF NOT EXISTS crm_tier_thresholds" in stmt))
+
+    literals = sql_thresholds((REPO / "db" / "run_crm_calculation.sql").read_text())
+    current = applied_thresholds(con) or literals
+    thresholds = dict(literals if args.reset else current)
+    thresholds.update({name: getattr(args, name) for name in THRESHOLDS if getattr(args, name) is not None})
+
+    if args.check:
+        problems = check_parity(con, thresholds)
+        for p in problems[:20]:
+            print(f"  MISMATCH {p}")
+        if problems:
+            print(f"Parity FAILED: {len(problems):,} mismatches")
+            sys.exit(1)
+        print("Parity OK: retier matches a fresh scoring with run_crm_calculation.sql.")
+        return
+
+    latest = con.execute("SELECT MAX(report_mth_eom) FROM crm_customer_snapshot").fetchone()[0]
+    old_counts = tier_counts(con, latest)
+    t0 = time.time()
+    changed = retier(con, thresholds)
+    reset_journal_mode(con)
+    total = con.execute("SELECT COUNT(*) FROM crm_customer_snapshot").fetchone()[0]
+    print(f"Re-tiered {total:,} snapshot rows in {time.time() - t0:.2f}s; {changed:,} changed tier.")
+    print("Thresholds: " + ", ".join(
+        f"{k}={v:g}" + ("" if v == current[k] else f" (was {current[k]:g})") for k, v in thresholds.items()))
+
+    new_counts = tier_counts(con, latest)
+    print(f"\nValue tier in {latest}:")
+    for tier in TIERS:
+        print(f"  {tier:<10} {old_counts.get(tier, 0):>9,} -> {new_counts.get(tier, 0):>9,}")
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+-- retier_crm_snapshot.sql
+-- Re-scores value_tier of every report month in crm_customer_snapshot with
+-- the thresholds bound as :t_high .. :f_mid (the tier columns of tt_params).
+-- db/retier.py runs this statement in the transaction that also records the
+-- thresholds.
+--
+-- The tier reads only m12, m6 and o6, which the snapshot already holds, so
+-- no aggregate is recomputed: one UPDATE over the table rewrites just the
+-- rows whose tier changes. activity_status and lifecycle_event take no
+-- thresholds and are left as they are.
+--
+-- The CASE below is the one value-tier ladder with the thresholds as
+-- parameters: scripts/generate_data/verify.py --sweep scores with it too
+-- (db/retier.py tier_case()). It must stay in step with stage 5 of
+-- db/run_crm_calculation.sql; `python db/retier.py --check` compares the two.
+
+UPDATE crm_customer_snapshot AS s
+SET value_tier = r.value_tier
+FROM (
+    SELECT
+        rowid AS rid,
+        CASE
+            WHEN m12 = 0                                                           THEN NULL
+            WHEN m6  = 0                                                           THEN 'Passive'
+            WHEN (m6 / 6.0) >= :t_high
+                 AND o6 > 0
+                 AND (m6 / o6) >= :a_high
+                 AND o6        >= :f_high                                          THEN 'Diamond'
+            WHEN (m6 / 6.0) >= :t_high     AND o6 >= :f_mid                        THEN 'Platinum'
+            WHEN (m6 / 6.0) >= :t_mid_high                                         THEN 'Gold'
+            WHEN (m6 / 6.0) >= :t_mid                                              THEN 'Silver'
+            WHEN (m6 / 6.0) >  0                                                   THEN 'Bronze'
+            ELSE NULL
+        END AS value_tier
+    FROM crm_customer_snapshot
+) AS r
+WHERE s.rowid = r.rid
+  AND s.value_tier IS NOT r.value_tier;
@@ -1,15 +1,19 @@
 -- run_crm_calculation.sql
--- Builds the canonical CRM customer snapshot for a single report month, per
+-- Builds the canonical CRM customer snapshot for one or more report months, per
 -- docs/specs/crm_calculation_logic.md. Output: table `crm_customer_snapshot`.
 --
 -- Pipeline (top to bottom):
---   tt_params              parameter row(s): report month, tier thresholds, anonymous-group marker
---   tt_dates               start-of-month boundaries for the M1/M6/M12/M13/M24/M25 windows
+--   tt_params              parameter rows, one per report month: report month, tier thresholds, anonymous-group marker
+--   tt_dates               start-of-month boundaries for the M1/M6/M12/M13/M24/M25 windows, one row per report month
 --   tt_first_device_date   first `device` purchase date per customer
---   tt_consumable_lines    per-customer × per-month-bom consumption aggregates over consumable lines
---   tt_base_aggregates     per-customer M_total, M1, M6, M12, M13, M24, M25, O6, first/last consumable dates
+--   tt_base_aggregates     per-customer × per-report-month M_total, M1, M6, M12, M13, M24, M25, O6, first/last consumable dates
 --   crm_customer_snapshot  final output: identifiers, base aggregates, derived KPIs, status fields
 --
+-- Every stage is set-based over the report months in tt_params. Consumable
+-- activity is read from fact_customer_month, the per-customer × per-month-bom
+-- roll-up kept current by db/refresh_fact_customer_month.sql, which must have
+-- run against the loaded sales first.
+--
 -- Window convention (calendar months, inclusive of report month):
 --   M1  = report month                                  →  start = report_month_bom + 0  months
 --   M6  = report month and 5 prior calendar months      →  start = report_month_bom - 5  months
@@ -21,6 +25,7 @@
 -- Filters applied throughout:
 --   * only `category = 'consumable'` rows for all M-aggregates and O6 (the First Device Purchase Date is the sole device-based KPI).
 --   * only positive `quantity` (returns excluded, per §6.3).
+--   (both already applied when fact_customer_month is built)
 --   * customers whose `customer_group` matches the anonymous marker are excluded from the snapshot (per §6.4).
 --
 -- Tier thresholds are placeholders pending calibration on synthetic data.
@@ -34,9 +39,13 @@ BEGIN;
 -- =============================================================
 DROP TABLE IF EXISTS tt_params;
 CREATE TEMP TABLE tt_params AS
+WITH report_months(report_mth_eom) AS (
+    -- Report month-end(s). Override for historical re-runs; db/build.py
+    -- substitutes one row per month of the requested back-window.
+    VALUES ('2024-12-31')
+)
 SELECT
-    -- Report month-end. Override for historical re-runs.
-    '2024-12-31'  AS report_mth_eom,
+    rm.report_mth_eom,
 
     -- Anonymous / general customer-group marker (case-insensitive equality).
     'general'     AS anonymous_group,
@@ -54,7 +63,8 @@ SELECT
 
     -- Frequency gates: number of consumable orders in last 6 months.
         6         AS f_high,        -- Diamond
-        3         AS f_mid;         -- Platinum
+        3         AS f_mid          -- Platinum
+FROM report_months rm;
 
 
 -- =============================================================
@@ -91,70 +101,47 @@ GROUP BY s.customer_id;
 
 
 -- =============================================================
--- 4. CONSUMABLE LINES → MONTHLY ROLL-UP (per customer × month-of-purchase)
---    Pre-aggregation step that the time-window aggregates feed off.
---    "units" = quantity * unit_size (volume measure on the consumable).
--- =============================================================
-DROP TABLE IF EXISTS tt_consumable_lines;
-CREATE TEMP TABLE tt_consumable_lines AS
-SELECT
-    s.customer_id,
-    date(s.invoice_date, 'start of month') AS purchase_mth_bom,
-    s.invoice_date,
-    s.invoice_id,
-    s.quantity * p.unit_size               AS units
-FROM raw_sales_transactions s
-JOIN raw_products          p ON p.product_id = s.product_id
-WHERE p.category  = 'consumable'
-  AND s.quantity  > 0;
-
-
--- =============================================================
--- 5. BASE AGGREGATES (per customer)
---    The canonical M-fields, O6, and first/last consumable dates.
+-- 4. BASE AGGREGATES (per customer × report month)
+--    The canonical M-fields, O6, and first/last consumable dates, read off
+--    the fact_customer_month cube joined to the report months.
 -- =============================================================
 DROP TABLE IF EXISTS tt_base_aggregates;
 CREATE TEMP TABLE tt_base_aggregates AS
 SELECT
-    cl.customer_id,
+    cm.customer_id,
     d.report_mth_eom,
 
     -- Date KPIs
-    MIN(cl.invoice_date)                                                       AS first_consumable_purchase_date,
-    MAX(cl.invoice_date)                                                       AS last_consumable_purchase_date,
+    MIN(cm.first_consumable_date)                                              AS first_consumable_purchase_date,
+    MAX(cm.last_consumable_date)                                               AS last_consumable_purchase_date,
 
     -- Volume aggregates (units): cumulative windows ending at the report month
-    TOTAL(cl.units)                                                            AS m_total,
-    TOTAL(CASE WHEN cl.purchase_mth_bom >= d.m01_bom THEN cl.units ELSE 0 END) AS m1,
-    TOTAL(CASE WHEN cl.purchase_mth_bom >= d.m06_bom THEN cl.units ELSE 0 END) AS m6,
-    TOTAL(CASE WHEN cl.purchase_mth_bom >= d.m12_bom THEN cl.units ELSE 0 END) AS m12,
-    TOTAL(CASE WHEN cl.purchase_mth_bom >= d.m13_bom THEN cl.units ELSE 0 END) AS m13,
-    TOTAL(CASE WHEN cl.purchase_mth_bom >= d.m24_bom THEN cl.units ELSE 0 END) AS m24,
-    TOTAL(CASE WHEN cl.purchase_mth_bom >= d.m25_bom THEN cl.units ELSE 0 END) AS m25,
+    TOTAL(cm.units)                                                            AS m_total,
+    TOTAL(CASE WHEN cm.purchase_mth_bom >= d.m01_bom THEN cm.units ELSE 0 END) AS m1,
+    TOTAL(CASE WHEN cm.purchase_mth_bom >= d.m06_bom THEN cm.units ELSE 0 END) AS m6,
+    TOTAL(CASE WHEN cm.purchase_mth_bom >= d.m12_bom THEN cm.units ELSE 0 END) AS m12,
+    TOTAL(CASE WHEN cm.purchase_mth_bom >= d.m13_bom THEN cm.units ELSE 0 END) AS m13,
+    TOTAL(CASE WHEN cm.purchase_mth_bom >= d.m24_bom THEN cm.units ELSE 0 END) AS m24,
+    TOTAL(CASE WHEN cm.purchase_mth_bom >= d.m25_bom THEN cm.units ELSE 0 END) AS m25,
 
     -- Order count in last 6 months (distinct invoices on consumable, positive lines)
-    COUNT(DISTINCT CASE WHEN cl.purchase_mth_bom >= d.m06_bom THEN cl.invoice_id END) AS o6
-FROM tt_consumable_lines cl
+    SUM(CASE WHEN cm.purchase_mth_bom >= d.m06_bom THEN cm.n_invoices ELSE 0 END) AS o6
+FROM fact_customer_month cm
 CROSS JOIN tt_dates d
-GROUP BY cl.customer_id, d.report_mth_eom;
+GROUP BY cm.customer_id, d.report_mth_eom;
 
 
 -- =============================================================
--- 6. FINAL SNAPSHOT (per customer × report month)
+-- 5. FINAL SNAPSHOT (per customer × report month)
 --    Includes every non-anonymous customer in the master, even those with
 --    zero consumable purchases (they collapse to Not Active with NULL tier).
 -- =============================================================
 DROP TABLE IF EXISTS crm_customer_snapshot;
 CREATE TABLE crm_customer_snapshot AS
-WITH eligible_customers AS (
-    SELECT c.customer_id
-    FROM raw_customers c, tt_params p
-    WHERE LOWER(COALESCE(c.customer_group, '')) <> p.anonymous_group
-),
-joined AS (
+WITH joined AS (
     SELECT
         d.report_mth_eom,
-        ec.customer_id,
+        c.customer_id,
         fd.first_device_purchase_date,
         COALESCE(ba.first_consumable_purchase_date, NULL) AS first_consumable_purchase_date,
         COALESCE(ba.last_consumable_purchase_date,  NULL) AS last_consumable_purchase_date,
@@ -166,11 +153,15 @@ joined AS (
         COALESCE(ba.m24,     0) AS m24,
         COALESCE(ba.m25,     0) AS m25,
         COALESCE(ba.o6,      0) AS o6
-    FROM eligible_customers ec
-    CROSS JOIN tt_dates d
-    LEFT JOIN tt_first_device_date fd ON fd.customer_id = ec.customer_id
-    LEFT JOIN tt_base_aggregates   ba ON ba.customer_id = ec.customer_id
+    -- CROSS JOIN pins the loop order: month-major, then customer, so rows land
+    -- in the same physical order as one report month at a time.
+    FROM tt_dates d
+    CROSS JOIN raw_customers c
+    JOIN tt_params p ON p.report_mth_eom = d.report_mth_eom
+    LEFT JOIN tt_first_device_date fd ON fd.customer_id = c.customer_id
+    LEFT JOIN tt_base_aggregates   ba ON ba.customer_id = c.customer_id
                                      AND ba.report_mth_eom = d.report_mth_eom
+    WHERE LOWER(COALESCE(c.customer_group, '')) <> p.anonymous_group
 )
 SELECT
     j.report_mth_eom,
@@ -228,7 +219,7 @@ SELECT
         ELSE NULL
     END AS lifecycle_event
 FROM joined j
-CROSS JOIN tt_params p;
+JOIN tt_params p ON p.report_mth_eom = j.report_mth_eom;
 
 
 -- Helpful indexes for downstream dashboard queries.
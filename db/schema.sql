@@ -1,5 +1,6 @@
 -- schema.sql
--- SQLite schema for CRM project: raw (landing) tables only.
+-- SQLite schema for CRM project: raw (landing) tables, their load manifest,
+-- and the consumption cube derived from them.
 -- Notes:
 -- - We keep input structure as-is (no source_system / load_dttm fields).
 -- - invoice_id is NOT a PK, so we use a surrogate key (txn_id) for raw_sales_transactions.
@@ -87,4 +88,102 @@ CREATE INDEX IF NOT EXISTS ix_raw_products_category
 CREATE INDEX IF NOT EXISTS ix_raw_products_brand
     ON raw_products(brand);
 
+
+-- =========================
+-- FACT: Customer × Month consumption cube
+-- Consumable, positive-quantity lines rolled up per customer and month of
+-- purchase; maintained by db/refresh_fact_customer_month.sql and read by
+-- every M-window in db/run_crm_calculation.sql.
+-- =========================
+CREATE TABLE IF NOT EXISTS fact_customer_month (
+    customer_id           INTEGER NOT NULL,
+    purchase_mth_bom      TEXT NOT NULL,     -- ISO: YYYY-MM-01
+    units                 REAL NOT NULL,     -- SUM(quantity * unit_size)
+    n_invoices            INTEGER NOT NULL,  -- distinct invoices, each counted in its latest month (see refresh script)
+    first_consumable_date TEXT NOT NULL,     -- ISO: YYYY-MM-DD
+    last_consumable_date  TEXT NOT NULL,     -- ISO: YYYY-MM-DD
+
+    PRIMARY KEY (customer_id, purchase_mth_bom)
+) WITHOUT ROWID;
+
+
+-- =========================
+-- MONTHLY SUMMARY
+-- crm_customer_snapshot rolled up per report month × value tier × lifecycle
+-- event × activity status; maintained by db/refresh_crm_monthly_summary.sql
+-- and read by scripts/build_report.py. KPI averages are kept as sum + count
+-- of non-NULL values, so any roll-up of cells averages correctly as
+-- SUM(x_sum) / SUM(x_n).
+-- =========================
+CREATE TABLE IF NOT EXISTS crm_monthly_summary (
+    report_mth_eom  TEXT NOT NULL,           -- ISO: YYYY-MM-DD
+    value_tier      TEXT,                    -- NULL for customers without a tier
+    lifecycle_event TEXT,                    -- NULL when no event fired that month
+    activity_status TEXT NOT NULL,
+    n_customers     INTEGER NOT NULL,
+    amc_sum         REAL NOT NULL,           -- avg_monthly_consumption
+    amc_n           INTEGER NOT NULL,
+    aos_sum         REAL NOT NULL,           -- avg_order_size
+    aos_n           INTEGER NOT NULL,
+    o6_sum          INTEGER NOT NULL,
+    o6_n            INTEGER NOT NULL,
+    tenure_sum      INTEGER NOT NULL,        -- tenure_months
+    tenure_n        INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_crm_monthly_summary_month
+    ON crm_monthly_summary(report_mth_eom);
+
+
+-- =========================
+-- TIER THRESHOLDS
+-- At most one row: the value-tier thresholds db/retier.py last applied to
+-- crm_customer_snapshot, in place of the tt_params literals of
+-- db/run_crm_calculation.sql. db/build.py --incremental scores appended
+-- months with them; a full build starts over from the literals.
+-- =========================
+CREATE TABLE IF NOT EXISTS crm_tier_thresholds (
+    t_high      REAL NOT NULL,               -- Diamond / Platinum AMC floor
+    t_mid_high  REAL NOT NULL,               -- Gold AMC floor
+    t_mid       REAL NOT NULL,               -- Silver AMC floor
+    a_high      REAL NOT NULL,               -- Diamond average order size floor
+    f_high      REAL NOT NULL,               -- Diamond O6 floor
+    f_mid       REAL NOT NULL,               -- Platinum O6 floor
+    applied_at  TEXT NOT NULL                -- UTC timestamp: YYYY-MM-DD HH:MM:SS
+);
+
+
+-- =========================
+-- LOAD MANIFEST
+-- One row per input CSV, maintained by db/build.py. Sales files are
+-- append-only: `build.py --incremental` loads a file from bytes_loaded
+-- onwards, after checking the first bytes_loaded bytes still hash to the
+-- digest recorded for them.
+-- =========================
+CREATE TABLE IF NOT EXISTS load_manifest (
+    file_name    TEXT PRIMARY KEY NOT NULL,  -- basename under data/input/
+    bytes_loaded INTEGER NOT NULL,           -- file size when last loaded
+    rows_loaded  INTEGER NOT NULL,           -- data rows loaded from the file so far
+    sha256       TEXT NOT NULL,              -- digest of the first bytes_loaded bytes
+    loaded_at    TEXT NOT NULL               -- UTC timestamp: YYYY-MM-DD HH:MM:SS
+);
+
+
+-- =========================
+-- BUILD METRICS
+-- One row per stage of db/run_crm_calculation.sql per run of it, written
+-- by db/build.py. A set-based run covers every report month at once and
+-- leaves report_mth_eom NULL; --per-month runs record one row per month.
+-- =========================
+CREATE TABLE IF NOT EXISTS build_metrics (
+    run_id         INTEGER NOT NULL,         -- one per db/build.py invocation
+    recorded_at    TEXT NOT NULL,            -- UTC timestamp: YYYY-MM-DD HH:MM:SS
+    report_mth_eom TEXT,                     -- ISO: YYYY-MM-DD, NULL for a set-based run
+    stage_no       INTEGER NOT NULL,         -- banner number in run_crm_calculation.sql
+    stage_title    TEXT NOT NULL,
+    seconds        REAL NOT NULL,            -- wall-clock time of the stage's statements
+    rows_out       INTEGER,                  -- rows in the table the stage writes
+    query_plan     TEXT                      -- EXPLAIN QUERY PLAN of its statements
+);
+
 COMMIT;
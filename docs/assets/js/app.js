@@ -1,5 +1,12 @@
 // CRM Analytics dashboard — client-side app.
 // Loads docs/data.json, renders Plotly charts and a paginated/filterable customer table.
+// data.json carries the aggregates; the customer rows of each report month are
+// in a content-hashed shard under docs/data/, fetched when the month is shown.
+// Shards are columnar binary (see encode_customers in scripts/build_report.py)
+// and stay as typed arrays: row objects are only built for the visible page
+// and the CSV export. Each shard also gets one bitmap per chip value when it
+// is decoded, so the Segments filters are word-wise AND/OR over those bitmaps
+// and the table pages are read off the result by rank/select.
 
 const TIER_ORDER  = ["Diamond", "Platinum", "Gold", "Silver", "Bronze", "Passive"];
 const EVENT_ORDER = ["New", "Reactivated", "Lost"];
@@ -27,9 +34,21 @@ const DARK_LAYOUT = {
 
 const PAGE_SIZE = 50;
 
+const SHARD_MAGIC = 0x324D5243;   // "CRM2", little-endian
+const SHARD_ARRAYS = { int16: Int16Array, int32: Int32Array, float32: Float32Array,
+                       uint8: Uint8Array, uint16: Uint16Array };
+const SHARD_NULL   = { int16: -32768, int32: -2147483648 };
+const NAME_DECODER = new TextDecoder();
+const DAY_MS = 86400000;
+
+// Dictionary columns behind the Segments chip sets (state.filters keys).
+const FILTER_KEYS = ["activity", "tier", "event", "group"];
+
 const state = {
   data: null,
   month: null,
+  customers: null,        // decoded shard of state.month once it has loaded
+  shards: new Map(),      // month -> Promise of its customer rows
   filters: { activity: new Set(["Active"]), tier: new Set(), event: new Set(), group: new Set() },
   page: 0,
 };
@@ -80,7 +99,7 @@ function buildMonthSelect() {
 }
 
 function buildFilters() {
-  const groups = Array.from(new Set(state.data.customers.map(c => c.group))).sort();
+  const groups = state.data.customer_groups;
   buildChips("filter-activity", ["Active", "Not Active"], state.filters.activity);
   buildChips("filter-tier",     TIER_ORDER,                state.filters.tier);
   buildChips("filter-event",    EVENT_ORDER,               state.filters.event);
@@ -149,7 +168,10 @@ function bindPager() {
 
 function bindCsvDownload() {
   document.getElementById("csv-download").addEventListener("click", () => {
-    const rows = filteredCustomers();
+    if (!state.customers) return;
+    const shard = state.customers;
+    applyFilters(shard, state.filters);
+    const rows = Array.from(selectRows(shard, 0, shard.count), i => customerRow(shard, i));
     const cols = ["customer_id","name","group","city","activity","tier","event",
                   "tenure_months","amc","aos","o6","first_purchase","last_purchase"];
     const lines = [cols.join(",")];
@@ -173,12 +195,108 @@ function csvCell(v) {
 
 // ==================================================================== render
 function render() {
+  const agg = getMonthAggregate(state.month);
   document.getElementById("month-meta").textContent =
-    `${state.data.report_months.length} months loaded · ${state.data.customers.length.toLocaleString()} customers in latest month`;
+    `${state.data.report_months.length} months loaded · ${agg ? agg.total_customers.toLocaleString() : 0} customers in ${state.month}`;
   renderOverview();
-  renderSegments();
   renderLifecycle();
   renderProducts();
+  showCustomers(state.month);
+}
+
+// Shards are named by content hash, so the browser cache may keep them for good.
+function loadCustomers(month) {
+  if (!state.shards.has(month)) {
+    const shard = fetch(state.data.customer_shards[month]).then(resp => {
+      if (!resp.ok) throw new Error(`${resp.status} ${resp.statusText}`);
+      return resp.arrayBuffer();
+    }).then(decodeCustomers);
+    shard.catch(() => state.shards.delete(month));   // retry on the next visit
+    state.shards.set(month, shard);
+  }
+  return state.shards.get(month);
+}
+
+async function showCustomers(month) {
+  state.customers = null;
+  renderSegments();
+  let shard;
+  try {
+    shard = await loadCustomers(month);
+  } catch (e) {
+    if (month === state.month) renderSegmentsMessage(`Failed to load customers for ${month}: ${e}`);
+    return;
+  }
+  if (month !== state.month) return;   // another month was picked meanwhile
+  state.customers = shard;
+  renderSegments();
+}
+
+// Views the column blocks of a shard in place: { n, cols, dicts, dayCols, names }.
+function decodeCustomers(buf) {
+  const view = new DataView(buf);
+  if (buf.byteLength < 8 || view.getUint32(0, true) !== SHARD_MAGIC) {
+    throw new Error("not a customer shard");
+  }
+  const headLen = view.getUint32(4, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 8, headLen)));
+  const base = 8 + headLen;
+  const shard = { n: header.rows, cols: {}, nulls: {}, dicts: {}, dayCols: new Set() };
+  header.columns.forEach(c => {
+    shard.cols[c.key] = new SHARD_ARRAYS[c.type](buf, base + c.offset, header.rows);
+    if (c.type in SHARD_NULL) shard.nulls[c.key] = SHARD_NULL[c.type];
+    if (c.dict) shard.dicts[c.key] = c.dict;
+    if (c.encoding === "days") shard.dayCols.add(c.key);
+  });
+  shard.names = {
+    bytes: new Uint8Array(buf, base + header.names.offset, header.names.length),
+    ends:  new Int32Array(buf, base + header.names.ends, header.rows),   // end offset of row i's name
+    nulls: new Set(header.names.nulls),
+  };
+  indexFilters(shard);
+  return shard;
+}
+
+// One-time filter index of a shard: shard.bitmaps[key][code] has bit i set when
+// row i holds that code. The match / scratch / rank buffers are allocated here
+// once and reused by every applyFilters() call.
+function indexFilters(shard) {
+  const words = (shard.n + 31) >>> 5;
+  shard.words = words;
+  shard.bitmaps = {};
+  FILTER_KEYS.forEach(key => {
+    const codes = shard.cols[key];
+    const maps = shard.dicts[key].map(() => new Uint32Array(words));
+    for (let i = 0; i < shard.n; i++) maps[codes[i]][i >>> 5] |= 1 << (i & 31);
+    shard.bitmaps[key] = maps;
+  });
+  shard.match   = new Uint32Array(words);
+  shard.scratch = new Uint32Array(words);
+  shard.rank    = new Uint32Array(words + 1);   // rank[w]: matching rows before word w
+  shard.count   = 0;
+  shard.filteredFor = null;
+}
+
+// Name of row i, decoded from the shard's string table on demand.
+function customerName(shard, i) {
+  const { bytes, ends, nulls } = shard.names;
+  if (nulls.has(i)) return null;
+  return NAME_DECODER.decode(bytes.subarray(i ? ends[i - 1] : 0, ends[i]));
+}
+
+// Row i of a shard as the plain object the table and CSV export use.
+function customerRow(shard, i) {
+  const row = { name: customerName(shard, i) };
+  for (const key in shard.cols) {
+    const v = shard.cols[key][i];
+    if (shard.dicts[key])              row[key] = shard.dicts[key][v];
+    else if (v === shard.nulls[key])   row[key] = null;
+    else if (shard.dayCols.has(key))   row[key] = new Date(v * DAY_MS).toISOString().slice(0, 10);
+    else if (Number.isNaN(v))          row[key] = null;
+    else if (key in shard.nulls)       row[key] = v;
+    else                               row[key] = Math.round(v * 10) / 10;   // float32 back to 1 dp
+  }
+  return row;
 }
 
 function getMonthAggregate(m) {
@@ -245,25 +363,86 @@ function renderOverview() {
 }
 
 // -------------------------------------------------------------------- Segments
-function filteredCustomers() {
-  const f = state.filters;
-  return state.data.customers.filter(c => {
-    if (f.activity.size && !f.activity.has(c.activity))                  return false;
-    if (f.tier.size     && (c.tier === null || !f.tier.has(c.tier)))     return false;
-    if (f.event.size    && (c.event === null || !f.event.has(c.event)))  return false;
-    if (f.group.size    && !f.group.has(c.group))                        return false;
-    return true;
+function popcount32(v) {
+  v -= (v >>> 1) & 0x55555555;
+  v = (v & 0x33333333) + ((v >>> 2) & 0x33333333);
+  return (((v + (v >>> 4)) & 0x0F0F0F0F) * 0x01010101) >>> 24;
+}
+
+// Brings shard.match / rank / count up to date with the chip filters: within a
+// chip set the selected values' bitmaps are ORed, across sets the results are
+// ANDed. A NULL label never passes an active filter. No-op while the
+// selection is the one the shard was last filtered for.
+function applyFilters(shard, filters) {
+  const key = FILTER_KEYS.map(k => [...filters[k]].sort().join("\u0001")).join("\u0002");
+  if (key === shard.filteredFor) return;
+  const { words, match, scratch, rank } = shard;
+
+  match.fill(0xFFFFFFFF);
+  if (shard.n & 31) match[words - 1] = (1 << (shard.n & 31)) - 1;
+  FILTER_KEYS.forEach(k => {
+    const selected = filters[k];
+    if (!selected.size) return;
+    scratch.fill(0);
+    shard.dicts[k].forEach((label, code) => {
+      if (label === null || !selected.has(label)) return;
+      const map = shard.bitmaps[k][code];
+      for (let w = 0; w < words; w++) scratch[w] |= map[w];
+    });
+    for (let w = 0; w < words; w++) match[w] &= scratch[w];
   });
+
+  for (let w = 0; w < words; w++) rank[w + 1] = rank[w] + popcount32(match[w]);
+  shard.count = rank[words];
+  shard.filteredFor = key;
+}
+
+// Indexes of the matching rows number start .. start+count-1 (in shard order):
+// binary search of the rank prefix for the first word, then a walk of its set bits.
+function selectRows(shard, start, count) {
+  const out = new Int32Array(Math.max(0, Math.min(count, shard.count - start)));
+  if (!out.length) return out;
+  const { match, rank } = shard;
+  let lo = 0, hi = shard.words - 1;
+  while (lo < hi) {
+    const mid = (lo + hi + 1) >>> 1;
+    if (rank[mid] <= start) lo = mid; else hi = mid - 1;
+  }
+  let skip = start - rank[lo];
+  let k = 0;
+  for (let w = lo; k < out.length; w++) {
+    let bits = match[w];
+    while (bits && k < out.length) {
+      const low = bits & -bits;
+      bits ^= low;
+      if (skip) { skip--; continue; }
+      out[k++] = (w << 5) | (31 - Math.clz32(low));
+    }
+  }
+  return out;
+}
+
+function renderSegmentsMessage(text) {
+  document.getElementById("filter-count").textContent = "…";
+  document.querySelector("#customer-table tbody").innerHTML =
+    `<tr><td colspan="13" class="text-center text-muted py-4">${escapeHtml(text)}</td></tr>`;
+  document.getElementById("page-info").textContent = "";
+  document.getElementById("page-prev").disabled = true;
+  document.getElementById("page-next").disabled = true;
 }
 
 function renderSegments() {
-  const rows = filteredCustomers();
-  document.getElementById("filter-count").textContent = rows.length.toLocaleString();
+  if (!state.customers) {
+    renderSegmentsMessage(`Loading customers for ${state.month} …`);
+    return;
+  }
+  const shard = state.customers;
+  applyFilters(shard, state.filters);
+  document.getElementById("filter-count").textContent = shard.count.toLocaleString();
 
-  const totalPages = Math.max(1, Math.ceil(rows.length / PAGE_SIZE));
+  const totalPages = Math.max(1, Math.ceil(shard.count / PAGE_SIZE));
   if (state.page >= totalPages) state.page = totalPages - 1;
-  const startIx = state.page * PAGE_SIZE;
-  const slice = rows.slice(startIx, startIx + PAGE_SIZE);
+  const slice = Array.from(selectRows(shard, state.page * PAGE_SIZE, PAGE_SIZE), i => customerRow(shard, i));
 
   const tbody = document.querySelector("#customer-table tbody");
   tbody.innerHTML = "";
@@ -288,7 +467,7 @@ function renderSegments() {
   });
 
   document.getElementById("page-info").textContent =
-    `Page ${state.page + 1} of ${totalPages} · ${rows.length.toLocaleString()} rows`;
+    `Page ${state.page + 1} of ${totalPages} · ${shard.count.toLocaleString()} rows`;
   document.getElementById("page-prev").disabled = state.page === 0;
   document.getElementById("page-next").disabled = state.page >= totalPages - 1;
 }
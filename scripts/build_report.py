@@ -3,28 +3,84 @@ Build the static GitHub Pages site under docs/.
 
 Reads from data/input/crm.db (built by db/build.py) and writes:
 
-  docs/data.json            aggregated CRM snapshot for the JS to consume
-  docs/screenshots/*.png    per-chart PNG previews (used in README + as fallback)
-  docs/specs/*.html         each docs/specs/*.md rendered as a styled HTML page
+  docs/data.json            manifest: monthly aggregates, product mix and the
+                            file name of each month's customer shard
+  docs/data/customers-YYYY-MM.<hash>.bin
+                            one report month of the customer table in a
+                            columnar binary encoding (encode_customers),
+                            named by content hash so it can be cached for good
+  docs/screenshots/*.png    per-chart PNG previews (used in README + as fallback);
+                            only re-rendered when their input changed
+  docs/specs/*.html         each docs/specs/*.md rendered as a styled HTML page;
+                            only rewritten when the source or template changed
+
+Each stage imports its heavy dependencies itself (plotly + kaleido for the
+screenshots, markdown for the specs), so --only data never loads them.
+Without the data stage, the screenshots are drawn from the existing
+docs/data.json.
 
 Usage:
     python scripts/build_report.py
+    python scripts/build_report.py --only data
+    python scripts/build_report.py --only screenshots,specs
 """
 
+import argparse
+import hashlib
+import inspect
 import json
+import math
+import os
 import sqlite3
 import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
 from pathlib import Path
 
-import markdown
-import plotly.express as px
-import plotly.graph_objects as go
-
 REPO = Path(__file__).resolve().parents[1]
 DB = REPO / "data" / "input" / "crm.db"
 DOCS = REPO / "docs"
 SCREENSHOTS = DOCS / "screenshots"
 SPECS = DOCS / "specs"
+SHARD_DIR = "data"                  # customer shards, relative to DOCS
+SCREENSHOT_MANIFEST = SCREENSHOTS / ".render-cache.json"
+SPEC_MANIFEST = SPECS / ".render-cache.json"
+SPEC_EXTENSIONS = ["tables", "fenced_code", "toc"]
+SPEC_PARALLEL_MIN = 8               # specs to re-render before using a process pool
+
+STAGES = ("data", "screenshots", "specs")
+
+# data.json is fetched before anything renders; the customer rows live in the
+# per-month shards so its size depends on the number of months only.
+FIRST_PAINT_BUDGET = 256 * 1024
+
+# Customer shard encoding, decoded by decodeCustomers() in docs/assets/js/app.js:
+#   b"CRM1", uint32 header length, JSON header, then the column blocks, each
+#   little-endian and starting on an 8-byte boundary (offsets in the header
+#   are relative to the first block).
+# Column kinds: int (int16 when every value of the shard fits, else int32;
+# NULL is the type's minimum), float32 (NULL as NaN), dict (uint8 or uint16
+# codes into a per-shard label list, NULL included as a label) and days (an
+# int column of days since 1970-01-01). Names follow as one UTF-8 string
+# table: the names back to back, an int32 block with each row's end offset in
+# it, and the rows whose name is NULL listed in the header.
+SHARD_MAGIC = b"CRM2"
+SHARD_COLUMNS = [
+    ("customer_id",    "int"),
+    ("group",          "dict"),
+    ("city",           "dict"),
+    ("activity",       "dict"),
+    ("tier",           "dict"),
+    ("event",          "dict"),
+    ("tenure_months",  "int"),
+    ("amc",            "float32"),
+    ("aos",            "float32"),
+    ("o6",             "int"),
+    ("first_purchase", "days"),
+    ("last_purchase",  "days"),
+]
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
 
 TIER_ORDER = ["Diamond", "Platinum", "Gold", "Silver", "Bronze", "Passive"]
 TIER_COLORS = {
@@ -53,100 +109,107 @@ DARK_LAYOUT = dict(
 
 
 # ---------------------------------------------------------------- queries
-def fetch_aggregates(con):
-    months = [r[0] for r in con.execute(
-        "SELECT DISTINCT report_mth_eom FROM crm_customer_snapshot ORDER BY 1"
-    )]
-
-    aggregates = []
-    for m in months:
-        tier_mix = {t: 0 for t in TIER_ORDER}
-        for r in con.execute("""
-            SELECT value_tier, COUNT(*) FROM crm_customer_snapshot
-            WHERE report_mth_eom = ? AND activity_status = 'Active' AND value_tier IS NOT NULL
-            GROUP BY 1
-        """, (m,)):
-            tier_mix[r[0]] = r[1]
-
-        events = {"New": 0, "Lost": 0, "Reactivated": 0}
-        for r in con.execute("""
-            SELECT lifecycle_event, COUNT(*) FROM crm_customer_snapshot
-            WHERE report_mth_eom = ? AND lifecycle_event IS NOT NULL
-            GROUP BY 1
-        """, (m,)):
-            events[r[0]] = r[1]
-
-        activity = {"Active": 0, "Not Active": 0}
-        for r in con.execute("""
-            SELECT activity_status, COUNT(*) FROM crm_customer_snapshot
-            WHERE report_mth_eom = ? GROUP BY 1
-        """, (m,)):
-            activity[r[0]] = r[1]
-
-        kpi_by_tier = {}
-        for r in con.execute("""
-            SELECT value_tier,
-                   COUNT(*),
-                   AVG(avg_monthly_consumption),
-                   AVG(avg_order_size),
-                   AVG(o6),
-                   AVG(tenure_months)
-            FROM crm_customer_snapshot
-            WHERE report_mth_eom = ? AND activity_status = 'Active' AND value_tier IS NOT NULL
-            GROUP BY 1
-        """, (m,)):
-            kpi_by_tier[r[0]] = {
-                "n":      r[1],
-                "amc":    round(r[2], 1) if r[2] is not None else None,
-                "aos":    round(r[3], 1) if r[3] is not None else None,
-                "o6":     round(r[4], 1) if r[4] is not None else None,
-                "tenure": round(r[5], 1) if r[5] is not None else None,
+def r1(x):
+    return round(x, 1) if x is not None else None
+
+
+def fetch_monthly(con):
+    """Per-report-month counters and KPI averages, pivoted out of
+    crm_monthly_summary (a few rows per month, kept by db/build.py) rather
+    than recomputed from the customer-level snapshot."""
+    monthly = {}
+
+    def month(m):
+        if m not in monthly:
+            monthly[m] = {
+                "tier_mix":   {t: 0 for t in TIER_ORDER},
+                "events":     {"New": 0, "Lost": 0, "Reactivated": 0},
+                "activity":   {"Active": 0, "Not Active": 0},
+                "kpi_by_tier": {},
+                "tenure_sum": 0,
+                "tenure_n":   0,
             }
+        return monthly[m]
+
+    # Head counts per (month, tier, event, activity) cell, with the tenure
+    # sum and count behind the month's average tenure.
+    for m, tier, event, activity, n, tenure_sum, tenure_n in con.execute("""
+        SELECT report_mth_eom, value_tier, lifecycle_event, activity_status,
+               n_customers, tenure_sum, tenure_n
+        FROM crm_monthly_summary
+    """):
+        agg = month(m)
+        agg["activity"][activity] = agg["activity"].get(activity, 0) + n
+        if event is not None:
+            agg["events"][event] = agg["events"].get(event, 0) + n
+        if activity == "Active" and tier is not None:
+            agg["tier_mix"][tier] = agg["tier_mix"].get(tier, 0) + n
+        agg["tenure_sum"] += tenure_sum
+        agg["tenure_n"] += tenure_n
+
+    # KPI averages of the active customers per (month, tier), merged from the
+    # per-cell sums and counts.
+    for m, tier, n, amc, aos, o6, tenure in con.execute("""
+        SELECT report_mth_eom, value_tier,
+               SUM(n_customers),
+               TOTAL(amc_sum) / NULLIF(SUM(amc_n), 0),
+               TOTAL(aos_sum) / NULLIF(SUM(aos_n), 0),
+               TOTAL(o6_sum) / NULLIF(SUM(o6_n), 0),
+               TOTAL(tenure_sum) / NULLIF(SUM(tenure_n), 0)
+        FROM crm_monthly_summary
+        WHERE activity_status = 'Active' AND value_tier IS NOT NULL
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    """):
+        month(m)["kpi_by_tier"][tier] = {
+            "n": n, "amc": r1(amc), "aos": r1(aos), "o6": r1(o6), "tenure": r1(tenure),
+        }
 
-        total = activity["Active"] + activity["Not Active"]
-        avg_tenure = con.execute("""
-            SELECT AVG(tenure_months) FROM crm_customer_snapshot
-            WHERE report_mth_eom = ? AND tenure_months IS NOT NULL
-        """, (m,)).fetchone()[0]
-
+    aggregates = []
+    for m in sorted(monthly):
+        agg = monthly[m]
         aggregates.append({
             "month": m,
-            "total_customers": total,
-            "tier_mix": tier_mix,
-            "events": events,
-            "activity": activity,
-            "kpi_by_tier": kpi_by_tier,
-            "avg_tenure_months": round(avg_tenure, 1) if avg_tenure is not None else None,
+            "total_customers": agg["activity"]["Active"] + agg["activity"]["Not Active"],
+            "tier_mix": agg["tier_mix"],
+            "events": agg["events"],
+            "activity": agg["activity"],
+            "kpi_by_tier": agg["kpi_by_tier"],
+            "avg_tenure_months": r1(agg["tenure_sum"] / agg["tenure_n"]) if agg["tenure_n"] else None,
         })
+    return aggregates
 
-    latest = months[-1]
 
-    customers = []
-    for r in con.execute("""
-        SELECT s.customer_id, c.customer_name, c.customer_group, c.city,
+def customer_rows(con, month):
+    """Cursor over the customer table of one report month: one tuple per
+    customer, in SHARD_COLUMNS order followed by the name."""
+    return con.execute("""
+        SELECT s.customer_id, c.customer_group, c.city,
                s.activity_status, s.value_tier, s.lifecycle_event,
                s.tenure_months, s.avg_monthly_consumption, s.avg_order_size, s.o6,
-               s.first_consumable_purchase_date, s.last_consumable_purchase_date
+               s.first_consumable_purchase_date, s.last_consumable_purchase_date,
+               c.customer_name
         FROM crm_customer_snapshot s
         JOIN raw_customers c USING(customer_id)
         WHERE s.report_mth_eom = ?
         ORDER BY s.avg_monthly_consumption DESC NULLS LAST, s.customer_id
-    """, (latest,)):
-        customers.append({
-            "customer_id":          r[0],
-            "name":                 r[1],
-            "group":                r[2],
-            "city":                 r[3],
-            "activity":             r[4],
-            "tier":                 r[5],
-            "event":                r[6],
-            "tenure_months":        r[7],
-            "amc":                  round(r[8], 1) if r[8] is not None else None,
-            "aos":                  round(r[9], 1) if r[9] is not None else None,
-            "o6":                   r[10],
-            "first_purchase":       r[11],
-            "last_purchase":        r[12],
-        })
+    """, (month,))
+
+
+def fetch_aggregates(con):
+    aggregates = fetch_monthly(con)
+    months = [a["month"] for a in aggregates]
+
+    latest = months[-1]
+
+    # Filter chips for the customer table, before any shard is loaded.
+    customer_groups = [r[0] for r in con.execute("""
+        SELECT DISTINCT c.customer_group
+        FROM crm_customer_snapshot s
+        JOIN raw_customers c USING(customer_id)
+        WHERE s.report_mth_eom = ?
+        ORDER BY 1
+    """, (latest,))]
 
     brand_units = []
     for r in con.execute("""
@@ -173,14 +236,130 @@ def fetch_aggregates(con):
         "report_months": months,
         "latest_month":  latest,
         "monthly":       aggregates,
-        "customers":     customers,
+        "customer_groups": customer_groups,
         "brand_units":   brand_units,
         "category_lines": category_lines,
     }
 
 
+INT32_NULL, INT16_NULL = -2**31, -2**15
+
+
+def encode_customers(rows):
+    """Encode the rows of customer_rows() as a columnar shard (see
+    SHARD_COLUMNS); returns the file content.
+
+    Rows are consumed one at a time straight into per-column arrays, so
+    memory is bounded by the encoded shard, not by a Python object per
+    customer. Dictionary columns are coded in order of first appearance and
+    renumbered into sorted label order at the end; int columns are collected
+    as int32 and narrowed to int16 at the end when every value fits.
+    """
+    kinds = [kind for _, kind in SHARD_COLUMNS]
+    cols = [array("I" if kind == "dict" else "f" if kind == "float32" else "i") for kind in kinds]
+    seen = [{} if kind == "dict" else None for kind in kinds]
+    names, name_ends, null_names = bytearray(), array("i"), []
+    n = 0
+
+    for r in rows:
+        for j, kind in enumerate(kinds):
+            v = r[j]
+            if kind == "dict":
+                code = seen[j].get(v)
+                if code is None:
+                    code = seen[j][v] = len(seen[j])
+                cols[j].append(code)
+            elif kind == "float32":
+                cols[j].append(math.nan if v is None else round(v, 1))
+            elif v is None:
+                cols[j].append(INT32_NULL)
+            elif kind == "days":
+                cols[j].append(date.fromisoformat(v).toordinal() - EPOCH_ORDINAL)
+            else:
+                cols[j].append(v)
+        if r[-1] is None:
+            null_names.append(n)
+        else:
+            names += r[-1].encode("utf-8")
+        name_ends.append(len(names))
+        n += 1
+
+    header = {"rows": n, "columns": []}
+    blocks, offset = [], 0
+
+    def add_block(data):
+        nonlocal offset
+        start = offset
+        blocks.append(data + b"\0" * (-len(data) % 8))
+        offset += len(blocks[-1])
+        return start
+
+    for (key, kind), arr, labels_seen in zip(SHARD_COLUMNS, cols, seen):
+        col = {"key": key}
+        if kind == "dict":
+            labels = sorted(labels_seen, key=lambda v: (v is not None, v or ""))
+            rank = {v: i for i, v in enumerate(labels)}
+            renumber = [rank[v] for v in labels_seen]   # first-seen code -> sorted code
+            typecode, col["type"], col["dict"] = ("B", "uint8", labels) if len(labels) <= 256 \
+                else ("H", "uint16", labels)
+            arr = array(typecode, map(renumber.__getitem__, arr))
+        elif kind == "float32":
+            col["type"] = "float32"
+        else:
+            if kind == "days":
+                col["encoding"] = "days"
+            if all(-2**15 < v < 2**15 for v in arr if v != INT32_NULL):
+                col["type"] = "int16"
+                arr = array("h", (INT16_NULL if v == INT32_NULL else v for v in arr))
+            else:
+                col["type"] = "int32"
+        if sys.byteorder == "big":
+            arr.byteswap()
+        col["offset"] = add_block(arr.tobytes())
+        header["columns"].append(col)
+
+    if sys.byteorder == "big":
+        name_ends.byteswap()
+    header["names"] = {"offset": add_block(bytes(names)), "length": len(names),
+                       "ends": add_block(name_ends.tobytes()), "nulls": null_names}
+
+    head = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    head += b" " * (-(len(head) + 8) % 8)
+    return SHARD_MAGIC + len(head).to_bytes(4, "little") + head + b"".join(blocks)
+
+
+def write_data(con, docs_dir=DOCS):
+    """Write one customer shard per report month and then data.json, which
+    maps each month to its shard; returns the data.json payload. A shard is
+    named by the hash of its content and only written when new; shards no
+    longer referenced are removed."""
+    data = fetch_aggregates(con)
+    shard_dir = Path(docs_dir) / SHARD_DIR
+    shard_dir.mkdir(parents=True, exist_ok=True)
+
+    shards = {}
+    for m in data["report_months"]:
+        payload = encode_customers(customer_rows(con, m))
+        name = f"customers-{m[:7]}.{hashlib.sha256(payload).hexdigest()[:12]}.bin"
+        if not (shard_dir / name).exists():
+            (shard_dir / name).write_bytes(payload)
+        shards[m] = f"{SHARD_DIR}/{name}"
+    for path in shard_dir.glob("customers-*"):
+        if f"{SHARD_DIR}/{path.name}" not in shards.values():
+            path.unlink()
+
+    data["customer_shards"] = shards
+    payload = json.dumps(data, separators=(",", ":"), default=str)
+    (Path(docs_dir) / "data.json").write_text(payload, encoding="utf-8")
+    return payload
+
+
 # ---------------------------------------------------------------- screenshots
+# Plotly (and Kaleido, behind write_image) are imported by each renderer, so
+# they are only loaded when a chart is actually re-rendered.
 def screenshot_tier_donut(latest_agg, out_path):
+    import plotly.graph_objects as go
+
     items = [(t, latest_agg["tier_mix"][t]) for t in TIER_ORDER if latest_agg["tier_mix"][t] > 0]
     fig = go.Figure(data=[go.Pie(
         labels=[i[0] for i in items],
@@ -195,6 +374,8 @@ def screenshot_tier_donut(latest_agg, out_path):
 
 
 def screenshot_events_bar(latest_agg, out_path):
+    import plotly.graph_objects as go
+
     items = [(e, latest_agg["events"][e]) for e in ["New", "Reactivated", "Lost"]]
     fig = go.Figure(data=[go.Bar(
         x=[i[0] for i in items],
@@ -209,6 +390,8 @@ def screenshot_events_bar(latest_agg, out_path):
 
 
 def screenshot_tier_trend(monthly, out_path):
+    import plotly.graph_objects as go
+
     fig = go.Figure()
     for tier in TIER_ORDER:
         ys = [m["tier_mix"][tier] for m in monthly]
@@ -224,6 +407,8 @@ def screenshot_tier_trend(monthly, out_path):
 
 
 def screenshot_events_trend(monthly, out_path):
+    import plotly.graph_objects as go
+
     fig = go.Figure()
     for evt in ["New", "Reactivated", "Lost"]:
         fig.add_trace(go.Scatter(
@@ -240,6 +425,8 @@ def screenshot_events_trend(monthly, out_path):
 
 
 def screenshot_brand_units(brand_units, out_path):
+    import plotly.graph_objects as go
+
     fig = go.Figure(data=[go.Bar(
         x=[b["brand"] for b in brand_units],
         y=[b["units"] for b in brand_units],
@@ -252,6 +439,81 @@ def screenshot_brand_units(brand_units, out_path):
     fig.write_image(out_path, width=900, height=480, scale=2)
 
 
+# (file, renderer, input): input names the part of data.json the chart is drawn from.
+SCREENSHOT_CHARTS = [
+    ("tier_mix.png",     screenshot_tier_donut,   "latest"),
+    ("events_bar.png",   screenshot_events_bar,   "latest"),
+    ("tier_trend.png",   screenshot_tier_trend,   "monthly"),
+    ("events_trend.png", screenshot_events_trend, "monthly"),
+    ("brand_units.png",  screenshot_brand_units,  "brand_units"),
+]
+
+
+def screenshot_key(render, chart_input):
+    """Content hash of everything a screenshot depends on: its input data,
+    the renderer's source (traces, layout, image size) and the shared style
+    constants."""
+    blob = json.dumps([chart_input, inspect.getsource(render),
+                       DARK_LAYOUT, TIER_ORDER, TIER_COLORS, EVENT_COLORS],
+                      sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def file_sha256(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def render_screenshot(render, chart_input, out_path):
+    """Pool worker: render one PNG via a temporary file; returns its hash."""
+    out_path = Path(out_path)
+    tmp = out_path.with_name(f".{out_path.stem}.tmp{out_path.suffix}")
+    render(chart_input, tmp)
+    os.replace(tmp, out_path)
+    return file_sha256(out_path)
+
+
+def render_screenshots(data, out_dir=SCREENSHOTS, jobs=None):
+    """Render the screenshots whose input changed since the last run.
+
+    A chart is skipped when its PNG still has the hash recorded in the
+    manifest next to screenshot_key() of the current data; the rest are
+    rendered in a process pool of up to `jobs` workers (default: one per
+    CPU), each with its own Kaleido export. Returns (rendered, skipped).
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / SCREENSHOT_MANIFEST.name
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    inputs = {"latest": data["monthly"][-1], "monthly": data["monthly"],
+              "brand_units": data["brand_units"]}
+
+    todo, skipped = [], []
+    for name, render, input_name in SCREENSHOT_CHARTS:
+        key = screenshot_key(render, inputs[input_name])
+        cached = manifest.get(name)
+        out_path = out_dir / name
+        if (cached and cached["key"] == key and out_path.exists()
+                and file_sha256(out_path) == cached["sha256"]):
+            skipped.append(name)
+        else:
+            todo.append((name, render, inputs[input_name], key))
+
+    jobs = min(len(todo), jobs or os.cpu_count() or 1)
+    try:
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = [(name, key, pool.submit(render_screenshot, render, chart_input, out_dir / name))
+                           for name, render, chart_input, key in todo]
+                for name, key, future in futures:
+                    manifest[name] = {"key": key, "sha256": future.result()}
+        else:
+            for name, render, chart_input, key in todo:
+                manifest[name] = {"key": key, "sha256": render_screenshot(render, chart_input, out_dir / name)}
+    finally:
+        manifest_path.write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n")
+    return [name for name, *_ in todo], skipped
+
+
 # ---------------------------------------------------------------- markdown -> html
 SPEC_TEMPLATE = """<!doctype html>
 <html lang="en" data-bs-theme="dark">
@@ -291,57 +553,143 @@ SPEC_TEMPLATE = """<!doctype html>
 """
 
 
-def render_specs():
-    SPECS.mkdir(parents=True, exist_ok=True)
-    md = markdown.Markdown(extensions=["tables", "fenced_code", "toc"])
-    for src in sorted(SPECS.glob("*.md")):
-        body = md.convert(src.read_text(encoding="utf-8"))
-        # Use the first H1 as the title, fallback to the filename.
-        first_h1 = body.split("<h1", 1)
-        if len(first_h1) > 1:
-            text = first_h1[1].split(">", 1)[1].split("</h1>", 1)[0]
-            title = text.strip()
+def spec_key(src_text):
+    """Content hash of everything a spec page depends on: the Markdown source,
+    the page template and the Markdown renderer and extensions."""
+    import markdown
+
+    blob = json.dumps([src_text, SPEC_TEMPLATE, markdown.__version__, SPEC_EXTENSIONS])
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def render_spec(src_text, stem):
+    """Pool worker: one Markdown source as a full HTML page."""
+    import markdown
+
+    body = markdown.Markdown(extensions=SPEC_EXTENSIONS).convert(src_text)
+    # Use the first H1 as the title, fallback to the filename.
+    first_h1 = body.split("<h1", 1)
+    if len(first_h1) > 1:
+        text = first_h1[1].split(">", 1)[1].split("</h1>", 1)[0]
+        title = text.strip()
+    else:
+        title = stem.replace("_", " ").title()
+    return SPEC_TEMPLATE.format(title=title, body=body)
+
+
+def render_specs(specs_dir=SPECS):
+    """Render the docs/specs/*.md whose source or template changed since the
+    last run, in a process pool once there are SPEC_PARALLEL_MIN of them.
+
+    A page is skipped when its source key and the hash of the existing HTML
+    match the manifest. A re-rendered page is only written when its bytes
+    differ, so unchanged outputs keep their mtime. Returns (rendered,
+    skipped) source names.
+    """
+    specs_dir = Path(specs_dir)
+    specs_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = specs_dir / SPEC_MANIFEST.name
+    old = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    manifest = {}
+
+    todo, skipped = [], []
+    for src in sorted(specs_dir.glob("*.md")):
+        src_text = src.read_text(encoding="utf-8")
+        key = spec_key(src_text)
+        out = specs_dir / (src.stem + ".html")
+        cached = old.get(src.name)
+        if (cached and cached["key"] == key and out.exists()
+                and file_sha256(out) == cached["sha256"]):
+            manifest[src.name] = cached
+            skipped.append(src.name)
         else:
-            title = src.stem.replace("_", " ").title()
-        out = SPECS / (src.stem + ".html")
-        out.write_text(SPEC_TEMPLATE.format(title=title, body=body), encoding="utf-8")
-        print(f"  rendered {src.name} -> {out.name}")
-        md.reset()
+            todo.append((src, src_text, key))
+
+    if len(todo) >= SPEC_PARALLEL_MIN:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+            pages = list(pool.map(render_spec, [t for _, t, _ in todo], [src.stem for src, _, _ in todo]))
+    else:
+        pages = [render_spec(src_text, src.stem) for src, src_text, _ in todo]
+
+    for (src, _, key), page in zip(todo, pages):
+        out = specs_dir / (src.stem + ".html")
+        payload = page.encode("utf-8")
+        if not out.exists() or out.read_bytes() != payload:
+            out.write_bytes(payload)
+        manifest[src.name] = {"key": key, "sha256": hashlib.sha256(payload).hexdigest()}
+    manifest_path.write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n")
+    return [src.name for src, _, _ in todo], skipped
 
 
 # ---------------------------------------------------------------- main
-def main():
-    if not DB.exists():
+def peak_rss_mib():
+    """Peak resident set size of this process in MiB, or None where the
+    resource module does not exist (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def stage_list(text):
+    stages = [v.strip() for v in text.split(",") if v.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown stage(s) {', '.join(sorted(unknown))}; choose from {', '.join(STAGES)}")
+    return stages
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--only", type=stage_list, default=list(STAGES),
+                    help=f"comma-separated stages to run out of {', '.join(STAGES)} (default: all)")
+    args = ap.parse_args(argv)
+
+    if "data" in args.only and not DB.exists():
         print(f"ERROR: {DB} not found. Run db/build.py first.", file=sys.stderr)
         sys.exit(1)
+    if "screenshots" in args.only and "data" not in args.only and not (DOCS / "data.json").exists():
+        print(f"ERROR: {DOCS / 'data.json'} not found. Run with --only data first.", file=sys.stderr)
+        sys.exit(1)
 
     DOCS.mkdir(parents=True, exist_ok=True)
-    SCREENSHOTS.mkdir(parents=True, exist_ok=True)
-
-    con = sqlite3.connect(f"file:{DB}?mode=ro", uri=True)
 
-    print("Building data.json ...")
-    data = fetch_aggregates(con)
-    payload = json.dumps(data, separators=(",", ":"), default=str)
-    (DOCS / "data.json").write_text(payload, encoding="utf-8")
-    print(f"  data.json: {len(payload):,} bytes  "
-          f"({len(data['monthly'])} months, {len(data['customers']):,} customers)")
-
-    print("Rendering screenshots ...")
-    latest_agg = data["monthly"][-1]
-    screenshot_tier_donut(latest_agg, SCREENSHOTS / "tier_mix.png")
-    print("  tier_mix.png")
-    screenshot_events_bar(latest_agg, SCREENSHOTS / "events_bar.png")
-    print("  events_bar.png")
-    screenshot_tier_trend(data["monthly"], SCREENSHOTS / "tier_trend.png")
-    print("  tier_trend.png")
-    screenshot_events_trend(data["monthly"], SCREENSHOTS / "events_trend.png")
-    print("  events_trend.png")
-    screenshot_brand_units(data["brand_units"], SCREENSHOTS / "brand_units.png")
-    print("  brand_units.png")
-
-    print("Rendering spec docs ...")
-    render_specs()
+    if "data" in args.only:
+        con = sqlite3.connect(f"file:{DB}?mode=ro", uri=True)
+        print("Building data.json + customer shards ...")
+        payload = write_data(con, DOCS)
+        con.close()
+        data = json.loads(payload)
+        shard_bytes = sum((DOCS / f).stat().st_size for f in data["customer_shards"].values())
+        print(f"  data.json: {len(payload):,} bytes ({len(data['monthly'])} months)")
+        print(f"  {SHARD_DIR}/customers-*.bin: {shard_bytes:,} bytes in {len(data['customer_shards'])} shards")
+        if len(payload) > FIRST_PAINT_BUDGET:
+            print(f"  WARNING: data.json exceeds the first-paint budget of {FIRST_PAINT_BUDGET:,} bytes")
+        peak = peak_rss_mib()
+        if peak is not None:
+            print(f"  peak RSS: {peak:,.0f} MiB")
+
+    if "screenshots" in args.only:
+        if "data" not in args.only:
+            data = json.loads((DOCS / "data.json").read_text(encoding="utf-8"))
+        print("Rendering screenshots ...")
+        rendered, skipped = render_screenshots(data, SCREENSHOTS)
+        for name in rendered:
+            print(f"  {name}")
+        if skipped:
+            print(f"  unchanged: {', '.join(skipped)}")
+
+    if "specs" in args.only:
+        print("Rendering spec docs ...")
+        rendered, skipped = render_specs(SPECS)
+        for name in rendered:
+            print(f"  rendered {name} -> {Path(name).stem}.html")
+        if skipped:
+            print(f"  unchanged: {', '.join(skipped)}")
 
     print("\nDone.")
     print(f"  Open docs/index.html locally, or push and visit GitHub Pages.")
@@ -28,8 +28,23 @@ tier, lifecycle event) is exercised by the resulting snapshot:
 
 Run:
   python scripts/generate_data/generate.py
+  python scripts/generate_data/generate.py --customers 50000 --history-years 5 --out-dir /tmp/crm-50k
+  python scripts/generate_data/generate.py --engine numpy --customers 5000000 --out-dir /tmp/crm-5m
+  python scripts/generate_data/generate.py --engine numpy --customers 5000000 --shards 8 --jobs 8 --out-dir /tmp/crm-5m
+  python scripts/generate_data/generate.py --engine numpy --customers 500000 --format sqlite --out-dir /tmp/crm-500k
+
+--engine numpy (generate_numpy.py) draws the same personas and shapes as
+arrays a chunk of customers at a time and streams the CSVs, for
+production-size load tests; the default engine keeps the seeded output
+the showcase data was built from. --shards splits the numpy engine's
+customers into id ranges, each drawn from its own (SEED, shard) seed, that
+--jobs processes generate in parallel; the output is byte-identical for a
+given --shards whatever --jobs is. --format sqlite / parquet write the
+numpy engine's rows straight into the raw_* tables of <out-dir>/crm.db
+(then `db/build.py --skip-load`) or into Parquet, without CSV text.
 """
 
+import argparse
 import csv
 import random
 from collections import defaultdict
@@ -484,9 +499,59 @@ def write_outputs(out_dir, products, customers, transactions):
 # Entry point
 # -------------------------------------------------------------------
 def main():
-    out_dir = Path(__file__).resolve().parents[2] / "data" / "input"
+    global N_CUSTOMERS, HISTORY_START
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--customers", type=int, default=N_CUSTOMERS,
+                    help=f"number of customers in the master (default: {N_CUSTOMERS})")
+    ap.add_argument("--history-years", type=int,
+                    default=REPORT_DATE.year - HISTORY_START.year + 1,
+                    help="calendar years of normal activity up to REPORT_DATE "
+                         f"(default: {REPORT_DATE.year - HISTORY_START.year + 1})")
+    ap.add_argument("--out-dir", default=str(Path(__file__).resolve().parents[2] / "data" / "input"),
+                    help="directory the CSVs are written to (default: data/input)")
+    ap.add_argument("--engine", choices=["python", "numpy"], default="python",
+                    help="python: the reference generator; numpy: vectorized, chunked and "
+                         "streamed, for large --customers (default: python)")
+    ap.add_argument("--chunk-customers", type=int, default=20_000,
+                    help="customers generated per chunk with --engine numpy (default: 20000)")
+    ap.add_argument("--shards", type=int, default=1,
+                    help="customer-id shards with --engine numpy; the output depends on it (default: 1)")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="processes generating the shards in parallel (default: 1)")
+    ap.add_argument("--format", choices=["csv", "sqlite", "parquet"], default="csv",
+                    help="with --engine numpy: csv files; sqlite: the raw_* tables of <out-dir>/crm.db, "
+                         "for db/build.py --skip-load; parquet: the raw tables in db/export_parquet.py's "
+                         "layout, needs pyarrow (default: csv)")
+    ap.add_argument("--partitioned", action="store_true",
+                    help="with --engine numpy, keep one sales_transactions_<year>.part-<shard>.csv "
+                         "per shard instead of merging them")
+    args = ap.parse_args()
+    if args.engine != "numpy" and (args.shards != 1 or args.jobs != 1 or args.partitioned
+                                   or args.format != "csv"):
+        ap.error("--shards, --jobs, --format and --partitioned need --engine numpy")
+    if args.partitioned and args.format != "csv":
+        ap.error("--partitioned splits the sales CSVs; it needs --format csv")
+    if args.shards < 1 or args.jobs < 1:
+        ap.error("--shards and --jobs must be at least 1")
+
+    # The generators read these module constants; the persona windows that
+    # are pinned to fixed dates are unaffected by --history-years.
+    N_CUSTOMERS = args.customers
+    HISTORY_START = date(REPORT_DATE.year - args.history_years + 1, 1, 1)
+    out_dir = Path(args.out_dir)
 
     products = generate_products()
+    if args.engine == "numpy":
+        # numpy is only needed for this engine.
+        import generate_numpy
+
+        persona_counts, year_counts = generate_numpy.generate(
+            out_dir, products, N_CUSTOMERS, HISTORY_START, args.chunk_customers,
+            args.shards, args.jobs, args.partitioned, args.format)
+        print_summary(out_dir, len(products), N_CUSTOMERS, persona_counts, year_counts)
+        return
+
     personas = assign_personas(N_CUSTOMERS)
     customers = generate_customers(personas)
     transactions = generate_transactions(customers, products)
@@ -495,15 +560,19 @@ def main():
     persona_counts = defaultdict(int)
     for c in customers:
         persona_counts[c["_persona"]] += 1
+    year_counts = {year: len(year_rows) for year, year_rows in by_year.items()}
+    print_summary(out_dir, len(products), len(customers), persona_counts, year_counts)
 
+
+def print_summary(out_dir, n_products, n_customers, persona_counts, year_counts):
     print("Generated:")
-    print(f"  products:     {len(products):>9,}")
-    print(f"  customers:    {len(customers):>9,}")
+    print(f"  products:     {n_products:>9,}")
+    print(f"  customers:    {n_customers:>9,}")
     for persona, count in sorted(persona_counts.items()):
         print(f"    {persona:<14}{count:>7,}")
-    print(f"  transactions: {len(transactions):>9,}")
-    for year, year_rows in sorted(by_year.items()):
-        print(f"    {year}:        {len(year_rows):>9,}")
+    print(f"  transactions: {sum(year_counts.values()):>9,}")
+    for year, count in sorted(year_counts.items()):
+        print(f"    {year}:        {count:>9,}")
     print(f"\nOutput dir: {out_dir}")
 
 
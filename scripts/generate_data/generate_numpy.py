@@ -0,0 +1,713 @@
+"""
+Vectorized high-volume engine for generate.py: the same personas and
+transaction shapes, drawn with NumPy a chunk of customers at a time and
+streamed to the output, so memory stays bounded by one chunk whatever
+--customers is.
+
+Per chunk:
+  * persona schedules are boolean customer x month matrices built with
+    masks over a month grid (Bernoulli keeps, forced months, "k random
+    eligible months" as the k lowest random keys per row) -- the rules of
+    schedule_consumable_months();
+  * orders, lines, products, quantities, revenue and returns are sampled
+    as arrays (products without replacement within an invoice, from the
+    persona's consumable band);
+  * names and e-mails are combined from pre-drawn Faker pools (NAME_POOL_SIZE
+    first names, last names and user names) instead of Faker calls per
+    customer, which cost ~0.2 ms each;
+  * customers and lines are handed to the output sink as they are
+    produced: yearly sales CSVs, the raw_* tables of a SQLite database
+    (--format sqlite, skipping db/build.py's CSV parsing) or Parquet
+    files (--format parquet).
+
+Customers are split into --shards contiguous id ranges. Each shard has its
+own generator seeded with (SEED, shard), its own persona mix and its own
+block of SHARD_INVOICE_SPAN invoice numbers, and writes its own part files
+(or database) that are merged in shard order at the end, so shards can run
+in any process (--jobs) and in any order.
+
+Returns are drawn per chunk (RETURN_RATE of the chunk's consumable lines)
+and get invoice numbers after the chunk's own invoices. The output is
+deterministic for a given SEED, --customers, --chunk-customers and
+--shards but is a different sample than the default engine's.
+
+Selected with `python scripts/generate_data/generate.py --engine numpy`.
+"""
+
+import csv
+import shutil
+import sqlite3
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+from faker import Faker
+
+from generate import (ANONYMOUS_GROUP, CITIES, GROUPS, PERSONA_KNOBS, PERSONA_MIX,
+                      REPORT_DATE, RETURN_RATE, SEED, add_months, first_of_month,
+                      split_consumables_by_band, write_csv)
+
+REPO = Path(__file__).resolve().parents[2]
+SCHEMA_SQL = REPO / "db" / "schema.sql"
+SQLITE_NAME = "crm.db"           # --format sqlite: db/build.py's default --db name
+
+CHUNK_CUSTOMERS = 20_000
+NAME_POOL_SIZE = 1_000
+WRITE_BATCH_LINES = 100_000      # lines turned into Python objects at a time
+FIRST_INVOICE = 100_000
+SHARD_INVOICE_SPAN = 10 ** 9     # invoice numbers reserved per shard
+EMAIL_DOMAINS = ["example.com", "example.net", "example.org"]
+
+PERSONAS = list(PERSONA_MIX)
+P = {name: code for code, name in enumerate(PERSONAS)}
+
+EPOCH = date(1970, 1, 1)
+SALES_COLUMNS = ["invoice_id", "customer_id", "invoice_date", "product_id",
+                 "quantity", "revenue", "store_id"]
+PRODUCT_COLUMNS = ["product_id", "product_name", "brand", "category", "unit_size"]
+CUSTOMER_COLUMNS = ["customer_id", "customer_name", "customer_group", "city", "created_date",
+                    "email", "mobile_number", "opt_email", "opt_sms", "opt_phone"]
+
+
+def days(d):
+    return (d - EPOCH).days
+
+
+def iso_dates(day_numbers):
+    return np.asarray(day_numbers, dtype="datetime64[D]").astype(str).tolist()
+
+
+# -------------------------------------------------------------------
+# Shared, chunk-independent tables
+# -------------------------------------------------------------------
+class Context:
+    """Month grid, product pools and per-persona knobs as arrays."""
+
+    def __init__(self, products, history_start):
+        self.history_start = history_start
+        report_bom = first_of_month(REPORT_DATE)
+        # The grid reaches back far enough for the months some personas are
+        # given regardless of their creation date (just_lost's 13th month).
+        grid_start = min(first_of_month(history_start), add_months(report_bom, -23))
+        months = []
+        cur = grid_start
+        while cur <= report_bom:
+            months.append(cur)
+            cur = add_months(cur, 1)
+        self.n_months = len(months)
+        self.report_ix = self.n_months - 1
+        self.history_ix = months.index(first_of_month(history_start))
+        self.month_start = np.array([days(m) for m in months])
+        self.month_len = np.array([days(add_months(m, 1)) - days(m) for m in months])
+        self.grid_start = np.datetime64(grid_start, "M")
+
+        self.unit_size = np.zeros(max(p["product_id"] for p in products) + 1)
+        for p in products:
+            self.unit_size[p["product_id"]] = p["unit_size"] or 0.0
+        self.devices = np.array([p["product_id"] for p in products if p["category"] == "device"])
+
+        by_band = split_consumables_by_band(products)
+        all_consumables = [p["product_id"] for p in products if p["category"] == "consumable"]
+        pools = []
+        for name in PERSONAS:
+            knobs = PERSONA_KNOBS.get(name)
+            pool = [p["product_id"] for b in (knobs["band"] or ()) for p in by_band[b]] if knobs else []
+            pools.append(pool or all_consumables)
+        width = max(len(p) for p in pools)
+        self.pool = np.array([p + [0] * (width - len(p)) for p in pools])
+        self.pool_len = np.array([len(p) for p in pools])
+
+        def knob(name, i):
+            return np.array([PERSONA_KNOBS[p][name][i] if p in PERSONA_KNOBS else 0 for p in PERSONAS])
+        self.orders_lo, self.orders_hi = knob("orders", 0), knob("orders", 1)
+        self.lines_lo, self.lines_hi = knob("lines", 0), knob("lines", 1)
+        self.qty_lo, self.qty_hi = knob("qty", 0), knob("qty", 1)
+
+
+def assign_personas(rng, n):
+    """Persona codes of customers 1..n: the exact PERSONA_MIX counts, shuffled."""
+    counts = {k: int(round(n * v)) for k, v in PERSONA_MIX.items()}
+    counts["light"] += n - sum(counts.values())
+    codes = np.repeat(np.arange(len(PERSONAS), dtype=np.uint8), [counts[k] for k in PERSONAS])
+    return rng.permutation(codes)
+
+
+def name_pool(size):
+    """(first names, last names, user names), `size` of each."""
+    fake = Faker()
+    fake.seed_instance(SEED)
+    return ([fake.first_name() for _ in range(size)], [fake.last_name() for _ in range(size)],
+            [fake.user_name() for _ in range(size)])
+
+
+# -------------------------------------------------------------------
+# One chunk of customers
+# -------------------------------------------------------------------
+def draw_between(rng, lo, hi):
+    """Uniform integers in [lo, hi] element-wise (inclusive, like randint)."""
+    return lo + np.floor(rng.random(len(lo)) * (hi - lo + 1)).astype(np.int64)
+
+
+def created_days(rng, ctx, persona):
+    n = len(persona)
+    hist, report = days(ctx.history_start), days(REPORT_DATE)
+    created = hist + rng.integers(0, report - hist, n)
+
+    heavy = persona == P["heavy"]
+    created[heavy] = hist + rng.integers(0, 365, heavy.sum())
+
+    old = np.isin(persona, [P["lost"], P["just_lost"], P["reactivated"]])
+    lo, hi = days(date(2020, 1, 1)), days(date(2023, 9, 30))
+    created[old] = lo + rng.integers(0, hi - lo, old.sum())
+
+    passive = persona == P["passive"]
+    lo, hi = days(date(2022, 1, 1)), days(date(2024, 5, 31))
+    created[passive] = lo + rng.integers(0, hi - lo, passive.sum())
+
+    new = persona == P["brand_new"]
+    november = rng.random(new.sum()) < 0.5
+    created[new] = (np.where(november, days(date(2024, 11, 1)), days(date(2024, 12, 1)))
+                    + np.floor(rng.random(new.sum()) * np.where(november, 30, 31)).astype(np.int64))
+    return created
+
+
+def pick_k(rng, eligible, k):
+    """Per row, k[row] random months out of the eligible ones (all of them
+    when there are fewer): the k lowest random keys."""
+    keys = np.where(eligible, rng.random(eligible.shape), 2.0)
+    rank = np.argsort(np.argsort(keys, axis=1), axis=1)
+    return eligible & (rank < k[:, None])
+
+
+def schedule(rng, ctx, persona, created):
+    """Boolean customer x month matrix of the months with consumable orders."""
+    n, m = len(persona), ctx.n_months
+    col = np.arange(m)[None, :]
+    created_ix = (np.asarray(created, dtype="datetime64[D]").astype("datetime64[M]")
+                  - ctx.grid_start).astype(np.int64)
+    valid = col >= np.maximum(created_ix, ctx.history_ix)[:, None]
+    r = ctx.report_ix
+    out = np.zeros((n, m), dtype=bool)
+
+    def rows(name):
+        return persona == P[name]
+
+    def randint(lo, hi, count):
+        return rng.integers(lo, hi + 1, count)
+
+    sel = rows("heavy")
+    out[sel] = valid[sel] & (col >= r - 23)
+
+    sel = rows("regular")
+    out[sel] = (valid[sel] & (rng.random((sel.sum(), m)) < 0.7)) | ((col > r - 4) & (col <= r))
+
+    sel = rows("light")
+    kept = valid[sel] & (rng.random((sel.sum(), m)) < 0.35)
+    none_recent = ~kept[:, r - 5:].any(axis=1)
+    kept[np.flatnonzero(none_recent), r - 5 + rng.integers(0, 6, none_recent.sum())] = True
+    out[sel] = kept
+
+    sel = rows("passive")
+    out[sel] = pick_k(rng, valid[sel] & (col < r - 6), randint(2, 6, sel.sum()))
+
+    sel = rows("lost")
+    out[sel] = pick_k(rng, valid[sel] & (col < r - 13), randint(1, 6, sel.sum()))
+
+    sel = rows("just_lost")
+    kept = pick_k(rng, valid[sel] & (col < r - 12), randint(1, 4, sel.sum()))
+    kept[:, r - 12] = True
+    out[sel] = kept
+
+    sel = rows("reactivated")
+    kept = pick_k(rng, valid[sel] & (col < r - 13), randint(1, 4, sel.sum()))
+    kept[:, r] = True
+    out[sel] = kept
+
+    out[rows("brand_new"), r] = True
+
+    sel = rows("general")
+    kept = valid[sel] & (rng.random((sel.sum(), m)) < 0.2)
+    from_end = np.cumsum(kept[:, ::-1], axis=1)[:, ::-1]
+    out[sel] = kept & (from_end <= randint(1, 4, sel.sum())[:, None])
+    return out
+
+
+def distinct_picks(rng, pool_len, position):
+    """Indexes into the persona pools for invoice lines, without replacement
+    within an invoice: line `position` draws from the pool minus the lines
+    before it (which are the `position` preceding array entries)."""
+    idx = np.floor(rng.random(len(pool_len)) * (pool_len - position)).astype(np.int64)
+    for j in range(1, int(position.max(initial=0)) + 1):
+        at = np.flatnonzero(position == j)
+        prev = np.sort(np.stack([idx[at - k] for k in range(1, j + 1)], axis=1), axis=1)
+        x = idx[at]
+        for k in range(j):
+            x += x >= prev[:, k]
+        idx[at] = x
+    return idx
+
+
+def generate_chunk(rng, ctx, first_id, persona, pool, invoice_seq):
+    """Customer columns and sales line columns of one chunk; returns
+    (customers, lines, next invoice_seq)."""
+    n = len(persona)
+    cid = np.arange(first_id, first_id + n)
+    created = created_days(rng, ctx, persona)
+    general = persona == P["general"]
+
+    def optional(p, values):
+        return [v if keep else None for v, keep in zip(values, (rng.random(n) < p).tolist())]
+
+    def pick(values):
+        return [values[i] for i in rng.integers(0, len(values), n).tolist()]
+
+    first, last, user = pool
+
+    customers = {
+        "customer_id":    cid.tolist(),
+        "customer_name":  [f"{a} {b}" for a, b in zip(pick(first), pick(last))],
+        "customer_group": np.where(general, ANONYMOUS_GROUP,
+                                   np.array(GROUPS)[rng.integers(0, len(GROUPS), n)]).tolist(),
+        "city":           np.array(CITIES)[rng.integers(0, len(CITIES), n)].tolist(),
+        "created_date":   iso_dates(created),
+        "email":          optional(0.85, [f"{u}@{d}" for u, d in zip(pick(user), pick(EMAIL_DOMAINS))]),
+        "mobile_number":  optional(0.7, rng.integers(10**12, 10**13, n).tolist()),
+        "opt_email":      optional(0.9, rng.integers(0, 2, n).tolist()),
+        "opt_sms":        optional(0.9, rng.integers(0, 2, n).tolist()),
+        "opt_phone":      optional(0.9, rng.integers(0, 2, n).tolist()),
+    }
+
+    # Invoices: the device purchase shortly after creation, then the
+    # consumable orders of every scheduled month, per customer in date order.
+    has_device = ~general & (persona != P["never_bought"]) & (rng.random(n) < 0.95)
+    dev_row = np.flatnonzero(has_device)
+    dev_day = np.minimum(created[dev_row] + rng.integers(0, 15, len(dev_row)), days(REPORT_DATE))
+
+    sched_row, sched_col = np.nonzero(schedule(rng, ctx, persona, created))
+    p = persona[sched_row]
+    n_orders = draw_between(rng, ctx.orders_lo[p], ctx.orders_hi[p])
+    ord_row = np.repeat(sched_row, n_orders)
+    ord_col = np.repeat(sched_col, n_orders)
+    ord_day = np.minimum(ctx.month_start[ord_col]
+                         + np.floor(rng.random(len(ord_col)) * ctx.month_len[ord_col]).astype(np.int64),
+                         days(REPORT_DATE))
+
+    inv_row = np.concatenate([dev_row, ord_row])
+    inv_day = np.concatenate([dev_day, ord_day])
+    inv_device = np.concatenate([np.ones(len(dev_row), bool), np.zeros(len(ord_row), bool)])
+    order = np.lexsort((np.arange(len(inv_row)), inv_row))
+    inv_row, inv_day, inv_device = inv_row[order], inv_day[order], inv_device[order]
+    inv_seq = invoice_seq + 1 + np.arange(len(inv_row))
+    invoice_seq += len(inv_row)
+
+    p = persona[inv_row]
+    n_lines = np.where(inv_device, 1, draw_between(rng, ctx.lines_lo[p], ctx.lines_hi[p]))
+    line_inv = np.repeat(np.arange(len(inv_row)), n_lines)
+    position = np.arange(len(line_inv)) - np.repeat(np.cumsum(n_lines) - n_lines, n_lines)
+    line_device = inv_device[line_inv]
+    lp = persona[inv_row[line_inv]]
+
+    product = ctx.pool[lp, distinct_picks(rng, ctx.pool_len[lp], position)]
+    product[line_device] = ctx.devices[rng.integers(0, len(ctx.devices), line_device.sum())]
+    quantity = draw_between(rng, ctx.qty_lo[lp], ctx.qty_hi[lp])
+    quantity[line_device] = 1
+    revenue = np.round(quantity * ctx.unit_size[product] * 0.6 * (0.9 + rng.random(len(product)) * 0.2), 2)
+    revenue[line_device] = np.round(180 + rng.random(line_device.sum()) * 340, 2)
+    store = rng.integers(1, 21, len(product))
+
+    lines = {
+        "seq":      inv_seq[line_inv],
+        "customer": cid[inv_row[line_inv]],
+        "day":      inv_day[line_inv],
+        "product":  product,
+        "quantity": quantity,
+        "revenue":  revenue,
+        "store":    store,
+    }
+
+    # Returns: RETURN_RATE of the chunk's consumable lines, each on its own
+    # invoice within 30 days.
+    consumable = np.flatnonzero(~line_device)
+    picked = np.sort(rng.choice(consumable, int(len(consumable) * RETURN_RATE), replace=False))
+    ret = {
+        "seq":      invoice_seq + 1 + np.arange(len(picked)),
+        "customer": lines["customer"][picked],
+        "day":      np.minimum(lines["day"][picked] + rng.integers(1, 31, len(picked)), days(REPORT_DATE)),
+        "product":  product[picked],
+        "quantity": -quantity[picked],
+        "revenue":  -revenue[picked],
+        "store":    store[picked],
+    }
+    invoice_seq += len(picked)
+    lines = {k: np.concatenate([v, ret[k]]) for k, v in lines.items()}
+    return customers, lines, invoice_seq
+
+
+# -------------------------------------------------------------------
+# Output sinks: one per shard, fed chunk by chunk
+# -------------------------------------------------------------------
+def line_years(lines):
+    return np.asarray(lines["day"], dtype="datetime64[D]").astype("datetime64[Y]").astype(int) + 1970
+
+
+def add_year_counts(counts, years):
+    values, n = np.unique(years, return_counts=True)
+    for year, k in zip(values.tolist(), n.tolist()):
+        counts[year] = counts.get(year, 0) + k
+
+
+def sales_columns(lines, ix):
+    """The lines at ix as columns in SALES_COLUMNS order."""
+    cols = [[f"INV{s:08d}" for s in lines["seq"][ix].tolist()],
+            lines["customer"][ix].tolist(),
+            iso_dates(lines["day"][ix])]
+    return cols + [lines[k][ix].tolist() for k in ("product", "quantity", "revenue", "store")]
+
+
+class SalesWriter:
+    """Appends line columns to sales_transactions_<year>.csv, one file per
+    invoice year, each opened (and its header written) on first use."""
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.files = {}
+        self.counts = {}
+
+    def write(self, lines):
+        years = line_years(lines)
+        for year in np.unique(years).tolist():
+            at = years == year
+            if year not in self.files:
+                fh = (self.out_dir / f"sales_transactions_{year}.csv").open("w", newline="", encoding="utf-8")
+                self.files[year] = (fh, csv.writer(fh))
+                self.files[year][1].writerow(SALES_COLUMNS)
+                self.counts[year] = 0
+            ix = np.flatnonzero(at)
+            for start in range(0, len(ix), WRITE_BATCH_LINES):
+                self.files[year][1].writerows(zip(*sales_columns(lines, ix[start:start + WRITE_BATCH_LINES])))
+            self.counts[year] += len(ix)
+
+    def close(self):
+        for fh, _ in self.files.values():
+            fh.close()
+
+
+class CsvSink:
+    """customers_master.csv and sales_transactions_<year>.csv of one shard,
+    in its part directory."""
+
+    def __init__(self, part_dir, shard_id):
+        part_dir.mkdir(parents=True, exist_ok=True)
+        self.cust_fh = (part_dir / "customers_master.csv").open("w", newline="", encoding="utf-8")
+        self.cust_csv = csv.writer(self.cust_fh)
+        self.cust_csv.writerow(CUSTOMER_COLUMNS)
+        self.sales = SalesWriter(part_dir)
+
+    def write(self, customers, lines):
+        self.cust_csv.writerows(zip(*(customers[k] for k in CUSTOMER_COLUMNS)))
+        self.sales.write(lines)
+
+    def close(self):
+        self.cust_fh.close()
+        self.sales.close()
+        return self.sales.counts
+
+
+def insert_sql(table, columns):
+    return f"INSERT INTO {table} ({','.join(columns)}) VALUES ({','.join('?' * len(columns))})"
+
+
+def open_raw_db(path):
+    """Connect to path with db/schema.sql applied and the ix_raw_sales_*
+    indexes dropped (db/build.py builds them after the load), tuned for a
+    bulk load the way db/build.py's loader is."""
+    con = sqlite3.connect(path, isolation_level=None)
+    con.execute("PRAGMA journal_mode = OFF")
+    con.execute("PRAGMA synchronous = OFF")
+    con.executescript(SCHEMA_SQL.read_text())
+    names = [r[0] for r in con.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' "
+        "AND tbl_name = 'raw_sales_transactions' AND name LIKE 'ix_raw_sales_%'")]
+    for name in names:
+        con.execute(f"DROP INDEX {name}")
+    return con
+
+
+class SqliteSink:
+    """Inserts one shard's rows into the raw_customers / raw_sales_transactions
+    tables of a database, WRITE_BATCH_LINES rows per executemany, all in one
+    transaction."""
+
+    def __init__(self, db_path, shard_id):
+        self.con = open_raw_db(db_path)
+        self.con.execute("BEGIN")
+        self.counts = {}
+
+    def write(self, customers, lines):
+        self.con.executemany(insert_sql("raw_customers", CUSTOMER_COLUMNS),
+                             zip(*(customers[k] for k in CUSTOMER_COLUMNS)))
+        years = line_years(lines)
+        sql = insert_sql("raw_sales_transactions", SALES_COLUMNS)
+        for start in range(0, len(years), WRITE_BATCH_LINES):
+            self.con.executemany(sql, zip(*sales_columns(lines, slice(start, start + WRITE_BATCH_LINES))))
+        add_year_counts(self.counts, years)
+
+    def close(self):
+        self.con.execute("COMMIT")
+        self.con.close()
+        return self.counts
+
+
+def merge_raw_dbs(db_path, parts):
+    """Append the raw rows of the shard databases to db_path, in shard order."""
+    con = open_raw_db(db_path)
+    sales = ",".join(SALES_COLUMNS)
+    for part in parts:
+        con.execute("ATTACH DATABASE ? AS part", (str(part),))
+        con.execute("BEGIN")
+        con.execute("INSERT INTO raw_customers SELECT * FROM part.raw_customers ORDER BY customer_id")
+        con.execute(f"INSERT INTO raw_sales_transactions ({sales}) "
+                    f"SELECT {sales} FROM part.raw_sales_transactions ORDER BY txn_id")
+        con.execute("COMMIT")
+        con.execute("DETACH DATABASE part")
+    con.close()
+
+
+def parquet_schemas():
+    """(customers, sales, products) Arrow schemas of db/export_parquet.py.
+    The sales files have no txn_id: that surrogate key is assigned by SQLite
+    on load."""
+    # pyarrow is only needed for --format parquet.
+    sys.path.insert(0, str(REPO / "db"))
+    import export_parquet as ep
+
+    sales = ep.SALES_SCHEMA.remove(ep.SALES_SCHEMA.get_field_index("txn_id"))
+    return ep.CUSTOMERS_SCHEMA, sales, ep.PRODUCTS_SCHEMA
+
+
+class ParquetSink:
+    """One shard's rows as part-<shard>.parquet files in db/export_parquet.py's
+    layout: raw_customers/ and raw_sales_transactions/invoice_mth=YYYY-MM/,
+    one row group per chunk (and month)."""
+
+    def __init__(self, out_dir, shard_id):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa, self.pq = pa, pq
+        self.out_dir = out_dir
+        self.part = f"part-{shard_id:03d}.parquet"
+        self.customers_schema, self.sales_schema, _ = parquet_schemas()
+        path = out_dir / "raw_customers" / self.part
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.customers = pq.ParquetWriter(path, self.customers_schema)
+        self.months = {}
+        self.counts = {}
+
+    def write(self, customers, lines):
+        pa = self.pa
+        cols = []
+        for field in self.customers_schema:
+            values = customers[field.name]
+            if field.type == pa.date32():
+                cols.append(pa.array(values, pa.string()).cast(field.type))
+            elif field.type == pa.string():
+                cols.append(pa.array([None if v is None else str(v) for v in values], field.type))
+            else:
+                cols.append(pa.array(values, field.type))
+        self.customers.write_batch(pa.RecordBatch.from_arrays(cols, schema=self.customers_schema))
+
+        day = np.asarray(lines["day"], dtype="datetime64[D]")
+        month = day.astype("datetime64[M]")
+        for ym in np.unique(month):
+            ix = np.flatnonzero(month == ym)
+            cols = [pa.array([f"INV{s:08d}" for s in lines["seq"][ix].tolist()], pa.string()),
+                    pa.array(lines["customer"][ix].astype(np.int64)),
+                    pa.array(day[ix]).cast(pa.date32()),
+                    pa.array(lines["product"][ix].astype(np.int64)),
+                    pa.array(lines["quantity"][ix].astype(np.float64)),
+                    pa.array(lines["revenue"][ix].astype(np.float64)),
+                    pa.array(lines["store"][ix].astype(np.int64))]
+            self.month_writer(str(ym)).write_batch(pa.RecordBatch.from_arrays(cols, schema=self.sales_schema))
+        add_year_counts(self.counts, line_years(lines))
+
+    def month_writer(self, ym):
+        if ym not in self.months:
+            path = self.out_dir / "raw_sales_transactions" / f"invoice_mth={ym}" / self.part
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.months[ym] = self.pq.ParquetWriter(path, self.sales_schema)
+        return self.months[ym]
+
+    def close(self):
+        self.customers.close()
+        for writer in self.months.values():
+            writer.close()
+        return self.counts
+
+
+SINKS = {"csv": CsvSink, "sqlite": SqliteSink, "parquet": ParquetSink}
+
+
+def write_products(fmt, out_dir, products):
+    """Write the product master once, next to where the shards write."""
+    if fmt == "csv":
+        write_csv(out_dir / "products_master.csv", products, PRODUCT_COLUMNS)
+    elif fmt == "sqlite":
+        con = open_raw_db(out_dir / SQLITE_NAME)
+        with con:
+            con.executemany(insert_sql("raw_products", PRODUCT_COLUMNS),
+                            [tuple(p[k] for k in PRODUCT_COLUMNS) for p in products])
+        con.close()
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        _, _, schema = parquet_schemas()
+        path = out_dir / "raw_products" / "part-0.parquet"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(pa.Table.from_pylist([{k: p[k] for k in PRODUCT_COLUMNS} for p in products],
+                                            schema=schema), path)
+
+
+def clear_outputs(fmt, out_dir):
+    """Remove what an earlier run of this format left in out_dir, which would
+    otherwise be loaded next to this run's output (a different year range,
+    merged vs partitioned CSVs, more parquet shards)."""
+    if fmt == "csv":
+        for old in out_dir.glob("sales_transactions_*.csv"):
+            old.unlink()
+    elif fmt == "sqlite":
+        (out_dir / SQLITE_NAME).unlink(missing_ok=True)
+    else:
+        for table in ("raw_products", "raw_customers", "raw_sales_transactions"):
+            shutil.rmtree(out_dir / table, ignore_errors=True)
+
+
+# -------------------------------------------------------------------
+# Shards
+# -------------------------------------------------------------------
+def shard_ranges(n_customers, shards):
+    """(first customer id, customer count) of each shard: contiguous id
+    ranges whose sizes differ by at most one."""
+    base, extra = divmod(n_customers, shards)
+    ranges, first = [], 1
+    for shard_id in range(shards):
+        count = base + (shard_id < extra)
+        ranges.append((first, count))
+        first += count
+    return ranges
+
+
+def generate_shard(shard_id, first_id, n_customers, fmt, target, products, history_start,
+                   chunk_customers, pool):
+    """Write one shard's customers and sales lines to SINKS[fmt](target);
+    returns (persona counts, sales lines per year).
+
+    The shard draws from its own generator seeded with (SEED, shard_id) and
+    numbers its invoices from its own SHARD_INVOICE_SPAN block, so its output
+    depends only on its id and range -- not on which process runs it or when.
+    """
+    ctx = Context(products, history_start)
+    rng = np.random.default_rng([SEED, shard_id])
+    persona = assign_personas(rng, n_customers)
+
+    sink = SINKS[fmt](target, shard_id)
+    invoice_seq = FIRST_INVOICE + shard_id * SHARD_INVOICE_SPAN
+    try:
+        for start in range(0, n_customers, chunk_customers):
+            chunk = persona[start:start + chunk_customers]
+            customers, lines, invoice_seq = generate_chunk(
+                rng, ctx, first_id + start, chunk, pool, invoice_seq)
+            sink.write(customers, lines)
+    finally:
+        year_counts = sink.close()
+    if invoice_seq > FIRST_INVOICE + (shard_id + 1) * SHARD_INVOICE_SPAN:
+        raise RuntimeError(f"shard {shard_id} ran past its invoice number block")
+
+    counts = np.bincount(persona, minlength=len(PERSONAS))
+    return dict(zip(PERSONAS, counts.tolist())), year_counts
+
+
+def concat_parts(parts, out_path):
+    """Concatenate CSV part files into out_path, keeping the first header only."""
+    with out_path.open("wb") as out:
+        for i, part in enumerate(parts):
+            with part.open("rb") as fh:
+                header = fh.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(fh, out, 1 << 20)
+
+
+def generate(out_dir, products, n_customers, history_start, chunk_customers=CHUNK_CUSTOMERS,
+             shards=1, jobs=1, partitioned=False, fmt="csv"):
+    """Write the generated data under out_dir; returns (persona counts,
+    sales lines per year).
+
+    fmt "csv" writes the master and sales CSVs; "sqlite" inserts straight
+    into the raw_* tables of out_dir/crm.db (db/schema.sql), for
+    `db/build.py --skip-load`; "parquet" writes the raw tables in
+    db/export_parquet.py's layout.
+
+    Customers are split into `shards` contiguous id ranges generated by up to
+    `jobs` processes. CSV shards write part files under out_dir/.shards/:
+    the customer parts are merged into customers_master.csv in shard order,
+    the sales parts into sales_transactions_<year>.csv as well or, with
+    `partitioned`, kept as sales_transactions_<year>.part-<shard>.csv (which
+    db/build.py's sales glob loads like any other sales file). SQLite shards
+    write their own databases, appended to crm.db in shard order; Parquet
+    shards write their own part files in place. The output depends on
+    `shards` but not on `jobs`.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    clear_outputs(fmt, out_dir)
+    write_products(fmt, out_dir, products)
+
+    work_dir = out_dir / ".shards"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    if fmt == "parquet":
+        targets = [out_dir] * shards
+    elif fmt == "sqlite" and shards == 1:
+        targets = [out_dir / SQLITE_NAME]
+    else:
+        suffix = ".db" if fmt == "sqlite" else ""
+        targets = [work_dir / f"shard-{shard_id:03d}{suffix}" for shard_id in range(shards)]
+    if fmt == "sqlite" and shards > 1:
+        work_dir.mkdir(parents=True)
+
+    pool = name_pool(NAME_POOL_SIZE)
+    tasks = [(shard_id, first_id, count, fmt, target, products, history_start, chunk_customers, pool)
+             for shard_id, ((first_id, count), target)
+             in enumerate(zip(shard_ranges(n_customers, shards), targets))]
+    if jobs > 1 and shards > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, shards)) as ex:
+            results = list(ex.map(generate_shard, *zip(*tasks)))
+    else:
+        results = [generate_shard(*task) for task in tasks]
+
+    persona_counts = dict.fromkeys(PERSONAS, 0)
+    year_counts = defaultdict(int)
+    for shard_personas, shard_years in results:
+        for persona, count in shard_personas.items():
+            persona_counts[persona] += count
+        for year, count in shard_years.items():
+            year_counts[year] += count
+
+    if fmt == "csv":
+        concat_parts([d / "customers_master.csv" for d in targets], out_dir / "customers_master.csv")
+        for year in sorted(year_counts):
+            name = f"sales_transactions_{year}.csv"
+            parts = [(shard_id, d / name) for shard_id, d in enumerate(targets) if (d / name).exists()]
+            if partitioned:
+                for shard_id, part in parts:
+                    part.replace(out_dir / f"sales_transactions_{year}.part-{shard_id:03d}.csv")
+            else:
+                concat_parts([part for _, part in parts], out_dir / name)
+    elif fmt == "sqlite" and shards > 1:
+        merge_raw_dbs(out_dir / SQLITE_NAME, targets)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    return persona_counts, dict(sorted(year_counts.items()))
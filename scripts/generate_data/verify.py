@@ -2,68 +2,143 @@
 Smoke-test the synthetic dataset against the calculation SQL.
 
 Loads the CSVs in data/input/ into an in-memory SQLite, runs
-db/schema.sql and db/run_crm_calculation.sql, and prints the resulting
+db/schema.sql, db/refresh_fact_customer_month.sql and
+db/run_crm_calculation.sql, and prints the resulting
 distribution of activity status, value tier and lifecycle event so a
 reviewer can confirm the data exercises every CRM branch.
 
+The loaded raw tables and the refreshed consumption cube are kept as a
+SQLite fixture next to the CSVs (.verify-fixture-<key>.db), keyed by a
+hash of the CSVs, db/schema.sql, db/refresh_fact_customer_month.sql and
+db/build.py's loader. A run on unchanged inputs restores it into memory
+with the sqlite backup API instead of parsing the CSVs; --no-cache
+reloads them (and rewrites the fixture).
+
+--sweep re-scores the value tier for every combination of the given
+thresholds (NAME=V1,V2,... for the t_high / t_mid_high / t_mid / a_high /
+f_high / f_mid columns of tt_params; the others keep their values in
+run_crm_calculation.sql) against the base aggregates of a single calc run,
+and prints the tier distribution of Active customers per combination.
+
 Run after generate.py:
     python scripts/generate_data/generate.py
     python scripts/generate_data/verify.py
+    python scripts/generate_data/verify.py --sweep t_high=800,1000,1200 --sweep f_high=4,6
 """
 
-import csv
-import glob
+import argparse
+import hashlib
+import itertools
+import os
 import sqlite3
+import sys
 import time
 from pathlib import Path
 
 REPO = Path(__file__).resolve().parents[2]
-INPUT_DIR = REPO / "data" / "input"
-
-
-def load_csv(con, table, csv_path, columns):
-    with open(csv_path, newline="") as fh:
-        rdr = csv.DictReader(fh)
-        rows = []
-        for r in rdr:
-            row = []
-            for col in columns:
-                v = r.get(col, "")
-                row.append(None if v == "" else v)
-            rows.append(tuple(row))
-    placeholders = ",".join("?" * len(columns))
-    con.executemany(
-        f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})",
-        rows,
-    )
-    return len(rows)
+sys.path.insert(0, str(REPO / "db"))
+
+# The same streaming loader db/build.py uses; reads data/input/.
+import build  # noqa: E402
+from build import (INPUT_DIR, MASTER_FILES, SALES_GLOB, THRESHOLDS,  # noqa: E402
+                   drop_sales_indexes, file_digests, load_inputs, set_loader_pragmas,
+                   sql_thresholds)
+from retier import tier_case  # noqa: E402
+
+FIXTURE_GLOB = ".verify-fixture-*.db"
+
+TIERS = ("Diamond", "Platinum", "Gold", "Silver", "Bronze", "Passive")
+
+# The Active tier distribution, scored with db/retier_crm_snapshot.sql's ladder
+# (thresholds as :name parameters) over the distinct (m12, m6, o6) of Active
+# customers.
+SWEEP_TIER_SQL = """
+SELECT {tier_case} AS tier, SUM(n)
+FROM tt_sweep_base
+GROUP BY 1
+"""
 
 
-def main():
-    schema_sql = (REPO / "db/schema.sql").read_text()
-    calc_sql   = (REPO / "db/run_crm_calculation.sql").read_text()
+def fixture_key(input_dir):
+    """Hash of everything the loaded fixture is built from."""
+    h = hashlib.sha256()
+    for path in (REPO / "db/schema.sql", REPO / "db/refresh_fact_customer_month.sql", Path(build.__file__)):
+        h.update(path.read_bytes())
+    names = [name for _, name, _ in MASTER_FILES] + sorted(p.name for p in input_dir.glob(SALES_GLOB))
+    for name in names:
+        h.update(name.encode())
+        h.update(file_digests(input_dir / name, 0)[1].encode())
+    return h.hexdigest()[:16]
+
 
+def open_loaded(input_dir, use_cache=True):
+    """An in-memory database holding the loaded raw tables and the refreshed
+    fact_customer_month cube; returns (connection, restored from the fixture)."""
+    fixture = input_dir / f".verify-fixture-{fixture_key(input_dir)}.db"
     con = sqlite3.connect(":memory:")
-    con.executescript(schema_sql)
+    if use_cache and fixture.exists():
+        disk = sqlite3.connect(fixture)
+        disk.backup(con)
+        disk.close()
+        return con, True
 
+    schema_sql = (REPO / "db/schema.sql").read_text()
+    set_loader_pragmas(con)
+    con.executescript(schema_sql)
+    drop_sales_indexes(con)
+    load_inputs(con, incremental=False, input_dir=input_dir)
+    con.executescript(schema_sql)  # recreates the ix_raw_sales_* indexes
+    con.executescript((REPO / "db/refresh_fact_customer_month.sql").read_text())
+
+    for old in input_dir.glob(FIXTURE_GLOB):
+        old.unlink()
+    tmp = fixture.with_name(fixture.name + ".tmp")
+    disk = sqlite3.connect(tmp)
+    con.backup(disk)
+    disk.close()
+    os.replace(tmp, fixture)
+    return con, False
+
+
+def threshold_grid(calc_sql, sweeps):
+    """Every combination of the --sweep values, the other thresholds fixed at
+    their tt_params literals; returns (defaults, combinations)."""
+    defaults = sql_thresholds(calc_sql)
+    grid = {name: [value] for name, value in defaults.items()}
+    for item in sweeps:
+        name, _, values = item.partition("=")
+        if name not in THRESHOLDS or not values:
+            raise SystemExit(f"ERROR: --sweep expects NAME=V1,V2,... with NAME one of {', '.join(THRESHOLDS)}")
+        grid[name] = [float(v) for v in values.split(",")]
+    return defaults, [dict(zip(grid, combo)) for combo in itertools.product(*grid.values())]
+
+
+def run_sweep(con, defaults, combos):
+    """Print the Active tier distribution for every threshold combination."""
     t0 = time.time()
-    n_products = load_csv(con, "raw_products", INPUT_DIR / "products_master.csv",
-                          ["product_id", "product_name", "brand", "category", "unit_size"])
-    n_customers = load_csv(con, "raw_customers", INPUT_DIR / "customers_master.csv",
-                           ["customer_id", "customer_name", "customer_group", "city", "created_date",
-                            "email", "mobile_number", "opt_email", "opt_sms", "opt_phone"])
-    n_sales = 0
-    for f in sorted(glob.glob(str(INPUT_DIR / "sales_transactions_*.csv"))):
-        n_sales += load_csv(con, "raw_sales_transactions", f,
-                            ["invoice_id", "customer_id", "invoice_date", "product_id",
-                             "quantity", "revenue", "store_id"])
-    print(f"Loaded {n_products:,} products, {n_customers:,} customers, "
-          f"{n_sales:,} transactions in {time.time() - t0:.2f}s")
-
-    t1 = time.time()
-    con.executescript(calc_sql)
-    print(f"Calculation SQL ran in {time.time() - t1:.2f}s\n")
-
+    con.executescript("""
+        DROP TABLE IF EXISTS tt_sweep_base;
+        CREATE TEMP TABLE tt_sweep_base AS
+        SELECT m12, m6, o6, COUNT(*) AS n
+        FROM crm_customer_snapshot
+        WHERE activity_status = 'Active'
+        GROUP BY m12, m6, o6;
+    """)
+    sweep_sql = SWEEP_TIER_SQL.format(tier_case=tier_case())
+    n_active = con.execute("SELECT TOTAL(n) FROM tt_sweep_base").fetchone()[0]
+    print(f"Tier distribution of {int(n_active):,} Active customers per threshold combination "
+          f"(* = run_crm_calculation.sql):")
+    print("  " + "".join(f"{name:>11}" for name in THRESHOLDS) + "  " + "".join(f"{t:>10}" for t in TIERS))
+    for params in combos:
+        counts = dict(con.execute(sweep_sql, params).fetchall())
+        mark = "*" if params == defaults else " "
+        cells = "".join(f"{params[name]:>11g}" for name in THRESHOLDS)
+        tiers = "".join(f"{counts.get(t, 0) / n_active * 100 if n_active else 0:>9.1f}%" for t in TIERS)
+        print(f"{mark} {cells}  {tiers}")
+    print(f"\n{len(combos):,} combination(s) scored in {time.time() - t0:.2f}s")
+
+
+def print_report(con):
     n_active = con.execute(
         "SELECT COUNT(*) FROM crm_customer_snapshot WHERE activity_status='Active'"
     ).fetchone()[0]
@@ -139,5 +214,37 @@ def main():
     print(f"Returns: {n_neg:,} negative-quantity rows ({rate:.2f}% of {n_pos:,} positive lines)")
 
 
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--input-dir", default=str(INPUT_DIR),
+                    help=f"directory holding the input CSVs (default: {INPUT_DIR})")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="reload the CSVs instead of restoring the cached fixture")
+    ap.add_argument("--sweep", action="append", default=[], metavar="NAME=V1,V2,...",
+                    help="re-score the value tier for these threshold values (repeatable)")
+    args = ap.parse_args()
+
+    calc_sql = (REPO / "db/run_crm_calculation.sql").read_text()
+    if args.sweep:
+        defaults, combos = threshold_grid(calc_sql, args.sweep)
+
+    t0 = time.time()
+    con, restored = open_loaded(Path(args.input_dir), use_cache=not args.no_cache)
+    n_products, n_customers, n_sales = (
+        con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ("raw_products", "raw_customers", "raw_sales_transactions"))
+    print(f"{'Restored' if restored else 'Loaded'} {n_products:,} products, {n_customers:,} customers, "
+          f"{n_sales:,} transactions in {time.time() - t0:.2f}s")
+
+    t1 = time.time()
+    con.executescript(calc_sql)
+    print(f"Calculation SQL ran in {time.time() - t1:.2f}s\n")
+
+    if args.sweep:
+        run_sweep(con, defaults, combos)
+    else:
+        print_report(con)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,443 @@
+"""
+Read-only HTTP/JSON service over the CRM database, for analysts who want
+the snapshot without opening crm.db by hand or parsing docs/data.json.
+
+Endpoints (GET only; months are report month ends, YYYY-MM-DD, and default
+to the latest built month):
+
+  /months                              report months in the snapshot
+  /summary[?month=]                    monthly tier / event / activity counts
+                                       and KPI averages (all months, or one)
+  /customers/<id>[?month=]             one customer's snapshot row
+  /segments?[month=][&activity=][&tier=][&event=][&group=][&page=][&page_size=]
+                                       the customer table of a month, filtered
+                                       like the dashboard's Segments tab
+                                       (comma-separated values OR within a
+                                       filter, AND across filters), paginated
+  /transitions?from=&to=               value tier of each customer in `to`
+                                       against its tier in `from`, counted
+
+Queries run on a pool of --connections read-only (mode=ro) sqlite
+connections, each used by one worker thread at a time, so the event loop
+never blocks on SQLite. Responses are kept in an LRU cache of --cache-size
+entries keyed by path and normalised query string; concurrent misses of
+the same key share one query. The cache is cleared, and the pool reopened
+on a worker thread, whenever the build generation changes: the inode, size
+or mtime of the database file, which db/build.py changes by recreating
+(full build) or writing to (--incremental) the file. Requests that see the
+same new generation wait on one reopen.
+
+bench/load_test.py drives the service and reports latency percentiles.
+
+Usage:
+    python scripts/serve_api.py
+    python scripts/serve_api.py --db custom/path/crm.db --port 8765 --connections 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from build_report import fetch_monthly, r1
+
+REPO = Path(__file__).resolve().parents[1]
+DEFAULT_DB = REPO / "data" / "input" / "crm.db"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_CONNECTIONS = 4
+DEFAULT_CACHE_SIZE = 1024
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+MAX_HEADER_BYTES = 16 * 1024
+
+# /segments filter parameters -> snapshot / customer column.
+SEGMENT_FILTERS = {
+    "activity": "s.activity_status",
+    "tier":     "s.value_tier",
+    "event":    "s.lifecycle_event",
+    "group":    "c.customer_group",
+}
+
+CUSTOMER_COLUMNS = """
+    s.customer_id, c.customer_name, c.customer_group, c.city,
+    s.activity_status, s.value_tier, s.lifecycle_event,
+    s.tenure_months, s.avg_monthly_consumption, s.avg_order_size, s.o6,
+    s.first_consumable_purchase_date, s.last_consumable_purchase_date
+"""
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def customer_dict(r):
+    """One CUSTOMER_COLUMNS row, keyed like the dashboard's customer rows."""
+    return {
+        "customer_id":    r[0],
+        "name":           r[1],
+        "group":          r[2],
+        "city":           r[3],
+        "activity":       r[4],
+        "tier":           r[5],
+        "event":          r[6],
+        "tenure_months":  r[7],
+        "amc":            r1(r[8]),
+        "aos":            r1(r[9]),
+        "o6":             r[10],
+        "first_purchase": r[11],
+        "last_purchase":  r[12],
+    }
+
+
+# ---------------------------------------------------------------- queries
+# Each takes a connection, the report months of the current generation and
+# the parsed query string, and returns the JSON-able response body.
+def one(params, name, default=None):
+    values = params.get(name)
+    return values[-1] if values else default
+
+
+def pick_month(months, value, name="month"):
+    if value is None:
+        return months[-1]
+    if value not in months:
+        raise HTTPError(404, f"{name} {value!r} is not a report month in the snapshot")
+    return value
+
+
+def int_param(params, name, default, lo, hi):
+    value = one(params, name)
+    if value is None:
+        return default
+    try:
+        n = int(value)
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer") from None
+    if not lo <= n <= hi:
+        raise HTTPError(400, f"{name} must be between {lo} and {hi}")
+    return n
+
+
+def q_months(con, months, params):
+    return {"months": months}
+
+
+def q_summary(con, months, params):
+    month = one(params, "month")
+    monthly = fetch_monthly(con)
+    if month is None:
+        return {"monthly": monthly}
+    pick_month(months, month)
+    return next(m for m in monthly if m["month"] == month)
+
+
+def q_customer(con, months, params, customer_id):
+    month = pick_month(months, one(params, "month"))
+    r = con.execute(f"""
+        SELECT {CUSTOMER_COLUMNS}
+        FROM crm_customer_snapshot s
+        JOIN raw_customers c USING(customer_id)
+        WHERE s.customer_id = ? AND s.report_mth_eom = ?
+    """, (customer_id, month)).fetchone()
+    if r is None:
+        raise HTTPError(404, f"customer {customer_id} is not in the {month} snapshot")
+    return {"month": month, "customer": customer_dict(r)}
+
+
+def q_segments(con, months, params):
+    month = pick_month(months, one(params, "month"))
+    page = int_param(params, "page", 0, 0, 10**9)
+    page_size = int_param(params, "page_size", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+
+    where, args, filters = ["s.report_mth_eom = ?"], [month], {}
+    for name, column in SEGMENT_FILTERS.items():
+        values = sorted({v for raw in params.get(name, []) for v in raw.split(",") if v})
+        if values:
+            where.append(f"{column} IN ({', '.join('?' * len(values))})")
+            args += values
+            filters[name] = values
+    where_sql = " AND ".join(where)
+
+    total = con.execute(f"""
+        SELECT COUNT(*)
+        FROM crm_customer_snapshot s
+        JOIN raw_customers c USING(customer_id)
+        WHERE {where_sql}
+    """, args).fetchone()[0]
+    rows = con.execute(f"""
+        SELECT {CUSTOMER_COLUMNS}
+        FROM crm_customer_snapshot s
+        JOIN raw_customers c USING(customer_id)
+        WHERE {where_sql}
+        ORDER BY s.avg_monthly_consumption DESC NULLS LAST, s.customer_id
+        LIMIT ? OFFSET ?
+    """, args + [page_size, page * page_size]).fetchall()
+    return {"month": month, "filters": filters, "total": total, "page": page,
+            "page_size": page_size, "customers": [customer_dict(r) for r in rows]}
+
+
+def q_transitions(con, months, params):
+    if one(params, "from") is None or one(params, "to") is None:
+        raise HTTPError(400, "from and to are required")
+    frm = pick_month(months, one(params, "from"), "from")
+    to = pick_month(months, one(params, "to"), "to")
+    # Customers first seen after `from` count with a NULL from_tier.
+    rows = con.execute("""
+        SELECT a.value_tier, b.value_tier, COUNT(*)
+        FROM crm_customer_snapshot b
+        LEFT JOIN crm_customer_snapshot a
+               ON a.customer_id = b.customer_id AND a.report_mth_eom = ?
+        WHERE b.report_mth_eom = ?
+        GROUP BY 1, 2
+        ORDER BY 3 DESC
+    """, (frm, to)).fetchall()
+    return {"from": frm, "to": to,
+            "transitions": [{"from_tier": a, "to_tier": b, "n_customers": n} for a, b, n in rows]}
+
+
+def route(path):
+    """(query function, extra positional args) for a request path."""
+    parts = [unquote(p) for p in path.strip("/").split("/")]
+    if parts == ["months"]:
+        return q_months, ()
+    if parts == ["summary"]:
+        return q_summary, ()
+    if parts == ["segments"]:
+        return q_segments, ()
+    if parts == ["transitions"]:
+        return q_transitions, ()
+    if len(parts) == 2 and parts[0] == "customers":
+        try:
+            return q_customer, (int(parts[1]),)
+        except ValueError:
+            raise HTTPError(400, "customer id must be an integer") from None
+    raise HTTPError(404, f"no such endpoint: {path}")
+
+
+# ---------------------------------------------------------------- service
+class QueryService:
+    """The connection pool, the response cache and the build generation
+    they both belong to."""
+
+    def __init__(self, db_path, connections, cache_size):
+        self.db_path = Path(db_path)
+        self.connections = connections
+        self.cache_size = cache_size
+        self.executor = ThreadPoolExecutor(max_workers=connections, thread_name_prefix="crm-ro")
+        self.cache = OrderedDict()
+        self.inflight = {}              # (generation, cache key) -> future of the body
+        self.opening = {}               # generation -> task reopening the pool on it
+        self.pool = None
+        self.pool_lock = threading.Lock()   # guards self.pool and self.months against the workers
+        self.generation = None
+        self.months = []
+        self.hits = self.misses = 0
+
+    def current_generation(self):
+        try:
+            st = os.stat(self.db_path)
+        except OSError:
+            # db/build.py unlinks the file before a full build writes the new one.
+            raise HTTPError(503, "database is being rebuilt") from None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def connect(self):
+        con = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        con.execute("PRAGMA query_only = ON")
+        return con
+
+    def open_pool(self):
+        """Worker-thread side of a reopen: a complete pool of connections on
+        the database as it is now, and its report months. The connections are
+        closed again if that fails."""
+        pool = queue.SimpleQueue()
+        try:
+            for _ in range(self.connections):
+                pool.put(self.connect())
+            con = pool.get()
+            pool.put(con)
+            months = [r[0] for r in con.execute(
+                "SELECT DISTINCT report_mth_eom FROM crm_monthly_summary ORDER BY 1")]
+        except BaseException:
+            while not pool.empty():
+                pool.get().close()
+            raise
+        return pool, months
+
+    async def open_generation(self, generation):
+        """Drop the cache and reopen the pool on `generation` of the database.
+        The pool is built on a worker thread and replaces the old one only once
+        complete; connections still running a query finish on the old file and
+        are closed when they are handed back."""
+        loop = asyncio.get_running_loop()
+        pool, months = await loop.run_in_executor(self.executor, self.open_pool)
+        try:
+            stale = self.current_generation() != generation
+        except HTTPError:
+            stale = True
+        if stale:
+            # Rebuilt again meanwhile: the next request opens the newer file.
+            while not pool.empty():
+                pool.get().close()
+            return
+        with self.pool_lock:
+            old, self.pool, self.months = self.pool, pool, months
+            while old is not None and not old.empty():
+                old.get().close()
+        self.cache.clear()
+        self.generation = generation
+
+    def run(self, fn, args, params):
+        """Worker-thread side of a query: borrow a connection, run, return it;
+        returns the encoded JSON body."""
+        # There are as many workers as pooled connections, so the current
+        # pool always has one free and get() does not wait under the lock.
+        with self.pool_lock:
+            pool, months = self.pool, self.months
+            con = pool.get()
+        try:
+            result = fn(con, months, params, *args)
+            return json.dumps(result, separators=(",", ":"), default=str).encode("utf-8")
+        finally:
+            with self.pool_lock:
+                if pool is self.pool:
+                    pool.put(con)
+                else:
+                    con.close()
+
+    async def handle(self, target):
+        """Status and JSON body bytes for one GET target."""
+        generation = self.current_generation()
+        if generation != self.generation:
+            # Every request that sees the new generation waits on one reopen.
+            task = self.opening.get(generation)
+            if task is None:
+                task = self.opening[generation] = asyncio.ensure_future(self.open_generation(generation))
+                task.add_done_callback(lambda _: self.opening.pop(generation, None))
+            await asyncio.shield(task)
+        url = urlsplit(target)
+        params = parse_qs(url.query, keep_blank_values=False)
+        key = (url.path.rstrip("/") or "/", tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        body = self.cache.get(key)
+        if body is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return 200, body
+        self.misses += 1
+
+        fn, args = route(url.path)
+        if not self.months:
+            raise HTTPError(503, "the snapshot is empty; run db/build.py first")
+        flight = (generation, key)
+        future = self.inflight.get(flight)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.inflight[flight] = loop.run_in_executor(self.executor, self.run, fn, args, params)
+            future.add_done_callback(lambda _: self.inflight.pop(flight, None))
+        # Shielded: a client hanging up must not cancel a query others wait on.
+        body = await asyncio.shield(future)
+        if self.generation == generation and self.cache_size and key not in self.cache:
+            self.cache[key] = body
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return 200, body
+
+    async def serve_client(self, reader, writer):
+        """HTTP/1.1 with keep-alive: one request at a time per connection."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ")
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "malformed request line"}, False)
+                    break
+                headers = {k.strip().lower(): v.strip()
+                           for k, _, v in (ln.partition(":") for ln in lines[1:] if ln)}
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              if version == "HTTP/1.1"
+                              else headers.get("connection", "").lower() == "keep-alive")
+
+                if method != "GET":
+                    await self.respond(writer, 405, {"error": "only GET is supported"}, keep_alive)
+                elif target == "/healthz":
+                    await self.respond(writer, 200, {"generation": list(self.generation or ()),
+                                                     "cache_entries": len(self.cache),
+                                                     "cache_hits": self.hits,
+                                                     "cache_misses": self.misses}, keep_alive)
+                else:
+                    try:
+                        status, body = await self.handle(target)
+                    except HTTPError as e:
+                        status, body = e.status, {"error": str(e)}
+                    except sqlite3.Error as e:
+                        status, body = 500, {"error": f"sqlite: {e}"}
+                    await self.respond(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer, status, body, keep_alive):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, separators=(",", ":")).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  500: "Internal Server Error", 503: "Service Unavailable"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(args):
+    service = QueryService(args.db, args.connections, args.cache_size)
+    server = await asyncio.start_server(service.serve_client, args.host, args.port,
+                                        limit=MAX_HEADER_BYTES)
+    print(f"Serving {args.db} on http://{args.host}:{args.port}/ "
+          f"({args.connections} read-only connections, cache {args.cache_size})")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=str(DEFAULT_DB), help=f"SQLite database (default: {DEFAULT_DB})")
+    ap.add_argument("--host", default=DEFAULT_HOST, help=f"bind address (default: {DEFAULT_HOST})")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port (default: {DEFAULT_PORT})")
+    ap.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS,
+                    help=f"read-only connections / query threads (default: {DEFAULT_CONNECTIONS})")
+    ap.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                    help=f"cached responses, 0 to disable (default: {DEFAULT_CACHE_SIZE})")
+    args = ap.parse_args(argv)
+    if args.connections < 1:
+        ap.error("--connections must be at least 1")
+    if not Path(args.db).exists():
+        print(f"ERROR: {args.db} not found. Run db/build.py first.", file=sys.stderr)
+        sys.exit(1)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()